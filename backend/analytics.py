@@ -0,0 +1,757 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import logging
+import re
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+    from .dimensions import increment_cubes
+    from .sketches import BloomFilter, HyperLogLog, SpaceSaving
+except ImportError:
+    from dimensions import increment_cubes
+    from sketches import BloomFilter, HyperLogLog, SpaceSaving
+
+logger = logging.getLogger(__name__)
+
+# Dashboard ranges: bucket unit and number of buckets, newest bucket last
+STATS_RANGES = {
+    "24h": ("hour", 24),
+    "7d": ("day", 7),
+    "30d": ("day", 30),
+    "90d": ("day", 90),
+}
+
+def resolve_timezone(name):
+    """ZoneInfo for an IANA name; None for unknown zones."""
+    if not name or name.upper() == "UTC":
+        return timezone.utc
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def visitor_key(secret, ip, user_agent, day):
+    """Pseudonymous visitor id for unique counting.
+
+    IP and user agent are hashed with a salt derived from the secret and
+    the day, so keys cannot be linked across days or reversed without the
+    secret. Only the 64-bit hash (hex) ever leaves this function.
+    """
+    salt = hashlib.blake2b(day.encode(), key=secret.encode()[:64], digest_size=16).digest()
+    message = f"{ip or ''}|{user_agent or ''}".encode()
+    return hashlib.blake2b(message, key=salt, digest_size=8).hexdigest()
+
+async def merge_visitor_sketch(db, page_id, day, sketch, attempts=10):
+    """Fold a batch's visitors into the stored (page_id, day) sketch.
+
+    The read-merge-write is a compare-and-set on "version": a writer that
+    lost a race (another flush or worker) re-reads and merges again
+    instead of overwriting the other's registers. Every round lets at
+    least one writer through, so `attempts` bounds the writers per sketch
+    (within one process the queue's flush lock already serializes them).
+    False if it gave up.
+    """
+    sketch_id = f"{page_id}:{day}"
+    for _ in range(attempts):
+        stored = await db.analytics_visitors.find_one({"id": sketch_id}, {"_id": 0, "registers": 1, "version": 1})
+        if stored is None:
+            result = await db.analytics_visitors.update_one(
+                {"id": sketch_id},
+                {"$setOnInsert": {"page_id": page_id, "day": day, "registers": sketch.to_string(), "version": 1}},
+                upsert=True,
+            )
+            if not result.matched_count:
+                return True
+            continue  # Created concurrently: merge into that one
+        if stored.get("registers"):
+            # Merging is a register-wise max, so repeating it on retry is harmless
+            sketch.merge(HyperLogLog.from_string(stored["registers"], sketch.precision))
+        version = stored.get("version")
+        expected = {"$exists": False} if version is None else version
+        result = await db.analytics_visitors.update_one(
+            {"id": sketch_id, "version": expected},
+            {"$set": {"registers": sketch.to_string(), "version": (version or 0) + 1}},
+        )
+        if result.matched_count:
+            return True
+    logger.error(f"Gave up merging visitor sketch {sketch_id} after {attempts} conflicting attempts")
+    return False
+
+async def count_unique_visitors(db, page_id, since_day):
+    """Approximate distinct visitors since since_day (UTC, inclusive).
+
+    Daily salts mean a visitor returning on another day counts again.
+    """
+    merged = None
+    async for doc in db.analytics_visitors.find({"page_id": page_id, "day": {"$gte": since_day}}, {"_id": 0, "registers": 1}):
+        sketch = HyperLogLog.from_string(doc["registers"])
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged.count() if merged is not None else 0
+
+RAW_EVENTS = "analytics_v2"
+
+def partition_name(day):
+    """Monthly raw-event partition for a "YYYY-MM-DD..." day or timestamp."""
+    return f"{RAW_EVENTS}_{day[:4]}_{day[5:7]}"
+
+def partition_bounds(name):
+    """First day of the partition's month and of the month after it."""
+    year, month = int(name[-7:-3]), int(name[-2:])
+    following = (year + month // 12, month % 12 + 1)
+    return f"{year:04d}-{month:02d}-01", f"{following[0]:04d}-{following[1]:02d}-01"
+
+async def raw_event_collections(db):
+    """The legacy unpartitioned collection plus every monthly partition, oldest first."""
+    names = await db.list_collection_names()
+    partitions = sorted(n for n in names if n.startswith(RAW_EVENTS + "_") and n[-7:-3].isdigit() and n[-2:].isdigit())
+    legacy = [RAW_EVENTS] if RAW_EVENTS in names else []
+    return [db[name] for name in legacy + partitions]
+
+def rollup_id(page_id, day, event_type, target_id=None):
+    # Deterministic key, so increments can upsert without a read
+    return f"{page_id}:{day}:{event_type}:{target_id or ''}"
+
+def rollup_update(event):
+    """(filter, update) that counts a raw analytics_v2 event into its rollup.
+
+    Rollups are keyed by (page_id, day, event_type, target_id) and also
+    keep per-hour counts so 24h charts and timezone shifts still work.
+    """
+    day, hour = event["timestamp"][:10], event["timestamp"][11:13]
+    return (
+        {"id": rollup_id(event["page_id"], day, event["event_type"], event.get("target_id"))},
+        {
+            "$setOnInsert": {
+                "page_id": event["page_id"],
+                "day": day,
+                "event_type": event["event_type"],
+                "target_id": event.get("target_id"),
+            },
+            "$inc": {"count": 1, f"hours.{hour}": 1},
+        },
+    )
+
+def rollup_increments(events):
+    """rollup_update for a batch, merging events that share a rollup."""
+    merged = {}
+    for event in events:
+        rollup_filter, update = rollup_update(event)
+        existing = merged.get(rollup_filter["id"])
+        if existing is None:
+            merged[rollup_filter["id"]] = (rollup_filter, update)
+            continue
+        inc = existing[1]["$inc"]
+        for field, value in update["$inc"].items():
+            inc[field] = inc.get(field, 0) + value
+    return list(merged.values())
+
+def _daily_pipeline(match, hourly=True):
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "page_id": "$page_id",
+                "hour": {"$substr": ["$timestamp", 0, 13 if hourly else 10]},
+                "event_type": "$event_type",
+                "target_id": "$target_id",
+            },
+            "count": {"$sum": 1},
+        }},
+    ]
+
+async def _collect_rollups(db, match, hourly=True):
+    # (page, day, type, target) -> rollup document built from raw events
+    rollups = {}
+    for collection in await raw_event_collections(db):
+        async for row in collection.aggregate(_daily_pipeline(match, hourly)):
+            key = row["_id"]
+            if not key.get("page_id") or not key.get("hour"):
+                continue
+            day = key["hour"][:10]
+            doc_id = rollup_id(key["page_id"], day, key["event_type"], key.get("target_id"))
+            rollup = rollups.get(doc_id)
+            if rollup is None:
+                rollup = rollups[doc_id] = {
+                    "id": doc_id,
+                    "page_id": key["page_id"],
+                    "day": day,
+                    "event_type": key["event_type"],
+                    "target_id": key.get("target_id"),
+                    "count": 0,
+                }
+                if hourly:
+                    rollup["hours"] = {}
+            rollup["count"] += row["count"]
+            if hourly:
+                hour = key["hour"][11:13]
+                rollup["hours"][hour] = rollup["hours"].get(hour, 0) + row["count"]
+    return rollups
+
+async def backfill_rollups(db, page_id=None):
+    """Rebuild analytics_rollups from the raw events of every partition.
+
+    Replaces the rollups of the days that still have raw events (for one
+    page or all), so it is safe to re-run and leaves downsampled days
+    alone. Events tracked while it runs may be lost from the rollups; run
+    it before enabling traffic or for a quiet page.
+    Returns the number of rollup documents written.
+    """
+    match = {"page_id": page_id} if page_id else {}
+    rollups = await _collect_rollups(db, match)
+    days = sorted({rollup["day"] for rollup in rollups.values()})
+    if days:
+        await db.analytics_rollups.delete_many({**match, "day": {"$in": days}})
+        await db.analytics_rollups.insert_many(list(rollups.values()))
+    return len(rollups)
+
+def retention_cutoff(raw_days, now=None):
+    """First UTC day whose raw events are kept."""
+    now = now or datetime.now(timezone.utc)
+    return (now.astimezone(timezone.utc) - timedelta(days=raw_days)).strftime("%Y-%m-%d")
+
+async def apply_retention(db, raw_days, now=None, columnar=None):
+    """Downsample raw events older than raw_days and remove them.
+
+    The expiring events are folded into daily rollups (the per-hour detail
+    is dropped), then partitions lying entirely before the cutoff are
+    dropped whole; only the partition straddling the cutoff (and the
+    legacy collection) needs a range delete. Returns a summary dict.
+    """
+    cutoff = retention_cutoff(raw_days, now)
+    expired = {"timestamp": {"$lt": cutoff}}
+
+    daily = await _collect_rollups(db, expired, hourly=False)
+    for rollup in daily.values():
+        await db.analytics_rollups.update_one(
+            {"id": rollup["id"]},
+            {"$set": {k: v for k, v in rollup.items() if k != "id"}, "$unset": {"hours": ""}},
+            upsert=True,
+        )
+    # Rollups of expired days kept from ingest lose their hourly detail too
+    await db.analytics_rollups.update_many({"day": {"$lt": cutoff}, "hours": {"$exists": True}}, {"$unset": {"hours": ""}})
+
+    dropped, deleted = [], 0
+    for collection in await raw_event_collections(db):
+        if collection.name != RAW_EVENTS and partition_bounds(collection.name)[1] <= cutoff:
+            await collection.drop()
+            dropped.append(collection.name)
+        else:
+            deleted += await _delete_count(await collection.delete_many(expired))
+
+    if columnar is not None:
+        columnar.drop_before(int(datetime.fromisoformat(cutoff).replace(tzinfo=timezone.utc).timestamp()))
+    return {"cutoff": cutoff, "downsampled": len(daily), "dropped_partitions": dropped, "deleted_events": deleted}
+
+async def _delete_count(result):
+    # Motor returns a DeleteResult, the mock drivers a plain count
+    return getattr(result, "deleted_count", result)
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = ["id", "timestamp", "event_type", "target_id", "metadata"]
+
+async def iter_event_chunks(db, page_id, start=None, end=None, chunk_size=1000):
+    """Yield a page's raw events in lists of at most chunk_size.
+
+    start/end are "YYYY-MM-DD..." strings (inclusive/exclusive). Partitions
+    outside the range are skipped; within one, events come in insertion
+    order, so only one chunk is held in memory at a time.
+    """
+    query = {"page_id": page_id}
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lt"] = end
+    for collection in await raw_event_collections(db):
+        if collection.name != RAW_EVENTS:
+            first, following = partition_bounds(collection.name)
+            if (end and first >= end) or (start and following <= start[:10]):
+                continue
+        cursor = collection.find(query, {"_id": 0, "page_id": 0})
+        while True:
+            chunk = await cursor.to_list(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def _format_chunk(chunk, fmt):
+    if fmt == "ndjson":
+        return "".join(json.dumps(event, ensure_ascii=False, default=str) + "\n" for event in chunk)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for event in chunk:
+        row = [event.get(field) for field in EXPORT_FIELDS]
+        # Nested metadata goes into one JSON cell
+        row[-1] = json.dumps(row[-1], ensure_ascii=False) if row[-1] is not None else ""
+        writer.writerow(["" if value is None else value for value in row])
+    return out.getvalue()
+
+async def export_events(db, page_id, fmt="ndjson", start=None, end=None, compress=False, chunk_size=1000):
+    """Async generator of bytes for a streaming NDJSON/CSV export.
+
+    With compress=True the output is one gzip stream, compressed chunk by
+    chunk so memory use stays constant.
+    """
+    gzip = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(text):
+        data = text.encode("utf-8")
+        return gzip.compress(data) if gzip else data
+
+    if fmt == "csv":
+        yield encode(",".join(EXPORT_FIELDS) + "\r\n")
+    async for chunk in iter_event_chunks(db, page_id, start, end, chunk_size):
+        data = encode(_format_chunk(chunk, fmt))
+        if data:
+            yield data
+    if gzip:
+        yield gzip.flush()
+
+class PageStatsAccumulator:
+    """Fills chart buckets, totals and per-target clicks in one pass.
+
+    Feed it (utc_hour, event_type, target_id, count) rows or rollup
+    documents in any order; totals cover all time, the chart covers the
+    selected range in the caller's timezone.
+    """
+
+    def __init__(self, range_key="7d", tz=timezone.utc, now=None):
+        self.unit, count = STATS_RANGES[range_key]
+        self.tz = tz
+        now = (now or datetime.now(timezone.utc)).astimezone(tz)
+        if self.unit == "hour":
+            newest = now.replace(minute=0, second=0, microsecond=0)
+            moments = [newest - timedelta(hours=i) for i in range(count - 1, -1, -1)]
+            labels = [moment.strftime("%Y-%m-%d %H:00") for moment in moments]
+        else:
+            newest = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            moments = [newest - timedelta(days=i) for i in range(count - 1, -1, -1)]
+            labels = [moment.strftime("%Y-%m-%d") for moment in moments]
+        # Start of the oldest bucket
+        self.start = moments[0]
+        step = timedelta(hours=1) if self.unit == "hour" else timedelta(days=1)
+        self._edges = [int(m.timestamp()) for m in moments] + [int((moments[-1] + step).timestamp())]
+        self.buckets = {label: {"views": 0, "clicks": 0} for label in labels}
+        self.total_views = 0
+        self.total_clicks = 0
+        self.click_counts = {}
+        # UTC hour prefix -> local bucket label; a page has few distinct hours
+        self._labels = {}
+
+    def _label(self, utc_hour):
+        label = self._labels.get(utc_hour)
+        if label is None:
+            try:
+                moment = datetime.strptime(utc_hour, "%Y-%m-%dT%H").replace(tzinfo=timezone.utc)
+            except ValueError:
+                label = ""
+            else:
+                local = moment.astimezone(self.tz)
+                label = local.strftime("%Y-%m-%d %H:00" if self.unit == "hour" else "%Y-%m-%d")
+            self._labels[utc_hour] = label
+        return label
+
+    def add(self, utc_hour, event_type, target_id=None, count=1):
+        if event_type == "view":
+            self.total_views += count
+            field = "views"
+        elif event_type == "click":
+            self.total_clicks += count
+            field = "clicks"
+            if target_id:
+                self.click_counts[target_id] = self.click_counts.get(target_id, 0) + count
+        else:
+            return
+        bucket = self.buckets.get(self._label(utc_hour))
+        if bucket is not None:
+            bucket[field] += count
+
+    def first_utc_day(self):
+        """UTC day containing the start of the charted range."""
+        return self.start.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+    def add_rollup(self, rollup):
+        hours = rollup.get("hours") or {}
+        for hour, count in hours.items():
+            self.add(f"{rollup['day']}T{hour}", rollup["event_type"], rollup.get("target_id"), count)
+        # Rollups written without hourly detail still count towards the day
+        rest = rollup.get("count", 0) - sum(hours.values())
+        if rest > 0:
+            self.add(f"{rollup['day']}T00", rollup["event_type"], rollup.get("target_id"), rest)
+
+    def bucket_edges(self):
+        """Epoch-second boundaries of the chart buckets (len(buckets) + 1)."""
+        return self._edges
+
+    def add_columnar(self, result):
+        """Merge ColumnarEventStore.page_stats() computed over bucket_edges()."""
+        self.total_views += result["total_views"]
+        self.total_clicks += result["total_clicks"]
+        for bucket, views, clicks in zip(self.buckets.values(), result["views"], result["clicks"]):
+            bucket["views"] += views
+            bucket["clicks"] += clicks
+        for target_id, count in result["click_counts"].items():
+            self.click_counts[target_id] = self.click_counts.get(target_id, 0) + count
+
+    def top_targets(self, limit=5):
+        return sorted(self.click_counts.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+    def chart_data(self):
+        return [{"name": label, **counts} for label, counts in self.buckets.items()]
+
+
+# Trending windows: length in seconds and number of slots it is split into
+TRENDING_WINDOWS = {
+    "1h": (3600, 12),
+    "24h": (86400, 24),
+    "7d": (7 * 86400, 28),
+}
+TRENDING_SERIES = ("pages_by_views", "pages_by_clicks", "blocks_by_clicks")
+
+class SlidingTopK:
+    """Space-Saving summaries over a sliding window of fixed slots.
+
+    Each slot covers window / slots seconds and is dropped once it falls
+    out of the window, so the window advances in slot-sized steps. add()
+    expires slots too, so memory stays bounded even if top() is never called.
+    top() merges at most `slots` summaries of `capacity` counters: its cost
+    does not depend on traffic.
+    """
+
+    def __init__(self, window, slots, capacity=200):
+        self.slot_seconds = window // slots
+        self.slots = slots
+        self.capacity = capacity
+        self._summaries = {}
+        self._latest = None
+
+    def _expire(self, current):
+        for slot in [s for s in self._summaries if s <= current - self.slots]:
+            del self._summaries[slot]
+
+    def add(self, key, count, epoch):
+        slot = int(epoch // self.slot_seconds)
+        if self._latest is None or slot > self._latest:
+            self._latest = slot
+            self._expire(slot)
+        elif slot <= self._latest - self.slots:
+            return  # Already outside the window
+        summary = self._summaries.get(slot)
+        if summary is None:
+            summary = self._summaries[slot] = SpaceSaving(self.capacity)
+        summary.add(key, count)
+
+    def top(self, k, now):
+        self._expire(int(now // self.slot_seconds))
+        merged = SpaceSaving(self.capacity)
+        for summary in self._summaries.values():
+            merged.merge(summary)
+        return merged.top(k)
+
+class TrendingTracker:
+    """Process-local top pages (by views and clicks) and blocks (by clicks)
+    for every TRENDING_WINDOWS entry, fed by the ingest queue."""
+
+    def __init__(self, capacity=200):
+        self.windows = {
+            name: {series: SlidingTopK(window, slots, capacity) for series in TRENDING_SERIES}
+            for name, (window, slots) in TRENDING_WINDOWS.items()
+        }
+
+    def add(self, page_id, event_type, target_id, epoch, count=1):
+        if event_type == "view":
+            updates = [("pages_by_views", page_id)]
+        elif event_type == "click":
+            updates = [("pages_by_clicks", page_id)]
+            if target_id:
+                updates.append(("blocks_by_clicks", target_id))
+        else:
+            return
+        for window in self.windows.values():
+            for series, key in updates:
+                window[series].add(key, count, epoch)
+
+    def add_events(self, events):
+        for event in events:
+            if event.get("page_id") and event.get("timestamp"):
+                epoch = datetime.fromisoformat(event["timestamp"]).timestamp()
+                self.add(event["page_id"], event.get("event_type"), event.get("target_id"), epoch)
+
+    async def warm(self, db, now=None):
+        """Seed the windows from the hourly rollups of the last 7 days."""
+        now = now or datetime.now(timezone.utc)
+        since = (now - timedelta(seconds=TRENDING_WINDOWS["7d"][0])).strftime("%Y-%m-%d")
+        async for rollup in db.analytics_rollups.find({"day": {"$gte": since}}, {"_id": 0}):
+            for hour, count in (rollup.get("hours") or {}).items():
+                epoch = datetime.fromisoformat(f"{rollup['day']}T{hour}:00:00+00:00").timestamp()
+                self.add(rollup["page_id"], rollup["event_type"], rollup.get("target_id"), epoch, count)
+
+    def top(self, window, limit=10, now=None):
+        now = (now or datetime.now(timezone.utc)).timestamp()
+        return {
+            series: [{"id": key, "count": count, "error": error} for key, count, error in summary.top(limit, now)]
+            for series, summary in self.windows[window].items()
+        }
+
+class LiveCounters:
+    """Pending view/click deltas for pages with live dashboard subscribers.
+
+    Written events only touch pages someone watches; drain() hands out
+    everything accumulated since the previous call, so a caller draining
+    once per second pushes at most one delta per page per second.
+    """
+
+    def __init__(self):
+        self._watchers = {}
+        self._pending = {}
+
+    def watch(self, page_id):
+        self._watchers[page_id] = self._watchers.get(page_id, 0) + 1
+
+    def unwatch(self, page_id):
+        left = self._watchers.get(page_id, 0) - 1
+        if left > 0:
+            self._watchers[page_id] = left
+        else:
+            self._watchers.pop(page_id, None)
+            self._pending.pop(page_id, None)
+
+    def add_events(self, events):
+        watchers = self._watchers
+        if not watchers:
+            return
+        for event in events:
+            page_id = event.get("page_id")
+            if page_id not in watchers:
+                continue
+            delta = self._pending.get(page_id)
+            if delta is None:
+                delta = self._pending[page_id] = {"views": 0, "clicks": 0, "targets": {}}
+            if event["event_type"] == "view":
+                delta["views"] += 1
+            elif event["event_type"] == "click":
+                delta["clicks"] += 1
+                target_id = event.get("target_id")
+                if target_id:
+                    delta["targets"][target_id] = delta["targets"].get(target_id, 0) + 1
+
+    def drain(self):
+        pending, self._pending = self._pending, {}
+        return pending
+
+# Crawlers, link previews, monitoring and HTTP libraries; compiled once
+BOT_USER_AGENT = re.compile(
+    r"bot|crawl|spider|slurp|scrapy|preview|monitor|headless|phantomjs|lighthouse|pingdom"
+    r"|facebookexternalhit|embedly|whatsapp/|vkshare"
+    r"|python-requests|python-urllib|aiohttp|httpx|curl|wget|go-http-client|java/|okhttp|axios|node-fetch",
+    re.IGNORECASE,
+)
+
+def is_bot_user_agent(user_agent):
+    # Every browser sends a User-Agent; its absence means a script
+    return not user_agent or BOT_USER_AGENT.search(user_agent) is not None
+
+class IngestFilter:
+    """Drops bot traffic and repeated views before events are queued.
+
+    A view is a duplicate when the same visitor viewed the same page within
+    dedup_window seconds. Seen (page, visitor) pairs go into Bloom filters,
+    one per half window; the current and the two previous ones are
+    checked, so memory stays fixed however much traffic arrives. A false
+    positive drops a real view with probability error_rate.
+    """
+
+    def __init__(self, dedup_window=1800, capacity=100000, error_rate=0.001):
+        self.slot_seconds = max(1, dedup_window // 2)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.counters = {"passed": 0, "bots": 0, "duplicates": 0}
+        self._filters = {}
+
+    def _live_filters(self, now):
+        current = int(now // self.slot_seconds)
+        for slot in [s for s in self._filters if s < current - 2]:
+            del self._filters[slot]
+        if current not in self._filters:
+            self._filters[current] = BloomFilter(self.capacity, self.error_rate)
+        return current
+
+    def _is_duplicate(self, doc, now):
+        if doc["event_type"] != "view" or not doc.get("visitor"):
+            return False
+        key = f"{doc['page_id']}:{doc['visitor']}"
+        current = self._live_filters(now)
+        if any(key in bloom for slot, bloom in self._filters.items() if slot != current):
+            return True
+        return self._filters[current].add(key)
+
+    def filter(self, docs, user_agent, now=None):
+        """The docs of one request that should be written."""
+        if is_bot_user_agent(user_agent):
+            self.counters["bots"] += len(docs)
+            return []
+        now = time.time() if now is None else now
+        kept = [doc for doc in docs if not self._is_duplicate(doc, now)]
+        self.counters["duplicates"] += len(docs) - len(kept)
+        self.counters["passed"] += len(kept)
+        return kept
+
+    def stats(self):
+        return dict(self.counters)
+
+class AnalyticsIngestQueue:
+    """Accepts tracked events immediately and writes them in batches.
+
+    A background task flushes with insert_many (plus merged rollup
+    increments) once max_batch events are pending or flush_interval
+    seconds have passed. When max_pending events are already waiting,
+    submit() refuses the event and counts it as dropped, so a spike cannot
+    grow memory without bound. stop() drains whatever is still queued.
+    """
+
+    def __init__(self, db, max_batch=500, flush_interval=1.0, max_pending=10000, columnar=None, trending=None, live=None):
+        self.db = db
+        # Optional ColumnarEventStore kept in step with written events
+        self.columnar = columnar
+        # Optional TrendingTracker fed with every written event
+        self.trending = trending
+        # Optional LiveCounters for dashboards subscribed over the WebSocket
+        self.live = live
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.counters = {"accepted": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._stopping = False
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def submit(self, events):
+        """Queue one event or a list of events; False if they were dropped."""
+        if isinstance(events, dict):
+            events = [events]
+        if len(self._pending) + len(events) > self.max_pending:
+            self.counters["dropped"] += len(events)
+            return False
+        self._pending.extend(events)
+        self.counters["accepted"] += len(events)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    def _bind(self, loop):
+        # A previous loop went away (tests, reloads): its task is dead and
+        # the primitives belong to it, so start over on this loop
+        if self._task is not None and self._task.get_loop() is not loop:
+            self._task = None
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+
+    def start(self):
+        """Start the flush task on the running loop; cheap when already running."""
+        loop = asyncio.get_running_loop()
+        self._bind(loop)
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        self._bind(asyncio.get_running_loop())
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                await self._write(batch)
+
+    async def _write(self, batch):
+        # Visitor keys feed the HyperLogLog sketches and dimension values the
+        # cubes; neither is stored with the raw event
+        visitors = {}
+        dims = {}
+        for doc in batch:
+            if doc.get("dims"):
+                dims[id(doc)] = doc.pop("dims")
+            visitor = doc.pop("visitor", None)
+            if visitor and doc["event_type"] == "view":
+                visitors[id(doc)] = visitor
+        partitions = {}
+        for doc in batch:
+            partitions.setdefault(partition_name(doc["timestamp"]), []).append(doc)
+        written = []
+        for name, docs in partitions.items():
+            try:
+                await self.db[name].insert_many(docs)
+            except Exception as e:
+                self.counters["failed"] += len(docs)
+                logger.error(f"Failed to write {len(docs)} analytics events to {name}: {e}")
+                continue
+            written.extend(docs)
+        if not written:
+            return
+        batch = written
+        self.counters["written"] += len(batch)
+        self.counters["batches"] += 1
+        if self.columnar is not None:
+            self.columnar.extend(batch)
+        if self.trending is not None:
+            self.trending.add_events(batch)
+        if self.live is not None:
+            self.live.add_events(batch)
+        for rollup_filter, update in rollup_increments(batch):
+            try:
+                await self.db.analytics_rollups.update_one(rollup_filter, update, upsert=True)
+            except Exception as e:
+                logger.error(f"Failed to update analytics rollup {rollup_filter['id']}: {e}")
+        try:
+            await increment_cubes(self.db, [
+                {"page_id": doc["page_id"], "timestamp": doc["timestamp"], "dims": dims[id(doc)]}
+                for doc in batch if id(doc) in dims
+            ])
+        except Exception as e:
+            logger.error(f"Failed to update analytics cubes: {e}")
+        # Only events that were actually stored count as visitors
+        sketches = {}
+        for doc in batch:
+            if id(doc) in visitors:
+                key = (doc["page_id"], doc["timestamp"][:10])
+                sketch = sketches.get(key)
+                if sketch is None:
+                    sketch = sketches[key] = HyperLogLog()
+                sketch.add_hash(int(visitors[id(doc)], 16))
+        for (page_id, day), sketch in sketches.items():
+            try:
+                await merge_visitor_sketch(self.db, page_id, day, sketch)
+            except Exception as e:
+                logger.error(f"Failed to update visitor sketch {page_id}:{day}: {e}")
+
+    def stats(self):
+        return {**self.counters, "pending": len(self._pending), "max_pending": self.max_pending}
@@ -0,0 +1,20 @@
+import argparse
+import asyncio
+
+# Uses the same database selection (MongoDB, JSON mock or SQLite) as the server
+from server import client, db
+from analytics import backfill_rollups
+
+async def main(page_id=None):
+    written = await backfill_rollups(db, page_id)
+    scope = f"page {page_id}" if page_id else "all pages"
+    print(f"Rebuilt {written} analytics rollups for {scope}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild analytics_rollups from the raw analytics_v2 events and partitions")
+    parser.add_argument("--page-id", help="Only rebuild rollups of this page")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.page_id))
+    finally:
+        client.close()
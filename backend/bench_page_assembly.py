@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+# Uses the same database selection as the server: the mock drivers by
+# default, Motor with USE_MOCK_DB=false and MONGO_URL set
+from server import client, db, load_full_page_data
+
+async def load_sequential(username):
+    # Page assembly as it was before the lookups were gathered
+    page = await db.pages.find_one({"username": username}, {"_id": 0})
+    if not page:
+        return None
+    blocks = await db.blocks.find({"page_id": page["id"]}, {"_id": 0}).sort("order", 1).to_list(100)
+    events = await db.events.find({"page_id": page["id"]}, {"_id": 0}).to_list(100)
+    showcases = await db.showcases.find({"page_id": page["id"]}, {"_id": 0}).to_list(100)
+    user = await db.users.find_one({"id": page["user_id"]})
+    analytics = {key: user[key] for key in ("ga_pixel_id", "fb_pixel_id") if user and user.get(key)}
+    return {"page": page, "blocks": blocks, "events": events, "showcases": showcases, "analytics": analytics}
+
+async def measure(loader, username, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await loader(username)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<11} mean {statistics.mean(timings):7.3f} ms   p50 {statistics.median(timings):7.3f} ms   p95 {p95:7.3f} ms")
+
+async def main(username, iterations, warmup):
+    if await load_sequential(username) is None:
+        print(f"Page {username} not found")
+        return
+    print(f"Driver: {type(client).__module__}.{type(client).__name__}, page {username}, {iterations} runs")
+    # Alternate the variants so caches and connection pools warm up evenly
+    for _ in range(warmup):
+        await load_sequential(username)
+        await load_full_page_data(username)
+    report("sequential", await measure(load_sequential, username, iterations))
+    report("concurrent", await measure(load_full_page_data, username, iterations))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare sequential and concurrent public page assembly")
+    parser.add_argument("username", help="Page to assemble")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.username, args.iterations, args.warmup))
+    finally:
+        client.close()
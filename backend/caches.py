@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+class PageIdCache:
+    """Process-local set of existing page ids.
+
+    Lets public ingestion endpoints reject unknown page ids without touching
+    the database. Page create/delete handlers keep it current via add() and
+    discard(); the full set is reloaded from the database once it is older
+    than reconcile_interval seconds, which also picks up pages created or
+    deleted by other processes.
+    """
+
+    def __init__(self, db, reconcile_interval=60.0):
+        self.db = db
+        self.reconcile_interval = reconcile_interval
+        self._ids = set()
+        self._loaded_at = None
+        self._lock = None
+        # One {page_id: present} journal per reconcile() in progress
+        self._scans = []
+
+    async def reconcile(self):
+        changes = {}
+        self._scans.append(changes)
+        try:
+            ids = set()
+            async for page in self.db.pages.find({}, {"_id": 0, "id": 1}):
+                if page.get("id"):
+                    ids.add(page["id"])
+        finally:
+            self._scans.remove(changes)
+        # add()/discard() calls made during the scan may be missing from it
+        for page_id, present in changes.items():
+            if present:
+                ids.add(page_id)
+            else:
+                ids.discard(page_id)
+        self._ids = ids
+        self._loaded_at = time.monotonic()
+
+    async def _refresh_if_stale(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.reconcile_interval:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another request may have reloaded while we waited
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reconcile_interval:
+                await self.reconcile()
+
+    async def contains(self, page_id):
+        await self._refresh_if_stale()
+        return page_id in self._ids
+
+    async def filter_known(self, page_ids):
+        await self._refresh_if_stale()
+        return {page_id for page_id in page_ids if page_id in self._ids}
+
+    def add(self, page_id):
+        self._ids.add(page_id)
+        for changes in self._scans:
+            changes[page_id] = True
+
+    def discard(self, *page_ids):
+        self._ids.difference_update(page_ids)
+        for changes in self._scans:
+            changes.update(dict.fromkeys(page_ids, False))
+
+    def __len__(self):
+        return len(self._ids)
+
+class PagePayloadCache:
+    """TTL + LRU cache of public page payloads keyed by username.
+
+    Mutation handlers call invalidate() for the usernames they touch; the
+    TTL only bounds staleness caused by other processes. A payload loaded
+    while an invalidation happened is not stored (see generation()), so a
+    slow read cannot put stale data back. Cached payloads are shared:
+    callers must not mutate them.
+
+    Generations come from one counter. At most max_entries of them are
+    remembered and they are forgotten with their LRU entry; a forgotten
+    username falls back to the highest generation forgotten so far, which
+    still rejects any load that started before its last invalidation.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, username):
+        return self._generations.get(username, self._floor)
+
+    def _forget_generation(self, username):
+        generation = self._generations.pop(username, None)
+        if generation is not None:
+            self._floor = max(self._floor, generation)
+
+    def get(self, username):
+        entry = self._entries.get(username)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, username, payload, generation=None):
+        if generation is not None and generation != self.generation(username):
+            return
+        self._entries[username] = (time.monotonic(), payload)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._forget_generation(evicted)
+
+    def invalidate(self, *usernames):
+        for username in usernames:
+            self._entries.pop(username, None)
+            self._clock += 1
+            self._generations[username] = self._clock
+            self._generations.move_to_end(username)
+        while len(self._generations) > self.max_entries:
+            self._forget_generation(next(iter(self._generations)))
+
+    def __len__(self):
+        return len(self._entries)
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one computation.
+
+    The first caller starts the coroutine as a task; callers arriving
+    while it runs await the same task and get its result (or exception).
+    The key is released as soon as the task finishes, so nothing is cached
+    here. A caller that is cancelled (client gone) does not cancel the
+    shared task for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._release(key, done))
+        return await asyncio.shield(task)
+
+    def _release(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,241 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Event types get fixed codes so the common ones never need the dictionary
+EVENT_TYPES = ["view", "click"]
+
+def _epoch(timestamp):
+    if isinstance(timestamp, datetime):
+        moment = timestamp
+    else:
+        moment = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+class _Dictionary:
+    """str <-> dense int code mapping for one column."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        return self.codes.get(value, -1)
+
+class ColumnarEventStore:
+    """Append-only columnar copy of analytics_v2.
+
+    One row costs 17 bytes: uint32 epoch seconds, int32 page and target
+    codes (dictionary-encoded, -1 for no target), a uint8 event type and
+    an int32 entry in the per-page row index. Buffers grow by GROWTH, so
+    at most a third of an allocation is slack. Filters are boolean masks over whole columns and group-bys are
+    np.bincount calls, so aggregations stay vectorized. page_stats() reads
+    the page's row positions from a per-page index kept up to date by
+    extend(), so its cost follows the page's rows, not the whole store.
+    """
+
+    GROWTH = 1.5
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._ts = np.empty(capacity, dtype=np.uint32)
+        self._page = np.empty(capacity, dtype=np.int32)
+        self._target = np.empty(capacity, dtype=np.int32)
+        self._type = np.empty(capacity, dtype=np.uint8)
+        self.pages = _Dictionary()
+        self.targets = _Dictionary()
+        self.event_types = _Dictionary()
+        for event_type in EVENT_TYPES:
+            self.event_types.encode(event_type)
+        # page code -> [row positions buffer, used length], in append order
+        self._page_rows = {}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """Bytes allocated by all column and index buffers, slack included."""
+        columns = self._ts.nbytes + self._page.nbytes + self._target.nbytes + self._type.nbytes
+        return columns + sum(buffer.nbytes for buffer, _ in self._page_rows.values())
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._ts)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity = max(capacity + 1, int(capacity * self.GROWTH))
+        for name in ("_ts", "_page", "_target", "_type"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, name, grown)
+
+    def extend(self, docs):
+        rows = [
+            (
+                _epoch(doc["timestamp"]),
+                self.pages.encode(doc["page_id"]),
+                self.targets.encode(doc["target_id"]) if doc.get("target_id") else -1,
+                self.event_types.encode(doc["event_type"]),
+            )
+            for doc in docs
+            if doc.get("page_id") and doc.get("timestamp") and doc.get("event_type")
+        ]
+        if not rows:
+            return 0
+        self._reserve(len(rows))
+        start, end = self._size, self._size + len(rows)
+        ts, page, target, event_type = zip(*rows)
+        self._ts[start:end] = ts
+        self._page[start:end] = page
+        self._target[start:end] = target
+        self._type[start:end] = event_type
+        self._size = end
+        self._index_rows(start, end)
+        return len(rows)
+
+    def _index_rows(self, start, end):
+        codes = self._page[start:end]
+        # Stable: each page's positions stay in append order
+        order = np.argsort(codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        for group in np.split(order, bounds):
+            code = int(codes[group[0]])
+            entry = self._page_rows.get(code)
+            if entry is None:
+                entry = self._page_rows[code] = [np.empty(max(16, len(group)), dtype=np.int32), 0]
+            buffer, used = entry
+            if used + len(group) > len(buffer):
+                grown = np.empty(max(int(len(buffer) * self.GROWTH), used + len(group)), dtype=np.int32)
+                grown[:used] = buffer[:used]
+                entry[0] = buffer = grown
+            buffer[used:used + len(group)] = group + start
+            entry[1] = used + len(group)
+
+    def page_rows(self, page_id):
+        """Row positions of a page, in append order."""
+        entry = self._page_rows.get(self.pages.lookup(page_id))
+        if entry is None:
+            return np.zeros(0, dtype=np.int32)
+        return entry[0][:entry[1]]
+
+    def append(self, doc):
+        return self.extend([doc])
+
+    def drop_before(self, epoch):
+        """Remove rows older than epoch seconds; returns the number removed."""
+        n = self._size
+        keep = np.flatnonzero(self._ts[:n] >= epoch)
+        removed = n - len(keep)
+        if removed:
+            for name in ("_ts", "_page", "_target", "_type"):
+                column = getattr(self, name)
+                column[:len(keep)] = column[keep]
+            self._size = len(keep)
+            # Positions moved: rebuild the page index (rare, retention only)
+            self._page_rows = {}
+            if self._size:
+                self._index_rows(0, self._size)
+        return removed
+
+    @classmethod
+    def from_documents(cls, docs):
+        docs = list(docs)
+        store = cls(capacity=max(1024, len(docs)))
+        store.extend(docs)
+        return store
+
+    # ----- Vectorized queries -----
+
+    def mask(self, page_id=None, event_type=None, start=None, end=None):
+        """Boolean mask of rows matching all given conditions.
+
+        start/end are epoch seconds (inclusive/exclusive).
+        """
+        n = self._size
+        result = np.ones(n, dtype=bool)
+        if page_id is not None:
+            result &= self._page[:n] == self.pages.lookup(page_id)
+        if event_type is not None:
+            result &= self._type[:n] == self.event_types.lookup(event_type)
+        if start is not None:
+            result &= self._ts[:n] >= start
+        if end is not None:
+            result &= self._ts[:n] < end
+        return result
+
+    def count(self, **conditions):
+        return int(np.count_nonzero(self.mask(**conditions)))
+
+    def count_by_target(self, mask):
+        """{target_id: count} for the rows in mask that have a target."""
+        targets = self._target[:self._size][mask]
+        targets = targets[targets >= 0]
+        if not len(targets):
+            return {}
+        counts = np.bincount(targets)
+        hits = np.nonzero(counts)[0]
+        return {self.targets.values[code]: int(counts[code]) for code in hits}
+
+    def _bucket_positions(self, ts, edges):
+        # Bucket index per row, -1 / len(edges) - 1 when outside the range
+        steps = np.diff(edges)
+        if len(steps) and (steps == steps[0]).all():
+            # Evenly spaced buckets (no DST switch in range): plain division
+            return (ts - edges[0]) // steps[0]
+        return np.searchsorted(edges, ts, side="right") - 1
+
+    def count_by_bucket(self, mask, edges):
+        """Counts per bucket; edges are ascending epoch seconds, bucket i
+        covering [edges[i], edges[i+1]). Rows outside all buckets are ignored.
+        """
+        edges = np.asarray(edges, dtype=np.int64)
+        buckets = len(edges) - 1
+        positions = self._bucket_positions(self._ts[:self._size][mask].astype(np.int64), edges)
+        positions = positions[(positions >= 0) & (positions < buckets)]
+        return np.bincount(positions, minlength=buckets)[:buckets]
+
+    def page_stats(self, page_id, edges, since=None):
+        """Totals, per-bucket views/clicks and clicks per target for a page.
+
+        since (epoch seconds) skips older rows, e.g. the ones already
+        covered by downsampled rollups.
+        """
+        edges = np.asarray(edges, dtype=np.int64)
+        buckets = len(edges) - 1
+        # Narrow every column to the page's rows once
+        rows = self.page_rows(page_id)
+        ts = self._ts[rows].astype(np.int64)
+        if since is not None:
+            recent = ts >= since
+            rows, ts = rows[recent], ts[recent]
+        types = self._type[rows]
+        is_view = types == self.event_types.lookup("view")
+        is_click = types == self.event_types.lookup("click")
+
+        # One bincount over (bucket, is_click) pairs fills both series
+        positions = self._bucket_positions(ts, edges)
+        keep = (positions >= 0) & (positions < buckets) & (is_view | is_click)
+        pairs = np.bincount(positions[keep] * 2 + is_click[keep], minlength=buckets * 2)
+
+        targets = self._target[rows][is_click]
+        targets = targets[targets >= 0]
+        per_target = np.bincount(targets) if len(targets) else np.zeros(0, dtype=np.int64)
+        return {
+            "total_views": int(np.count_nonzero(is_view)),
+            "total_clicks": int(np.count_nonzero(is_click)),
+            "views": pairs[0::2].tolist(),
+            "clicks": pairs[1::2].tolist(),
+            "click_counts": {self.targets.values[code]: int(per_target[code]) for code in np.flatnonzero(per_target)},
+        }
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+# server.py reads its configuration at import time: a throwaway JSON mock
+# database and a fast analytics flush
+os.environ["USE_MOCK_DB"] = "true"
+os.environ["MOCK_DB_DRIVER"] = "json"
+os.environ["DB_FILE_PATH"] = str(Path(tempfile.mkdtemp(prefix="inbio-tests-")) / "db.json")
+os.environ["TELEGRAM_BOT_TOKEN"] = ""
+os.environ["ANALYTICS_FLUSH_INTERVAL"] = "0.05"
+
+# Bot user agents (including TestClient's default) are filtered before ingest
+BROWSER_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"
+
+
+@pytest.fixture(scope="session")
+def server():
+    import server
+    # The support bot handlers are registered at import time; just never poll
+    server.support_bot = None
+    return server
+
+
+@pytest.fixture(scope="session")
+def client(server):
+    from fastapi.testclient import TestClient
+
+    # Entering the client runs the startup hook (ingest queue, live loop)
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def browser():
+    """Request headers of a regular browser."""
+    return {"User-Agent": BROWSER_USER_AGENT}
+
+
+@pytest.fixture
+def make_owner(server, client):
+    """Creates a user with one page and one block; returns ids and a token."""
+
+    def make_owner():
+        suffix = uuid.uuid4().hex[:8]
+        now = datetime.now(timezone.utc).isoformat()
+        user = {"id": f"user-{suffix}", "email": f"{suffix}@example.com", "role": "user", "created_at": now}
+        page = {"id": f"page-{suffix}", "user_id": user["id"], "username": f"page{suffix}", "name": "Test",
+                "bio": "", "theme": "auto", "created_at": now}
+        block = {"id": f"block-{suffix}", "page_id": page["id"], "block_type": "text",
+                 "content": {"text": "before"}, "order": 0, "created_at": now}
+        client.portal.call(server.db.users.insert_one, user)
+        client.portal.call(server.db.pages.insert_one, page)
+        client.portal.call(server.db.blocks.insert_one, block)
+        server.page_id_cache.add(page["id"])
+        token = server.create_access_token({"sub": user["id"]})
+        return {"user": user, "page": page, "block": block, "token": token,
+                "headers": {"Authorization": f"Bearer {token}"}}
+
+    return make_owner
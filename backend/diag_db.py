@@ -1,17 +1,18 @@
-import json
 import os
 
+from mock_db import json_database_exists, load_json_database
+
 def check_db():
-    filepath = "local_db.json"
-    if not os.path.exists(filepath):
+    # Same file as the server; sharded storage lives under <file>.d/
+    filepath = os.getenv("DB_FILE_PATH", "local_db.json")
+    if not json_database_exists(filepath):
         print(f"Error: {filepath} not found.")
         return
 
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_json_database(filepath)
         
-        users = data.get("my_local_db", {}).get("users", [])
+        users = data.get(os.getenv("DB_NAME", "my_local_db"), {}).get("users", [])
         print(f"Total users found: {len(users)}")
         for i, user in enumerate(users):
             print(f"User {i+1}:")
@@ -0,0 +1,185 @@
+import ipaddress
+import logging
+import re
+from functools import lru_cache
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import maxminddb
+except ImportError:  # Country lookups are optional
+    maxminddb = None
+
+logger = logging.getLogger(__name__)
+
+# Dimensions counted per page and day in analytics_dimensions
+DIMENSIONS = ("referrer", "utm_source", "utm_medium", "utm_campaign", "device", "country")
+UTM_FIELDS = ("utm_source", "utm_medium", "utm_campaign")
+MAX_VALUE_LENGTH = 64
+# Distinct values kept per cube document; later newcomers are counted as OTHER
+MAX_VALUES_PER_CUBE = 100
+OTHER = "other"
+
+_TABLET = re.compile(r"ipad|tablet|kindle|silk|playbook|android(?!.*mobile)", re.IGNORECASE)
+_MOBILE = re.compile(r"mobi|iphone|ipod|android|windows phone|opera mini", re.IGNORECASE)
+_HOST = re.compile(r"^[a-z0-9][a-z0-9.-]*$")
+_COUNTRY = re.compile(r"^[A-Z]{2}$")
+
+def device_class(user_agent):
+    if not user_agent:
+        return "unknown"
+    if _TABLET.search(user_agent):
+        return "tablet"
+    if _MOBILE.search(user_agent):
+        return "mobile"
+    return "desktop"
+
+def referrer_source(referrer):
+    """Host of the referring page without "www.", or "direct"."""
+    if not referrer or not isinstance(referrer, str):
+        return "direct"
+    try:
+        host = (urlsplit(referrer).hostname or "").lower()
+    except ValueError:
+        return OTHER
+    if host.startswith("www."):
+        host = host[4:]
+    if not host:
+        return "direct"
+    return host if _HOST.match(host) else OTHER
+
+def _utm_params(metadata):
+    # Either explicit utm_* keys or the landing page query string
+    params = {}
+    query = metadata.get("query")
+    if isinstance(query, str):
+        for key, values in parse_qs(query.lstrip("?")).items():
+            if key in UTM_FIELDS and values:
+                params[key] = values[0]
+    for key in UTM_FIELDS:
+        if isinstance(metadata.get(key), str):
+            params[key] = metadata[key]
+    # Client-supplied: fold case and whitespace variants together
+    return {key: " ".join(value.split()).lower() for key, value in params.items()}
+
+class GeoIPCountry:
+    """Country codes from a local MaxMind/DB-IP .mmdb file.
+
+    Disabled (always None) when the maxminddb package or the file is
+    missing; lookups never leave the process.
+    """
+
+    def __init__(self, path=None):
+        self._reader = None
+        if path and maxminddb is not None:
+            try:
+                self._reader = maxminddb.open_database(path)
+            except (OSError, ValueError) as e:
+                logger.error(f"GeoIP database {path} unavailable: {e}")
+        self.country = lru_cache(maxsize=65536)(self._lookup)
+
+    @property
+    def enabled(self):
+        return self._reader is not None
+
+    def _lookup(self, ip):
+        if self._reader is None or not ip:
+            return None
+        try:
+            record = self._reader.get(ipaddress.ip_address(ip))
+        except ValueError:
+            return None
+        country = (record or {}).get("country") or (record or {}).get("registered_country") or {}
+        return country.get("iso_code")
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+
+def event_dimensions(metadata, user_agent, country=None):
+    """Dimension values of one view event, all short strings."""
+    metadata = metadata if isinstance(metadata, dict) else {}
+    values = {
+        "referrer": referrer_source(metadata.get("referrer")),
+        "device": device_class(user_agent),
+        "country": country if country and _COUNTRY.match(country) else "unknown",
+    }
+    values.update(_utm_params(metadata))
+    return {key: str(value)[:MAX_VALUE_LENGTH] for key, value in values.items() if value}
+
+def _encode_key(value):
+    # Counts are sub-document keys: no dots or leading "$" allowed
+    return value.replace(".", "．").replace("$", "＄")
+
+def _decode_key(key):
+    return key.replace("．", ".").replace("＄", "$")
+
+def cube_id(page_id, day, dimension):
+    return f"{page_id}:{day}:{dimension}"
+
+def cube_increments(events):
+    """(filter, update) upserts adding a batch's "dims" to the daily cubes."""
+    merged = {}
+    for event in events:
+        dims = event.get("dims")
+        if not dims:
+            continue
+        day = event["timestamp"][:10]
+        for dimension, value in dims.items():
+            doc_id = cube_id(event["page_id"], day, dimension)
+            entry = merged.get(doc_id)
+            if entry is None:
+                entry = merged[doc_id] = (
+                    {"id": doc_id},
+                    {"$setOnInsert": {"page_id": event["page_id"], "day": day, "dimension": dimension}, "$inc": {}},
+                )
+            inc = entry[1]["$inc"]
+            field = f"counts.{_encode_key(value)}"
+            inc[field] = inc.get(field, 0) + 1
+    return list(merged.values())
+
+async def increment_cubes(db, events, max_values=MAX_VALUES_PER_CUBE):
+    """Apply cube_increments(events), keeping at most max_values distinct
+    values per cube document: new values beyond that go to OTHER.
+
+    The existing keys are read in one query per batch. Concurrent writers
+    can overshoot the cap by at most one batch each.
+    """
+    updates = cube_increments(events)
+    if not updates:
+        return
+    known = {}
+    ids = [cube_filter["id"] for cube_filter, _ in updates]
+    async for cube in db.analytics_dimensions.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "counts": 1}):
+        known[cube["id"]] = set(cube.get("counts") or {})
+    other = f"counts.{_encode_key(OTHER)}"
+    for cube_filter, update in updates:
+        keys = known.get(cube_filter["id"], set())
+        capped = {}
+        for field, count in update["$inc"].items():
+            key = field[len("counts."):]
+            if key not in keys and len(keys) >= max_values:
+                field = other
+            else:
+                keys.add(key)
+            capped[field] = capped.get(field, 0) + count
+        update["$inc"] = capped
+        try:
+            await db.analytics_dimensions.update_one(cube_filter, update, upsert=True)
+        except Exception as e:
+            logger.error(f"Failed to update analytics cube {cube_filter['id']}: {e}")
+
+async def dimension_breakdowns(db, page_id, since_day, limit=10):
+    """{dimension: [{"value", "count"}]} summed over the page's cubes since since_day."""
+    totals = {dimension: {} for dimension in DIMENSIONS}
+    async for cube in db.analytics_dimensions.find({"page_id": page_id, "day": {"$gte": since_day}}, {"_id": 0}):
+        counts = totals.setdefault(cube["dimension"], {})
+        for key, count in (cube.get("counts") or {}).items():
+            value = _decode_key(key)
+            counts[value] = counts.get(value, 0) + count
+    return {
+        dimension: [
+            {"value": value, "count": count}
+            for value, count in sorted(counts.items(), key=lambda x: x[1], reverse=True)[:limit]
+        ]
+        for dimension, counts in totals.items()
+    }
@@ -0,0 +1,67 @@
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = re.compile(r"(__SEO_[A-Z_]+__)")
+
+class SeoTemplate:
+    """index.html pre-split around its __SEO_*__ placeholders.
+
+    render() is a single join over the static parts and the values, with
+    no disk access: the file is only stat()ed once check_interval seconds
+    have passed since the last check, and re-read when its mtime changed.
+    The first existing path of `candidates` is used.
+    """
+
+    def __init__(self, candidates, check_interval=5.0):
+        self.candidates = list(candidates)
+        self.check_interval = check_interval
+        self.path = None
+        self._mtime = None
+        self._parts = None
+        self._checked_at = None
+
+    def _locate(self):
+        for path in self.candidates:
+            try:
+                return path, os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+        return None, None
+
+    def _load(self, path, mtime):
+        with open(path, encoding="utf-8") as f:
+            # Odd positions hold placeholder names, even ones static HTML
+            self._parts = PLACEHOLDER.split(f.read())
+        self.path, self._mtime = path, mtime
+        logger.info(f"SEO template loaded from {path}")
+
+    def refresh(self):
+        """Re-check the file now; False when no template is available."""
+        self._checked_at = time.monotonic()
+        path, mtime = self._locate()
+        if path is None:
+            self.path = self._mtime = self._parts = None
+            return False
+        if path != self.path or mtime != self._mtime:
+            try:
+                self._load(path, mtime)
+            except OSError as e:
+                # Keep serving the previous version, if any
+                logger.error(f"Failed to read SEO template {path}: {e}")
+        return self._parts is not None
+
+    @property
+    def available(self):
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+        return self._parts is not None
+
+    def render(self, values):
+        parts = self._parts[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = values.get(parts[i], parts[i])
+        return "".join(parts)
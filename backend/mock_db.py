@@ -1,7 +1,479 @@
+import atexit
+import functools
+import gc
+import heapq
+import itertools
 import json
+import logging
 import os
+import re
 import asyncio
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Secondary indexes built for every mock database. "hash" indexes serve
+# equality and $in lookups, "sorted" indexes additionally keep documents
+# ordered by the field. Anything not listed here falls back to a full scan.
+DEFAULT_INDEXES = {
+    "users": {"hash": ["id", "email", "username"]},
+    "pages": {"hash": ["id", "username", "user_id"], "sorted": ["created_at"]},
+    "blocks": {"hash": ["id", "page_id"], "sorted": ["order"]},
+    "events": {"hash": ["id", "page_id"]},
+    "showcases": {"hash": ["id", "page_id"]},
+    "analytics_v2": {"hash": ["page_id"], "sorted": ["timestamp"]},
+    "analytics_rollups": {"hash": ["id", "page_id"], "sorted": ["day"]},
+    "analytics_visitors": {"hash": ["id", "page_id"], "sorted": ["day"]},
+    "analytics_dimensions": {"hash": ["id", "page_id"], "sorted": ["day"]},
+    "notifications": {"hash": ["id", "user_id"], "sorted": ["created_at"]},
+    "notification_campaigns": {"hash": ["id"], "sorted": ["created_at"]},
+    "verification_requests": {"hash": ["id", "user_id"], "sorted": ["created_at"]},
+    "reserved_usernames": {"hash": ["username"]},
+    "password_resets": {"hash": ["token", "user_id"]},
+    "support_qa": {"hash": ["id", "category"]},
+}
+
+# Collections split into per-period partitions ("analytics_v2_2026_03");
+# every partition gets the base collection's indexes
+PARTITIONED_COLLECTIONS = ("analytics_v2",)
+
+def index_spec_for(indexes, name):
+    if name in indexes:
+        return indexes[name]
+    for base in PARTITIONED_COLLECTIONS:
+        if name.startswith(base + "_") and base in indexes:
+            return indexes[base]
+    return {}
+
+def _hash_key(value):
+    # Lists and dicts are unhashable; key them by their canonical JSON so that
+    # equality on the key still mirrors Python equality used by matches_filter
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ("\0json", json.dumps(value, sort_keys=True, default=str))
+
+def _sort_key(value):
+    # Rank types first so mixed-type fields never compare str against int
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, json.dumps(value, sort_keys=True, default=str))
+
+_MISSING = object()
+
+def _lookup(doc, path):
+    # Dotted field access ("metadata.referrer"); _MISSING if any segment is absent
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _get_path(doc, path):
+    value = _lookup(doc, path)
+    return None if value is _MISSING else value
+
+@functools.lru_cache(maxsize=256)
+def _compile_regex(pattern, options=""):
+    flags = 0
+    for option, flag in (("i", re.IGNORECASE), ("m", re.MULTILINE), ("s", re.DOTALL), ("x", re.VERBOSE)):
+        if option in options:
+            flags |= flag
+    return re.compile(pattern, flags)
+
+_REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+
+def _regex_prefix(pattern, options=""):
+    """Literal prefix every match of an anchored regex starts with, or None.
+
+    "^abc" -> "abc", "^ab?c" -> "a". Case-insensitive and multiline
+    patterns cannot be answered from a sorted index.
+    """
+    if not isinstance(pattern, str) or not pattern.startswith("^") or "|" in pattern:
+        return None
+    if "i" in options or "m" in options:
+        return None
+    prefix = []
+    for char in pattern[1:]:
+        if char in _REGEX_SPECIAL:
+            # A quantifier makes the preceding literal optional
+            if char in "*?{" and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+    return "".join(prefix)
+
+def _compare(value, target, op):
+    # Mongo only compares within the same type bracket: a string bound
+    # never matches numbers, missing fields or nulls
+    if value is _MISSING:
+        return False
+    value_rank, target_rank = _sort_key(value)[0], _sort_key(target)[0]
+    if value_rank != target_rank or value_rank == 0:
+        return False
+    if value_rank == 3 and type(value) is not type(target):
+        return False
+    try:
+        if op == "$gt":
+            return value > target
+        if op == "$gte":
+            return value >= target
+        if op == "$lt":
+            return value < target
+        return value <= target
+    except TypeError:
+        return False
+
+def _is_operator_dict(v):
+    return isinstance(v, dict) and bool(v) and all(k.startswith("$") for k in v)
+
+def _matches_condition(value, condition):
+    for op, arg in condition.items():
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if not _compare(value, arg, op):
+                return False
+        elif op == "$in":
+            if (None if value is _MISSING else value) not in arg:
+                return False
+        elif op == "$nin":
+            if (None if value is _MISSING else value) in arg:
+                return False
+        elif op == "$ne":
+            if (None if value is _MISSING else value) == arg:
+                return False
+        elif op == "$eq":
+            if (None if value is _MISSING else value) != arg:
+                return False
+        elif op == "$exists":
+            if (value is not _MISSING) != bool(arg):
+                return False
+        elif op == "$regex":
+            if not isinstance(value, str):
+                return False
+            if hasattr(arg, "search"):
+                pattern = arg
+            else:
+                pattern = _compile_regex(arg, condition.get("$options", ""))
+            if not pattern.search(value):
+                return False
+        elif op == "$options":
+            continue
+        elif op == "$not":
+            if _matches_condition(value, arg):
+                return False
+        else:
+            raise ValueError(f"Unsupported query operator: {op}")
+    return True
+
+def matches_filter(doc, filter_query):
+    for k, v in filter_query.items():
+        if k == "_id": # ignore implementation detail _id
+             continue
+        if k == "$and":
+            if not all(matches_filter(doc, q) for q in v):
+                return False
+        elif k == "$or":
+            if not any(matches_filter(doc, q) for q in v):
+                return False
+        elif k == "$nor":
+            if any(matches_filter(doc, q) for q in v):
+                return False
+        elif _is_operator_dict(v):
+            if not _matches_condition(_lookup(doc, k), v):
+                return False
+        elif _get_path(doc, k) != v:
+            return False
+    return True
+
+def apply_projection(doc, projection):
+    if not projection:
+        # Hand out a copy like Motor does, so callers mutating the result
+        # cannot corrupt stored documents or their index entries
+        return doc.copy()
+
+    # Simple projection handling
+    is_inclusion = any(v == 1 for k, v in projection.items() if k != "_id")
+
+    if not is_inclusion:
+        # Exclusion mode
+        new_doc = doc.copy()
+        for k, v in projection.items():
+            if v == 0:
+                new_doc.pop(k, None)
+        return new_doc
+    else:
+        # Inclusion mode
+        new_doc = {}
+        for k, v in projection.items():
+            if v == 1:
+                if k in doc:
+                    new_doc[k] = doc[k]
+                elif k == "_id":
+                    # If project asks for _id 1 but it's not in doc, skip or use None
+                    pass
+        return new_doc
+
+def _parent(doc, path):
+    # Container and last key for a dotted path, creating nested dicts on the way
+    *parents, last = path.split(".")
+    for part in parents:
+        child = doc.get(part)
+        if not isinstance(child, dict):
+            child = doc[part] = {}
+        doc = child
+    return doc, last
+
+def apply_update(doc, update):
+    """Apply a $set/$unset/$inc/$push/$pull update document in place; True if doc changed."""
+    modified = False
+    # Apply $set
+    if "$set" in update:
+        for k, v in update["$set"].items():
+            parent, key = _parent(doc, k)
+            if key not in parent or parent[key] != v:
+                parent[key] = v
+                modified = True
+
+    # Apply $unset
+    if "$unset" in update:
+        for k in update["$unset"]:
+            path, _, key = k.rpartition(".")
+            parent = _lookup(doc, path) if path else doc
+            if isinstance(parent, dict) and key in parent:
+                del parent[key]
+                modified = True
+
+    # Apply $inc
+    if "$inc" in update:
+        for k, v in update["$inc"].items():
+            parent, key = _parent(doc, k)
+            parent[key] = parent.get(key, 0) + v
+            modified = modified or v != 0
+
+    # Apply $push
+    if "$push" in update:
+        for k, v in update["$push"].items():
+            if k not in doc:
+                doc[k] = []
+            if isinstance(doc[k], list):
+                doc[k].append(v)
+                modified = True
+
+    # Apply $pull
+    if "$pull" in update:
+        for k, v in update["$pull"].items():
+            if k in doc and isinstance(doc[k], list):
+                old_len = len(doc[k])
+                if isinstance(v, dict):
+                    # match items that contain all key-values from v
+                    doc[k] = [item for item in doc[k] if not all(item.get(sub_k) == sub_v for sub_k, sub_v in v.items())]
+                else:
+                    doc[k] = [item for item in doc[k] if item != v]
+                if len(doc[k]) != old_len:
+                    modified = True
+
+    return modified
+
+def upsert_document(filter_query, update):
+    """The document an upsert inserts when nothing matched filter_query."""
+    doc = {}
+    for k, v in filter_query.items():
+        # Equality conditions seed the new document, operators do not
+        if not k.startswith("$") and not _is_operator_dict(v):
+            parent, key = _parent(doc, k)
+            parent[key] = v
+    for k, v in update.get("$setOnInsert", {}).items():
+        parent, key = _parent(doc, k)
+        parent[key] = v
+    apply_update(doc, update)
+    return doc
+
+# ----- Aggregation -----
+
+_DATE_UNITS = ("year", "quarter", "month", "week", "day", "hour", "minute", "second")
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return None
+
+_UNIT_SECONDS = {"day": 86400, "hour": 3600, "minute": 60, "second": 1}
+
+def _date_trunc(value, unit, bin_size=1, tz=None):
+    dt = _to_datetime(value)
+    if dt is None:
+        return None
+    local = dt.astimezone(ZoneInfo(tz) if tz else timezone.utc)
+    midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "year":
+        local = midnight.replace(year=local.year - (local.year - 1) % bin_size, month=1, day=1)
+    elif unit in ("quarter", "month"):
+        months = bin_size * (3 if unit == "quarter" else 1)
+        local = midnight.replace(month=(local.month - 1) // months * months + 1, day=1)
+    elif unit == "week":
+        # Mongo's default startOfWeek is Sunday
+        local = midnight - timedelta(days=(local.weekday() + 1) % 7)
+    elif unit == "day" and bin_size == 1:
+        local = midnight
+    else:
+        # Bins are counted from the start of the day (or year for days)
+        origin = midnight.replace(month=1, day=1) if unit == "day" else midnight
+        step = _UNIT_SECONDS[unit] * bin_size
+        local = origin + timedelta(seconds=int((local - origin).total_seconds()) // step * step)
+    return local.astimezone(timezone.utc)
+
+def evaluate_expression(expr, doc):
+    """Evaluate the subset of Mongo aggregation expressions the app uses."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _get_path(doc, expr[1:])
+    if isinstance(expr, list):
+        return [evaluate_expression(e, doc) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1:
+        op, arg = next(iter(expr.items()))
+        if op in ("$substr", "$substrBytes", "$substrCP"):
+            value, start, length = (evaluate_expression(a, doc) for a in arg)
+            if value is None:
+                return ""
+            value = str(value)
+            return value[start:] if length < 0 else value[start:start + length]
+        if op == "$toDate":
+            return _to_datetime(evaluate_expression(arg, doc))
+        if op == "$dateFromString":
+            return _to_datetime(evaluate_expression(arg["dateString"], doc))
+        if op == "$dateTrunc":
+            unit = evaluate_expression(arg["unit"], doc)
+            if unit not in _DATE_UNITS:
+                raise ValueError(f"Unsupported $dateTrunc unit: {unit}")
+            return _date_trunc(
+                evaluate_expression(arg["date"], doc),
+                unit,
+                evaluate_expression(arg.get("binSize", 1), doc),
+                evaluate_expression(arg.get("timezone"), doc),
+            )
+        if op == "$dateToString":
+            dt = _to_datetime(evaluate_expression(arg["date"], doc))
+            if dt is None:
+                return None
+            tz = evaluate_expression(arg.get("timezone"), doc)
+            dt = dt.astimezone(ZoneInfo(tz)) if tz else dt.astimezone(timezone.utc)
+            return dt.strftime(arg.get("format", "%Y-%m-%dT%H:%M:%S.%LZ").replace("%L", f"{dt.microsecond // 1000:03d}"))
+        if op.startswith("$"):
+            raise ValueError(f"Unsupported aggregation expression: {op}")
+    # Plain object: evaluate each field (e.g. a compound $group _id)
+    return {k: evaluate_expression(v, doc) for k, v in expr.items()}
+
+def _group(docs, spec):
+    groups: Dict[Any, Dict[str, Any]] = {}
+    accumulators = [(name, *next(iter(acc.items()))) for name, acc in spec.items() if name != "_id"]
+    for doc in docs:
+        group_id = evaluate_expression(spec["_id"], doc)
+        key = _hash_key(group_id)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {"_id": group_id}
+            for name, op, _ in accumulators:
+                group[name] = 0 if op in ("$sum", "$count") else None
+        for name, op, arg in accumulators:
+            if op == "$count":
+                group[name] += 1
+            elif op == "$sum":
+                value = evaluate_expression(arg, doc)
+                # Like Mongo, non-numeric values are ignored by $sum
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    group[name] += value
+            elif op in ("$min", "$max"):
+                value = evaluate_expression(arg, doc)
+                if value is None:
+                    continue
+                current = group[name]
+                if current is None or (value < current if op == "$min" else value > current):
+                    group[name] = value
+            else:
+                raise ValueError(f"Unsupported $group accumulator: {op}")
+    return list(groups.values())
+
+def _project(doc, spec):
+    computed = {k: v for k, v in spec.items() if not isinstance(v, (int, bool))}
+    plain = {k: v for k, v in spec.items() if isinstance(v, (int, bool))}
+    result = apply_projection(doc, plain) if plain else doc.copy()
+    if not plain.get("_id", 1):
+        result.pop("_id", None)
+    is_inclusion = any(v for k, v in plain.items() if k != "_id")
+    if is_inclusion and plain.get("_id", 1) and "_id" in doc:
+        result["_id"] = doc["_id"]
+    for k, expr in computed.items():
+        result[k] = evaluate_expression(expr, doc)
+    return result
+
+def run_pipeline(docs, pipeline):
+    """Run aggregation stages over an iterable of documents.
+
+    Supports $match, $group ($sum/$count/$min/$max), $sort, $skip, $limit,
+    $project and $count. $group and $sort are the only stages that
+    materialize their input.
+    """
+    for stage in pipeline:
+        (op, arg), = stage.items()
+        if op == "$match":
+            # Bind arg now: the generator runs after the loop has moved on
+            docs = filter(lambda doc, query=arg: matches_filter(doc, query), docs)
+        elif op == "$group":
+            docs = _group(docs, arg)
+        elif op == "$sort":
+            docs = list(docs)
+            for key, direction in reversed(list(arg.items())):
+                docs.sort(key=lambda d, key=key: _sort_key(_get_path(d, key)), reverse=direction == -1)
+        elif op == "$skip":
+            docs = itertools.islice(docs, arg, None)
+        elif op == "$limit":
+            docs = itertools.islice(docs, arg)
+        elif op == "$project":
+            docs = map(lambda doc, spec=arg: _project(doc, spec), docs)
+        elif op == "$count":
+            docs = [{arg: sum(1 for _ in docs)}]
+        else:
+            raise ValueError(f"Unsupported aggregation stage: {op}")
+    return list(docs)
+
+class AsyncMockAggregateCursor:
+    """What aggregate() returns: the pipeline runs on the first to_list()."""
+
+    def __init__(self, run):
+        self._run = run
+        self._results = None
+
+    async def _ensure(self):
+        if self._results is None:
+            self._results = iter(await self._run())
+
+    async def to_list(self, length: Optional[int]):
+        await self._ensure()
+        return list(self._results if length is None else itertools.islice(self._results, length))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self._ensure()
+        for doc in self._results:
+            return doc
+        raise StopAsyncIteration
 
 class MockUpdateResult:
     def __init__(self, matched_count, modified_count):
@@ -9,225 +481,715 @@ class MockUpdateResult:
         self.modified_count = modified_count
         self.upserted_id = None
 
+class HashIndex:
+    def __init__(self, field):
+        self.field = field
+        self._buckets: Dict[Any, Dict[int, Dict[str, Any]]] = {}
+
+    def key(self, doc):
+        return _hash_key(_get_path(doc, self.field))
+
+    def add(self, doc, key):
+        self._buckets.setdefault(key, {})[id(doc)] = doc
+
+    def remove(self, doc, key):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.pop(id(doc), None)
+            if not bucket:
+                del self._buckets[key]
+
+    def estimate(self, values):
+        return sum(len(self._buckets.get(_hash_key(v), ())) for v in values)
+
+    def lookup(self, values):
+        found = {}
+        for v in values:
+            found.update(self._buckets.get(_hash_key(v), {}))
+        return list(found.values())
+
+class SortedIndex:
+    def __init__(self, field):
+        self.field = field
+        # Parallel lists ordered by (sort key, insertion seq)
+        self._keys: List[tuple] = []
+        self._docs: List[Dict[str, Any]] = []
+
+    def key(self, doc):
+        return _sort_key(_get_path(doc, self.field))
+
+    def build(self, docs_with_seqs):
+        entries = sorted(((self.key(doc), seq), doc) for seq, doc in docs_with_seqs)
+        self._keys = [entry for entry, _ in entries]
+        self._docs = [doc for _, doc in entries]
+
+    def add(self, doc, key, seq):
+        entry = (key, seq)
+        pos = bisect_right(self._keys, entry)
+        self._keys.insert(pos, entry)
+        self._docs.insert(pos, doc)
+
+    def remove(self, doc, key, seq):
+        pos = bisect_left(self._keys, (key, seq))
+        if pos < len(self._keys) and self._docs[pos] is doc:
+            del self._keys[pos]
+            del self._docs[pos]
+
+    def _span(self, value):
+        key = _sort_key(value)
+        return bisect_left(self._keys, (key,)), bisect_right(self._keys, (key, float("inf")))
+
+    def estimate(self, values):
+        total = 0
+        for v in values:
+            lo, hi = self._span(v)
+            total += hi - lo
+        return total
+
+    def lookup(self, values):
+        found = {}
+        for v in values:
+            lo, hi = self._span(v)
+            for doc in self._docs[lo:hi]:
+                found[id(doc)] = doc
+        return list(found.values())
+
+    def iter_docs(self, reverse=False):
+        return reversed(self._docs) if reverse else iter(self._docs)
+
+    def _rank_span(self, rank):
+        return bisect_left(self._keys, ((rank,),)), bisect_left(self._keys, ((rank + 1,),))
+
+    def range(self, condition):
+        """(lo, hi) positions covering the range/prefix operators in condition.
+
+        Returns None when none of them can be served by the index. Bounds
+        stay inside the bound's type bracket, as in matches_filter.
+        """
+        keys = self._keys
+        lo, hi = 0, len(keys)
+        used = False
+        for op, arg in condition.items():
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                key = _sort_key(arg)
+                if key[0] in (0, 3):
+                    continue
+            elif op == "$regex":
+                prefix = _regex_prefix(arg, condition.get("$options", ""))
+                if prefix is None:
+                    continue
+                key = (2, prefix)
+            else:
+                continue
+            used = True
+            rank_lo, rank_hi = self._rank_span(key[0])
+            lo, hi = max(lo, rank_lo), min(hi, rank_hi)
+            if op == "$gt":
+                lo = max(lo, bisect_right(keys, (key, float("inf"))))
+            elif op == "$gte":
+                lo = max(lo, bisect_left(keys, (key,)))
+            elif op == "$lt":
+                hi = min(hi, bisect_left(keys, (key,)))
+            elif op == "$lte":
+                hi = min(hi, bisect_right(keys, (key, float("inf"))))
+            elif prefix:
+                # Every string starting with prefix sorts before prefix with
+                # its last character bumped
+                upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                lo = max(lo, bisect_left(keys, (key,)))
+                hi = min(hi, bisect_left(keys, ((2, upper),)))
+        if not used:
+            return None
+        return lo, max(lo, hi)
+
+    def lookup_range(self, span):
+        return self._docs[span[0]:span[1]]
+
 class AsyncMockCursor:
-    def __init__(self, data: List[Dict[str, Any]]):
-        self._data = data
+    """Lazy cursor: nothing is matched, sorted or projected until documents
+    are pulled with to_list() or ``async for``.
+
+    Like Motor, to_list(n) consumes the cursor, so repeated calls page
+    through the results. With a known limit (``.limit()`` or the first
+    to_list length) a sort only keeps the top-k in a bounded heap.
+    """
+
+    def __init__(self, collection, filter_query, projection=None):
+        self._collection = collection
+        self._filter = filter_query
+        self._projection = projection
+        self._sort: List[tuple] = []
+        self._skip = 0
+        self._limit = None
+        self._iter = None
 
     def sort(self, key_or_list, direction=None):
         if isinstance(key_or_list, str):
-            key = key_or_list
-            reverse = direction == -1
+            self._sort = [(key_or_list, direction == -1)]
         else:
-            # simple support for list of tuples [('order', 1)]
-            key = key_or_list[0][0]
-            reverse = key_or_list[0][1] == -1
-            
-        self._data.sort(key=lambda x: x.get(key, 0), reverse=reverse)
+            # list of tuples [('order', 1), ('created_at', -1)]
+            self._sort = [(key, d == -1) for key, d in key_or_list]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        # Motor treats 0 as "no limit"
+        self._limit = count or None
         return self
 
-    async def to_list(self, length: int):
-        if length is None:
-            return self._data
-        return self._data[:length]
+    def _matching(self, docs):
+        filter_query = self._filter
+        for doc in docs:
+            if matches_filter(doc, filter_query):
+                yield doc
+
+    def _ordered(self, hint):
+        collection = self._collection
+        candidates = collection._candidates(self._filter)
+        if not self._sort:
+            yield from self._matching(candidates)
+            return
+
+        if len(self._sort) > 1:
+            docs = list(self._matching(candidates))
+            # Stable sorts applied from the least to the most significant key
+            for key, reverse in reversed(self._sort):
+                docs.sort(key=lambda d, key=key: _sort_key(_get_path(d, key)), reverse=reverse)
+            yield from docs
+            return
+
+        key, reverse = self._sort[0]
+        index = collection._indexes.get(key)
+        if isinstance(index, SortedIndex) and candidates is collection._get_collection_data():
+            # No selective filter index: walk the sorted index and stop as
+            # soon as enough documents were emitted
+            yield from self._matching(index.iter_docs(reverse))
+            return
+
+        sort_key = lambda d: _sort_key(_get_path(d, key))
+        docs = self._matching(candidates)
+        if hint is None:
+            yield from sorted(docs, key=sort_key, reverse=reverse)
+            return
+        docs = list(docs)
+        pick = heapq.nlargest if reverse else heapq.nsmallest
+        top = pick(hint, docs, key=sort_key)
+        yield from top
+        if len(top) == hint:
+            # More was requested than the first batch hinted at; equivalent
+            # to continuing the full sort past the top-k
+            yield from sorted(docs, key=sort_key, reverse=reverse)[hint:]
+
+    def _start(self, length):
+        hint = None
+        if self._limit is not None:
+            hint = self._skip + self._limit
+        elif length is not None:
+            hint = self._skip + length
+        docs = self._ordered(hint)
+        self._iter = itertools.islice(docs, self._skip, None if self._limit is None else self._skip + self._limit)
+
+    async def to_list(self, length: Optional[int]):
+        if self._iter is None:
+            self._start(length)
+        projection = self._projection
+        docs = self._iter if length is None else itertools.islice(self._iter, length)
+        return [apply_projection(doc, projection) for doc in docs]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._iter is None:
+            self._start(None)
+        for doc in self._iter:
+            return apply_projection(doc, self._projection)
+        raise StopAsyncIteration
 
 class AsyncMockCollection:
     def __init__(self, db, name):
         self.db = db
         self.name = name
+        self._indexes: Dict[str, Any] = {}
+        self._index_spec = dict(index_spec_for(db.client.indexes, name))
+        # id(doc) -> insertion seq, used to return index hits in natural order
+        self._seqs: Dict[int, int] = {}
+        self._next_seq = 0
+        self._indexed_data = None
 
     def _get_collection_data(self) -> List[Dict[str, Any]]:
         return self.db.data.get(self.name, [])
 
-    def _save_collection_data(self, data: List[Dict[str, Any]]):
+    def _save_collection_data(self, data: List[Dict[str, Any]], op=None, args=None):
         self.db.data[self.name] = data
-        self.db._save()
-
-    def _matches(self, doc, filter_query):
-        for k, v in filter_query.items():
-            if k == "_id": # ignore implementation detail _id
-                 continue 
-            
-            val = doc.get(k)
-            if isinstance(v, dict) and "$in" in v:
-                if val not in v["$in"]:
-                    return False
-            elif val != v:
-                return False
-        return True
+        self.db._save(self.name, op, args)
 
-    def _apply_projection(self, doc, projection):
-        if not projection:
-            return doc
-        
-        # Simple projection handling
-        is_inclusion = any(v == 1 for k, v in projection.items() if k != "_id")
-        
-        if not is_inclusion:
-            # Exclusion mode
-            new_doc = doc.copy()
-            for k, v in projection.items():
-                if v == 0:
-                    new_doc.pop(k, None)
-            return new_doc
-        else:
-            # Inclusion mode
-            new_doc = {}
-            for k, v in projection.items():
-                if v == 1:
-                    if k in doc:
-                        new_doc[k] = doc[k]
-                    elif k == "_id":
-                        # If project asks for _id 1 but it's not in doc, skip or use None
-                        pass
-            return new_doc
+    # ----- Indexes -----
 
-    async def find_one(self, filter_query, projection=None):
+    async def create_index(self, keys, **kwargs):
+        """Motor-compatible entry point; builds a sorted index on the first key."""
+        field = keys if isinstance(keys, str) else keys[0][0]
+        indexed = self._index_spec.get("hash", []) + self._index_spec.get("sorted", [])
+        if field not in indexed:
+            # New list: the spec's lists are shared with the client defaults
+            self._index_spec["sorted"] = self._index_spec.get("sorted", []) + [field]
+            self._indexed_data = None
+        return field
+
+    def _ensure_indexes(self):
         data = self._get_collection_data()
-        for doc in data:
-            if self._matches(doc, filter_query):
-                return self._apply_projection(doc, projection)
+        if self._indexed_data is data:
+            return
+        # (Re)build from scratch whenever the backing list was swapped out,
+        # e.g. after load or journal replay. Bulk builds allocate one small tuple per document and index entry;
+        # pausing the cyclic GC avoids repeated sweeps over them
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._build_indexes(data)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self._indexed_data = data
+
+    def _build_indexes(self, data):
+        self._indexes = {}
+        for field in self._index_spec.get("hash", []):
+            index = self._indexes[field] = HashIndex(field)
+            for doc in data:
+                index.add(doc, index.key(doc))
+        self._seqs = {id(doc): seq for seq, doc in enumerate(data)}
+        self._next_seq = len(data)
+        for field in self._index_spec.get("sorted", []):
+            index = self._indexes[field] = SortedIndex(field)
+            index.build(enumerate(data))
+
+    def _index_add(self, doc):
+        seq = self._next_seq
+        self._next_seq += 1
+        self._seqs[id(doc)] = seq
+        for index in self._indexes.values():
+            if isinstance(index, SortedIndex):
+                index.add(doc, index.key(doc), seq)
+            else:
+                index.add(doc, index.key(doc))
+
+    def _index_remove(self, doc):
+        seq = self._seqs.pop(id(doc), None)
+        for index in self._indexes.values():
+            if isinstance(index, SortedIndex):
+                index.remove(doc, index.key(doc), seq)
+            else:
+                index.remove(doc, index.key(doc))
+
+    def _index_keys(self, doc):
+        return {field: index.key(doc) for field, index in self._indexes.items()}
+
+    def _index_move(self, doc, old_keys):
+        seq = self._seqs.get(id(doc))
+        for field, index in self._indexes.items():
+            new_key = index.key(doc)
+            if new_key == old_keys[field]:
+                continue
+            if isinstance(index, SortedIndex):
+                index.remove(doc, old_keys[field], seq)
+                index.add(doc, new_key, seq)
+            else:
+                index.remove(doc, old_keys[field])
+                index.add(doc, new_key)
+
+    def _candidates(self, filter_query):
+        """Documents that may match filter_query, in natural (insertion) order.
+
+        Picks the most selective usable index: hash or sorted indexes for
+        equality and $in, sorted indexes for ranges and anchored $regex.
+        Conditions nested in a top-level $and are considered too. Falls
+        back to the whole collection when no filtered field is indexed.
+        """
+        self._ensure_indexes()
+        conditions = [(k, v) for k, v in filter_query.items() if not k.startswith("$")]
+        for clause in filter_query.get("$and", ()):
+            conditions.extend((k, v) for k, v in clause.items() if not k.startswith("$"))
+        best = None
+        for k, v in conditions:
+            index = self._indexes.get(k)
+            if index is None:
+                continue
+            if _is_operator_dict(v):
+                if "$in" in v:
+                    plan = ("values", list(v["$in"]))
+                elif "$eq" in v:
+                    plan = ("values", [v["$eq"]])
+                elif isinstance(index, SortedIndex):
+                    span = index.range(v)
+                    if span is None:
+                        continue
+                    plan = ("range", span)
+                else:
+                    continue
+            else:
+                plan = ("values", [v])
+            if plan[0] == "range":
+                size = plan[1][1] - plan[1][0]
+            else:
+                size = index.estimate(plan[1])
+            if best is None or size < best[0]:
+                best = (size, index, plan)
+                if size == 0:
+                    break
+        if best is None:
+            return self._get_collection_data()
+        _, index, (kind, arg) = best
+        docs = index.lookup_range(arg) if kind == "range" else index.lookup(arg)
+        if len(docs) > 1:
+            docs.sort(key=lambda d: self._seqs[id(d)])
+        return docs
+
+    async def find_one(self, filter_query, projection=None):
+        for doc in self._candidates(filter_query):
+            if matches_filter(doc, filter_query):
+                return apply_projection(doc, projection)
         return None
 
-    def find(self, filter_query, projection=None):
-        data = self._get_collection_data()
-        filtered = []
-        for doc in data:
-            if self._matches(doc, filter_query):
-                filtered.append(self._apply_projection(doc, projection))
-        return AsyncMockCursor(filtered)
+    def find(self, filter_query=None, projection=None):
+        return AsyncMockCursor(self, filter_query or {}, projection)
+
+    def aggregate(self, pipeline):
+        pipeline = list(pipeline)
+
+        async def run():
+            docs = self._get_collection_data()
+            if pipeline and "$match" in pipeline[0]:
+                # A leading $match can narrow the input through the indexes
+                docs = self._candidates(pipeline[0]["$match"])
+            # Stages like $sort/$limit pass stored documents through, so
+            # hand out copies
+            return [dict(doc) for doc in run_pipeline(docs, pipeline)]
+
+        return AsyncMockAggregateCursor(run)
+
+    def _insert(self, documents):
+        self._ensure_indexes()
+        data = self._indexed_data
+        self.db.data[self.name] = data
+        for document in documents:
+            # Store a private copy so later changes to the caller's dict
+            # do not bypass the indexes
+            doc = dict(document)
+            data.append(doc)
+            self._index_add(doc)
+        return data
 
     async def insert_one(self, document):
-        data = self._get_collection_data()
-        data.append(document)
-        self._save_collection_data(data)
+        with self.db.client._lock:
+            data = self._insert([document])
+            self._save_collection_data(data, "insert", [document])
         return True
 
     async def insert_many(self, documents):
-        data = self._get_collection_data()
-        data.extend(documents)
-        self._save_collection_data(data)
+        documents = list(documents)
+        with self.db.client._lock:
+            data = self._insert(documents)
+            self._save_collection_data(data, "insert", documents)
         return True
 
     async def count_documents(self, filter_query):
-        data = self._get_collection_data()
+        if not filter_query:
+            return len(self._get_collection_data())
         count = 0
-        for doc in data:
-            if self._matches(doc, filter_query):
+        for doc in self._candidates(filter_query):
+            if matches_filter(doc, filter_query):
                 count += 1
         return count
 
-    async def update_one(self, filter_query, update):
-        data = self._get_collection_data()
-        for doc in data:
-            if self._matches(doc, filter_query):
-                modified = False
-                # Apply $set
-                if "$set" in update:
-                    for k, v in update["$set"].items():
-                        if doc.get(k) != v:
-                            doc[k] = v
-                            modified = True
-                
-                # Apply $push
-                if "$push" in update:
-                    for k, v in update["$push"].items():
-                        if k not in doc:
-                            doc[k] = []
-                        if isinstance(doc[k], list):
-                            doc[k].append(v)
-                            modified = True
-
-                # Apply $pull
-                if "$pull" in update:
-                    for k, v in update["$pull"].items():
-                        if k in doc and isinstance(doc[k], list):
-                            old_len = len(doc[k])
-                            if isinstance(v, dict):
-                                # match items that contain all key-values from v
-                                doc[k] = [item for item in doc[k] if not all(item.get(sub_k) == sub_v for sub_k, sub_v in v.items())]
-                            else:
-                                doc[k] = [item for item in doc[k] if item != v]
-                            if len(doc[k]) != old_len:
-                                modified = True
-
-                if modified:
-                    self._save_collection_data(data)
+    def _apply_update(self, doc, update):
+        old_keys = self._index_keys(doc)
+        modified = apply_update(doc, update)
+        if modified:
+            self._index_move(doc, old_keys)
+        return modified
+
+    def _update_one(self, filter_query, update, upsert=False):
+        for doc in self._candidates(filter_query):
+            if matches_filter(doc, filter_query):
+                if self._apply_update(doc, update):
                     return MockUpdateResult(1, 1)
                 else:
                     return MockUpdateResult(1, 0)
-        return MockUpdateResult(0, 0)
+        result = MockUpdateResult(0, 0)
+        if upsert:
+            doc = upsert_document(filter_query, update)
+            self.db.data[self.name] = self._insert([doc])
+            result.upserted_id = doc.get("_id", doc.get("id"))
+        return result
 
-    async def update_many(self, filter_query, update):
-        data = self._get_collection_data()
+    async def update_one(self, filter_query, update, upsert=False):
+        with self.db.client._lock:
+            result = self._update_one(filter_query, update, upsert)
+            if result.modified_count or (upsert and not result.matched_count):
+                self._save_collection_data(self._get_collection_data(), "update_one", [filter_query, update, upsert])
+        return result
+
+    def _update_many(self, filter_query, update):
         updated_count = 0
-        for doc in data:
-            if self._matches(doc, filter_query):
-                # Apply $set
-                if "$set" in update:
-                    for k, v in update["$set"].items():
-                        doc[k] = v
-                
-                # Apply $push
-                if "$push" in update:
-                    for k, v in update["$push"].items():
-                        if k not in doc:
-                            doc[k] = []
-                        if isinstance(doc[k], list):
-                            doc[k].append(v)
-
-                # Apply $pull
-                if "$pull" in update:
-                    for k, v in update["$pull"].items():
-                        if k in doc and isinstance(doc[k], list):
-                            if isinstance(v, dict):
-                                doc[k] = [item for item in doc[k] if not all(item.get(sub_k) == sub_v for sub_k, sub_v in v.items())]
-                            else:
-                                doc[k] = [item for item in doc[k] if item != v]
-                
+        # Snapshot the hits: updating indexed fields reshuffles the index buckets
+        for doc in list(self._candidates(filter_query)):
+            if matches_filter(doc, filter_query):
+                self._apply_update(doc, update)
                 updated_count += 1
-        if updated_count > 0:
-            self._save_collection_data(data)
         return MockUpdateResult(updated_count, updated_count)
 
-    async def delete_one(self, filter_query):
-        data = self._get_collection_data()
-        for i, doc in enumerate(data):
-            if self._matches(doc, filter_query):
-                del data[i]
-                self._save_collection_data(data)
+    async def update_many(self, filter_query, update):
+        with self.db.client._lock:
+            result = self._update_many(filter_query, update)
+            if result.modified_count > 0:
+                self._save_collection_data(self._get_collection_data(), "update_many", [filter_query, update])
+        return result
+
+    def _position(self, data, doc):
+        # The backing list stays in insertion-seq order (appends and
+        # order-preserving deletes only), so a document's slot is a bisect away
+        seqs = self._seqs
+        try:
+            i = bisect_left(data, seqs[id(doc)], key=lambda d: seqs[id(d)])
+        except KeyError:
+            i = None
+        if i is None or i >= len(data) or data[i] is not doc:
+            i = next(i for i, stored in enumerate(data) if stored is doc)
+        return i
+
+    def _delete_one(self, filter_query):
+        for doc in self._candidates(filter_query):
+            if matches_filter(doc, filter_query):
+                data = self._get_collection_data()
+                del data[self._position(data, doc)]
+                self._index_remove(doc)
                 return True
         return False
 
-    async def delete_many(self, filter_query):
+    async def delete_one(self, filter_query):
+        with self.db.client._lock:
+            deleted = self._delete_one(filter_query)
+            if deleted:
+                self._save_collection_data(self._get_collection_data(), "delete_one", [filter_query])
+        return deleted
+
+    def _delete_many(self, filter_query):
+        doomed = {id(doc): doc for doc in self._candidates(filter_query) if matches_filter(doc, filter_query)}
+        if not doomed:
+            return 0
         data = self._get_collection_data()
-        new_data = [doc for doc in data if not self._matches(doc, filter_query)]
-        deleted_count = len(data) - len(new_data)
-        self._save_collection_data(new_data)
+        # Filter in place so the indexes stay bound to the same list
+        data[:] = [doc for doc in data if id(doc) not in doomed]
+        for doc in doomed.values():
+            self._index_remove(doc)
+        return len(doomed)
+
+    async def delete_many(self, filter_query):
+        with self.db.client._lock:
+            deleted_count = self._delete_many(filter_query)
+            if deleted_count:
+                self._save_collection_data(self._get_collection_data(), "delete_many", [filter_query])
         return deleted_count
 
+    def _drop(self):
+        self.db.data.pop(self.name, None)
+        self._indexes = {}
+        self._seqs = {}
+        self._next_seq = 0
+        self._indexed_data = None
+
+    async def drop(self):
+        with self.db.client._lock:
+            self._drop()
+            if self.db.client.storage == "sharded":
+                # The whole shard goes away; nothing to journal
+                self.db.client._drop_shard(self.db.name, self.name)
+            else:
+                self.db._save(self.name, "drop", [])
+
+    def _replay(self, op, args):
+        # Re-apply a journaled mutation without persisting it again
+        if op == "drop":
+            self._drop()
+        elif op == "insert":
+            self.db.data[self.name] = self._insert(args)
+        elif op == "update_one":
+            self._update_one(*args)
+        elif op == "update_many":
+            self._update_many(*args)
+        elif op == "delete_one":
+            self._delete_one(*args)
+        elif op == "delete_many":
+            self._delete_many(*args)
+        self.db.client.data[self.db.name] = self.db.data
+
 class AsyncMockDatabase:
     def __init__(self, client, name):
         self.client = client
         self.name = name
-        self.data = client.data.get(name, {})
+        if client.storage == "sharded":
+            self.data = client.data.setdefault(name, {})
+        else:
+            self.data = client.data.get(name, {})
+        # Collections are cached so their indexes survive between accesses
+        self._collections: Dict[str, AsyncMockCollection] = {}
 
     def __getitem__(self, name):
-        return AsyncMockCollection(self, name)
-    
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = AsyncMockCollection(self, name)
+            # Sharded storage reads a collection's file on first touch only
+            self.client._load_collection(self, collection)
+        return collection
+
     def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
         return self[name]
 
-    def _save(self):
+    def _save(self, collection=None, op=None, args=None):
         self.client.data[self.name] = self.data
-        self.client._save()
+        self.client._save(self.name, collection, op, args)
+
+    async def list_collection_names(self):
+        names = set(self.data)
+        if self.client.storage == "sharded":
+            # Shards that were never touched in this process are still on disk
+            shard_dir = os.path.join(self.client.shard_dir, self.name)
+            if os.path.isdir(shard_dir):
+                for filename in os.listdir(shard_dir):
+                    if filename.endswith(".json"):
+                        names.add(filename[:-len(".json")])
+            names -= self.client._dropped_shards_of(self.name)
+        return sorted(names)
+
+    async def drop_collection(self, name):
+        await self[name].drop()
+
+
+class _BackgroundWriter(threading.Thread):
+    """Flushes a client's pending writes off the event loop.
+
+    Bursts of mutations that land while a flush is pending are coalesced
+    into a single write (and a single fsync).
+    """
+
+    RETRY_SECONDS = 1.0
+
+    def __init__(self, client):
+        super().__init__(name="mock-db-writer", daemon=True)
+        self.client = client
+        self._cond = threading.Condition()
+        self._pending_since = None
+        self._stopping = False
+
+    def notify(self):
+        with self._cond:
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.join()
+
+    def run(self):
+        delay = self.client.group_commit_ms / 1000 if self.client.durability == "group" else 0
+        while True:
+            with self._cond:
+                while self._pending_since is None and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                # Group commit: let writes accumulate until the window closes
+                remaining = self._pending_since + delay - time.monotonic()
+                while remaining > 0 and not self._stopping:
+                    self._cond.wait(remaining)
+                    remaining = self._pending_since + delay - time.monotonic()
+                self._pending_since = None
+            try:
+                self.client.flush()
+            except Exception as e:
+                # The failed units are queued again; retry without waiting
+                # for the next write
+                logger.error(f"Mock DB background flush failed: {e}")
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait(self.RETRY_SECONDS)
+                self.notify()
 
 class AsyncMockClient:
-    def __init__(self, filepath="local_db.json"):
+    """JSON-file backed stand-in for AsyncIOMotorClient.
+
+    storage="snapshot" rewrites the whole file on every flush (legacy mode).
+    storage="journal" appends each mutation to ``<filepath>.journal`` and only
+    rewrites the snapshot every ``compact_every`` journal entries and on close().
+    storage="sharded" keeps every collection in its own snapshot + journal
+    pair under ``<filepath>.d/<db>/``, loads a collection the first time it is
+    touched and only ever writes the files of collections that changed.
+    ``indexes`` maps collection names to their hash/sorted index fields.
+
+    Disk writes happen on a background thread; ``durability`` decides when:
+    "fsync" flushes and fsyncs right after every write, "group" coalesces
+    writes for ``group_commit_ms`` before one flush, and "shutdown" only
+    writes on close().
+    """
+
+    JOURNAL_META_KEY = "__journal__"
+    STORAGE_MODES = ("snapshot", "journal", "sharded")
+    DURABILITY_MODES = ("fsync", "group", "shutdown")
+
+    def __init__(self, filepath="local_db.json", storage="snapshot", compact_every=1000, indexes=None,
+                 durability="group", group_commit_ms=50):
+        if storage not in self.STORAGE_MODES:
+            raise ValueError(f"Unknown mock DB storage mode: {storage}")
+        if durability not in self.DURABILITY_MODES:
+            raise ValueError(f"Unknown mock DB durability mode: {durability}")
         self.filepath = filepath
+        self.storage = storage
+        self.compact_every = compact_every
+        self.indexes = DEFAULT_INDEXES if indexes is None else indexes
+        self.durability = durability
+        self.group_commit_ms = group_commit_ms
+        self.journal_path = f"{filepath}.journal"
+        self.shard_dir = f"{filepath}.d"
         self.data = {}
+        self._databases: Dict[str, AsyncMockDatabase] = {}
+        # Per storage unit: None is the single-file database, (db, collection)
+        # a shard. Tracks the last journal seq and entries since compaction.
+        self._journal_seqs: Dict[Any, int] = {}
+        self._journal_entries: Dict[Any, int] = {}
+        self._journal_files: Dict[Any, Any] = {}
+        # _lock guards in-memory state and the pending buffers, _io_lock
+        # serializes flushes between the writer thread and close()/flush()
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()
+        self._pending_lines: Dict[Any, List[str]] = {}
+        self._dirty_snapshots = set()
+        self._dropped_shards = set()
         self._load()
+        self._writer = None
+        if durability != "shutdown":
+            self._writer = _BackgroundWriter(self)
+            self._writer.start()
+        atexit.register(self.close)
+
+    # ----- Loading -----
 
     def _load(self):
+        self._databases = {}
+        if self.storage == "sharded":
+            self.data = {}
+            if not os.path.isdir(self.shard_dir) and os.path.exists(self.filepath):
+                self._migrate_to_shards()
+            return
+
         if os.path.exists(self.filepath):
             try:
                 with open(self.filepath, 'r', encoding='utf-8') as f:
@@ -237,12 +1199,273 @@ class AsyncMockClient:
         else:
             self.data = {}
 
-    def _save(self):
-        with open(self.filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        meta = self.data.pop(self.JOURNAL_META_KEY, None) or {}
+        self._journal_seqs[None] = meta.get("seq", 0)
+        if self.storage == "journal":
+            for entry in self._read_journal(self.journal_path, self._journal_seqs[None]):
+                self[entry["db"]][entry["c"]]._replay(entry["op"], entry["args"])
+                self._journal_seqs[None] = entry["seq"]
+                self._journal_entries[None] = self._journal_entries.get(None, 0) + 1
+
+    def _read_journal(self, path, after_seq):
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash: everything after it is unusable
+                    break
+                # Entries already folded into the snapshot by an interrupted compaction
+                if entry["seq"] <= after_seq:
+                    continue
+                if entry["seq"] != after_seq + 1:
+                    # A lost append: replaying past it would apply later
+                    # mutations without the earlier ones
+                    logger.error(f"Mock DB journal {path} skips from seq {after_seq} to {entry['seq']}; ignoring the rest")
+                    break
+                after_seq = entry["seq"]
+                yield entry
+
+    def _load_collection(self, database, collection):
+        if self.storage != "sharded":
+            return
+        key = (database.name, collection.name)
+        snapshot_path, journal_path = self._shard_paths(key)
+        seq = 0
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'r', encoding='utf-8') as f:
+                shard = json.load(f)
+            database.data[collection.name] = shard["documents"]
+            seq = shard.get("seq", 0)
+        entries = 0
+        for entry in self._read_journal(journal_path, seq):
+            collection._replay(entry["op"], entry["args"])
+            seq = entry["seq"]
+            entries += 1
+        self._journal_seqs[key] = seq
+        self._journal_entries[key] = entries
+
+    def _migrate_to_shards(self):
+        # One-off split of a legacy single-file database (plus its journal)
+        for db_name, collections in load_json_database(self.filepath).items():
+            for name, documents in collections.items():
+                self.data.setdefault(db_name, {})[name] = documents
+                self._journal_seqs[(db_name, name)] = 0
+                self._dirty_snapshots.add((db_name, name))
+        self.flush()
+        self.data = {}
+        # The shards are the live data from now on: move the legacy files
+        # aside so nothing keeps reading or writing a stale copy
+        for path in (self.filepath, self.journal_path):
+            if os.path.exists(path):
+                os.replace(path, f"{path}.migrated")
+        logger.info(f"Migrated {self.filepath} into per-collection shards at {self.shard_dir}")
+
+    def _drop_shard(self, db_name, name):
+        # Called with _lock held. Forget everything queued for the shard;
+        # flush() deletes its files.
+        key = (db_name, name)
+        self._pending_lines.pop(key, None)
+        self._dirty_snapshots.discard(key)
+        self._journal_seqs[key] = 0
+        self._journal_entries[key] = 0
+        self._dropped_shards.add(key)
+        if self._writer is not None:
+            self._writer.notify()
+
+    def _dropped_shards_of(self, db_name):
+        with self._lock:
+            return {name for db, name in self._dropped_shards if db == db_name}
+
+    def _shard_paths(self, key):
+        db_name, name = key
+        base = os.path.join(self.shard_dir, db_name, name)
+        return f"{base}.json", f"{base}.journal"
+
+    # ----- Writing -----
+
+    def _save(self, db_name=None, collection=None, op=None, args=None):
+        # Called with _lock held, right after the in-memory mutation
+        key = (db_name, collection) if self.storage == "sharded" else None
+        journaled = self.storage in ("journal", "sharded") and op is not None
+        if journaled and self.durability != "shutdown":
+            seq = self._journal_seqs.get(key, 0) + 1
+            self._journal_seqs[key] = seq
+            if key is None:
+                entry = {"seq": seq, "db": db_name, "c": collection, "op": op, "args": args}
+            else:
+                entry = {"seq": seq, "op": op, "args": args}
+            self._pending_lines.setdefault(key, []).append(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal_entries[key] = self._journal_entries.get(key, 0) + 1
+            if self._journal_entries[key] >= self.compact_every:
+                self._dirty_snapshots.add(key)
+        else:
+            self._dirty_snapshots.add(key)
+        if self._writer is not None:
+            self._writer.notify()
+
+    def flush(self):
+        """Write everything pending to disk; blocks the calling thread."""
+        with self._io_lock:
+            with self._lock:
+                lines, self._pending_lines = self._pending_lines, {}
+                dropped, self._dropped_shards = self._dropped_shards, set()
+                snapshots = {}
+                # Serialize under the lock so the event loop cannot mutate
+                # the data mid-dump; the file I/O below runs without it
+                for key in self._dirty_snapshots:
+                    snapshots[key] = self._serialize_snapshot(key)
+                    self._journal_entries[key] = 0
+                self._dirty_snapshots = set()
+            # A unit whose I/O fails gets a full snapshot rewrite on the next
+            # flush: the snapshot holds everything its lost lines did
+            failed, undropped, error = set(), set(), None
+            # Dropped shards go first, so a collection re-created after the
+            # drop is written out fresh below
+            for key in dropped:
+                try:
+                    self._truncate_journal(key)
+                    for path in self._shard_paths(key):
+                        if os.path.exists(path):
+                            os.remove(path)
+                except OSError as e:
+                    error = error or e
+                    undropped.add(key)
+                    with self._lock:
+                        self._dropped_shards.add(key)
+            for key, payload in snapshots.items():
+                if key in undropped:
+                    # Written after the drop is retried
+                    failed.add(key)
+                    continue
+                try:
+                    self._write_snapshot(key, payload)
+                    if self.storage != "snapshot":
+                        # The snapshot already contains this unit's pending entries
+                        lines.pop(key, None)
+                        self._truncate_journal(key)
+                except OSError as e:
+                    error = error or e
+                    failed.add(key)
+            for key, unit_lines in lines.items():
+                if key in failed or key in undropped:
+                    failed.add(key)
+                    continue
+                try:
+                    self._append_journal(key, unit_lines)
+                except OSError as e:
+                    error = error or e
+                    failed.add(key)
+            if failed:
+                with self._lock:
+                    self._dirty_snapshots.update(failed)
+                for key in failed:
+                    # May hold a partly written buffer
+                    f = self._journal_files.pop(key, None)
+                    if f is not None:
+                        try:
+                            f.close()
+                        except OSError:
+                            pass
+            if error is not None:
+                raise error
+
+    def _journal_file_path(self, key):
+        return self.journal_path if key is None else self._shard_paths(key)[1]
+
+    def _append_journal(self, key, lines):
+        f = self._journal_files.get(key)
+        if f is None:
+            path = self._journal_file_path(key)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            f = self._journal_files[key] = open(path, 'a', encoding='utf-8')
+        f.write("".join(lines))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _serialize_snapshot(self, key):
+        if key is None:
+            data = self.data
+            if self.storage == "journal":
+                data = dict(self.data)
+                data[self.JOURNAL_META_KEY] = {"seq": self._journal_seqs.get(None, 0)}
+            return json.dumps(data, indent=2, ensure_ascii=False)
+        db_name, name = key
+        shard = {"seq": self._journal_seqs.get(key, 0), "documents": self.data.get(db_name, {}).get(name, [])}
+        return json.dumps(shard, indent=2, ensure_ascii=False)
+
+    def _write_snapshot(self, key, payload):
+        path = self.filepath if key is None else self._shard_paths(key)[0]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+            if self.storage != "snapshot" or self.durability == "fsync":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _truncate_journal(self, key):
+        # The snapshot records the last folded seq, so a crash before this
+        # truncate cannot replay those entries twice.
+        f = self._journal_files.pop(key, None)
+        if f is not None:
+            f.close()
+        path = self._journal_file_path(key)
+        if os.path.exists(path):
+            open(path, 'w', encoding='utf-8').close()
+
+    def compact(self):
+        """Fold the journals into fresh snapshots and truncate them."""
+        if self.storage == "snapshot":
+            return
+        with self._lock:
+            for key, entries in self._journal_entries.items():
+                if entries:
+                    self._dirty_snapshots.add(key)
+        self.flush()
 
     def __getitem__(self, name):
-        return AsyncMockDatabase(self, name)
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = AsyncMockDatabase(self, name)
+        return database
 
     def close(self):
-        pass
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer = None
+        self.compact()
+        self.flush()
+        for f in self._journal_files.values():
+            f.close()
+        self._journal_files = {}
+
+def json_database_exists(filepath):
+    """True when ``filepath`` holds a mock database in any storage mode."""
+    return os.path.exists(filepath) or os.path.isdir(f"{filepath}.d")
+
+def load_json_database(filepath):
+    """Read a mock database into a plain dict.
+
+    Uses the per-collection shards under ``<filepath>.d/`` when they exist,
+    otherwise the single-file database (snapshot plus journal).
+    """
+    shard_dir = f"{filepath}.d"
+    if not os.path.isdir(shard_dir):
+        legacy = AsyncMockClient(filepath, storage="journal", indexes={}, durability="shutdown")
+        atexit.unregister(legacy.close)
+        return legacy.data
+    sharded = AsyncMockClient(filepath, storage="sharded", indexes={}, durability="shutdown")
+    atexit.unregister(sharded.close)
+    for db_name in sorted(os.listdir(shard_dir)):
+        if not os.path.isdir(os.path.join(shard_dir, db_name)):
+            continue
+        database = sharded[db_name]
+        for filename in sorted(os.listdir(os.path.join(shard_dir, db_name))):
+            name, ext = os.path.splitext(filename)
+            if ext in (".json", ".journal"):
+                database[name]
+    return sharded.data
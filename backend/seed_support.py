@@ -1,10 +1,15 @@
 
-import json
+import asyncio
 import os
 import uuid
 from datetime import datetime, timezone
 
-DB_FILE = "local_db.json"
+from mock_db import AsyncMockClient, json_database_exists
+
+# Same database and storage mode as the server
+DB_FILE = os.getenv("DB_FILE_PATH", "local_db.json")
+DB_STORAGE = os.getenv("MOCK_DB_STORAGE", "journal")
+DB_NAME = os.getenv("DB_NAME", "my_local_db")
 
 new_qa = [
     # Категория: Профиль
@@ -77,24 +82,21 @@ new_qa = [
     }
 ]
 
-def seed():
-    if not os.path.exists(DB_FILE):
+async def seed():
+    if not json_database_exists(DB_FILE):
         print("DB file not found")
         return
 
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        db_data = json.load(f)
-
-    if "my_local_db" not in db_data:
-        db_data["my_local_db"] = {}
-    
-    # Replace existing support_qa with fresh seeded data for demo/MVP
-    db_data["my_local_db"]["support_qa"] = new_qa
-    
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(db_data, f, indent=2, ensure_ascii=False)
+    client = AsyncMockClient(DB_FILE, storage=DB_STORAGE, durability="fsync")
+    try:
+        support_qa = client[DB_NAME].support_qa
+        # Replace existing support_qa with fresh seeded data for demo/MVP
+        await support_qa.delete_many({})
+        await support_qa.insert_many(new_qa)
+    finally:
+        client.close()
     
     print(f"Successfully seeded {len(new_qa)} Q&A items into support_qa.")
 
 if __name__ == "__main__":
-    seed()
+    asyncio.run(seed())
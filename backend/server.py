@@ -1,20 +1,44 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Query, Request, WebSocket, WebSocketDisconnect, Response # Final Reload 4
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 try:
     from .mock_db import AsyncMockClient
+    from .sqlite_db import AsyncSQLiteClient
+    from .caches import PageIdCache, PagePayloadCache, SingleFlight
+    from .columnar import ColumnarEventStore
+    from .dimensions import GeoIPCountry, dimension_breakdowns, event_dimensions
+    from .html_template import SeoTemplate
+    from .analytics import (
+        EXPORT_FORMATS, STATS_RANGES, TRENDING_WINDOWS, AnalyticsIngestQueue, IngestFilter, LiveCounters,
+        PageStatsAccumulator, TrendingTracker,
+        apply_retention, count_unique_visitors, export_events, raw_event_collections, resolve_timezone,
+        retention_cutoff, visitor_key,
+    )
 except ImportError:
     from mock_db import AsyncMockClient
+    from sqlite_db import AsyncSQLiteClient
+    from caches import PageIdCache, PagePayloadCache, SingleFlight
+    from columnar import ColumnarEventStore
+    from dimensions import GeoIPCountry, dimension_breakdowns, event_dimensions
+    from html_template import SeoTemplate
+    from analytics import (
+        EXPORT_FORMATS, STATS_RANGES, TRENDING_WINDOWS, AnalyticsIngestQueue, IngestFilter, LiveCounters,
+        PageStatsAccumulator, TrendingTracker,
+        apply_retention, count_unique_visitors, export_events, raw_event_collections, resolve_timezone,
+        retention_cutoff, visitor_key,
+    )
 import os
+import json
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 import bcrypt
 from jose import JWTError, jwt
 import aiohttp
@@ -45,13 +69,36 @@ for directory in [UPLOAD_DIR, AVATARS_DIR, COVERS_DIR, LOGO_DIR, FAVS_DIR, OG_PR
 mongo_url = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
 USE_MOCK_DB = os.getenv('USE_MOCK_DB', 'true').lower() == 'true'
 DB_FILE_PATH = os.getenv('DB_FILE_PATH', 'local_db.json')
+# "journal" and "snapshot" use DB_FILE_PATH alone. "sharded" (opt-in) keeps one snapshot + journal
+# per collection under DB_FILE_PATH.d/; DB_FILE_PATH is imported once if the directory does not
+# exist yet, then renamed to *.migrated. Helper scripts read it through mock_db.load_json_database
+MOCK_DB_STORAGE = os.getenv('MOCK_DB_STORAGE', 'journal')
+MOCK_DB_COMPACT_EVERY = int(os.getenv('MOCK_DB_COMPACT_EVERY', '1000'))
+# Mock DB disk writes run on a background thread: "fsync" (every write), "group" (every N ms) or "shutdown"
+MOCK_DB_DURABILITY = os.getenv('MOCK_DB_DURABILITY', 'group')
+MOCK_DB_GROUP_COMMIT_MS = int(os.getenv('MOCK_DB_GROUP_COMMIT_MS', '50'))
+# "json" (AsyncMockClient) or "sqlite" (AsyncSQLiteClient, safe for several uvicorn workers)
+MOCK_DB_DRIVER = os.getenv('MOCK_DB_DRIVER', 'json').lower()
+SQLITE_DB_PATH = os.getenv('SQLITE_DB_PATH', 'local_db.sqlite3')
 
 client = None
 db = None
 
+def create_mock_client():
+    if MOCK_DB_DRIVER == "sqlite":
+        # First start copies the existing JSON database in
+        return AsyncSQLiteClient(SQLITE_DB_PATH, import_from=DB_FILE_PATH)
+    return AsyncMockClient(
+        DB_FILE_PATH,
+        storage=MOCK_DB_STORAGE,
+        compact_every=MOCK_DB_COMPACT_EVERY,
+        durability=MOCK_DB_DURABILITY,
+        group_commit_ms=MOCK_DB_GROUP_COMMIT_MS,
+    )
+
 if USE_MOCK_DB:
-    print(f"WARNING: Using Mock DB ({DB_FILE_PATH})")
-    client = AsyncMockClient(DB_FILE_PATH)
+    print(f"WARNING: Using Mock DB ({SQLITE_DB_PATH if MOCK_DB_DRIVER == 'sqlite' else DB_FILE_PATH})")
+    client = create_mock_client()
     db = client[os.getenv('DB_NAME', 'my_local_db')]
 else:
     try:
@@ -64,9 +111,88 @@ else:
     except Exception as e:
         print(f"MongoDB connection failed: {e}")
         print(f"Falling back to Mock DB ({DB_FILE_PATH})")
-        client = AsyncMockClient(DB_FILE_PATH)
+        client = create_mock_client()
         db = client[os.getenv('DB_NAME', 'my_local_db')]
 
+# Optional in-memory columnar copy of analytics_v2 for stats (see columnar.py)
+analytics_columnar = ColumnarEventStore() if os.getenv('ANALYTICS_COLUMNAR_STORE', '0') == '1' else None
+
+# Bots and repeated views are dropped before they reach the ingest queue
+analytics_filter = IngestFilter(
+    dedup_window=int(os.getenv('ANALYTICS_DEDUP_WINDOW_SECONDS', '1800')),
+    capacity=int(os.getenv('ANALYTICS_DEDUP_CAPACITY', '100000')),
+)
+
+# Optional local GeoIP database (.mmdb) for the country breakdown
+geoip_country = GeoIPCountry(os.getenv('GEOIP_DB_PATH'))
+
+# Top pages and blocks over sliding windows, updated as events are written
+analytics_trending = TrendingTracker(capacity=int(os.getenv('ANALYTICS_TRENDING_CAPACITY', '200')))
+
+# Deltas for dashboards subscribed to live analytics over /ws/{username}
+analytics_live = LiveCounters()
+ANALYTICS_LIVE_PUSH_INTERVAL = 1.0
+
+# Tracked events are buffered and written in batches (see analytics.py)
+analytics_ingest = AnalyticsIngestQueue(
+    db,
+    max_batch=int(os.getenv('ANALYTICS_BATCH_SIZE', '500')),
+    flush_interval=float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '1.0')),
+    max_pending=int(os.getenv('ANALYTICS_QUEUE_LIMIT', '10000')),
+    columnar=analytics_columnar,
+    trending=analytics_trending,
+    live=analytics_live,
+)
+
+# Raw events are kept this many days, older ones survive as daily rollups.
+# Must cover the 24h range, whose hourly buckets need the raw data.
+ANALYTICS_RAW_RETENTION_DAYS = max(2, int(os.getenv('ANALYTICS_RAW_RETENTION_DAYS', '90')))
+ANALYTICS_RETENTION_INTERVAL = float(os.getenv('ANALYTICS_RETENTION_INTERVAL_HOURS', '6')) * 3600
+
+async def analytics_retention_loop():
+    while True:
+        try:
+            result = await apply_retention(db, ANALYTICS_RAW_RETENTION_DAYS, columnar=analytics_columnar)
+            if result["dropped_partitions"] or result["deleted_events"]:
+                logger.info(f"Analytics retention: {result}")
+        except Exception as e:
+            logger.error(f"Analytics retention failed: {e}")
+        await asyncio.sleep(ANALYTICS_RETENTION_INTERVAL)
+
+async def analytics_live_loop():
+    # Coalesces everything written in between: one push per page per interval
+    while True:
+        await asyncio.sleep(ANALYTICS_LIVE_PUSH_INTERVAL)
+        deltas = analytics_live.drain()
+        if deltas:
+            await manager.push_analytics(deltas)
+
+analytics_retention_task = None
+analytics_live_task = None
+
+# Existing page ids, so spam to public ingestion endpoints costs no DB I/O
+page_id_cache = PageIdCache(db, reconcile_interval=float(os.getenv('PAGE_ID_CACHE_RECONCILE_SECONDS', '60')))
+
+# Public page payloads (page, blocks, events, showcases, pixels) by username
+page_cache = PagePayloadCache(
+    ttl=float(os.getenv('PAGE_CACHE_TTL_SECONDS', '30')),
+    max_entries=int(os.getenv('PAGE_CACHE_MAX_ENTRIES', '1000')),
+)
+
+# SPA index.html for SEO injection, first existing path wins. Loaded at
+# startup and re-read only when its mtime changes (checked every few seconds)
+index_template = SeoTemplate(
+    [
+        ROOT_DIR.parent / "frontend" / "build" / "index.html",     # Prod
+        ROOT_DIR.parent / "frontend" / "public" / "index.html",    # Dev
+        Path("/usr/share/nginx/html/index.html"),                   # Inside Docker (if shared)
+    ],
+    check_interval=float(os.getenv('SEO_TEMPLATE_CHECK_SECONDS', '5')),
+)
+
+# Concurrent identical reads (page payloads, SEO HTML, sitemap) share one computation
+single_flight = SingleFlight()
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
@@ -87,11 +213,16 @@ async def robots_txt():
 
 @app.get("/sitemap.xml")
 async def sitemap_xml(request: Request):
+    base_url = f"{request.url.scheme}://{request.url.netloc}"
+    # Crawlers hitting it together share one users scan
+    xml_content = await single_flight.do(("sitemap", base_url), lambda: render_sitemap(base_url))
+    return Response(content=xml_content, media_type="application/xml")
+
+async def render_sitemap(base_url: str):
     # Получаем всех пользователей (страницы)
     users = await db.users.find({}, {"username": 1}).to_list(10000)
     
     # Рекурсивная сборка XML
-    base_url = f"{request.url.scheme}://{request.url.netloc}"
     
     xml_content = '<?xml version="1.0" encoding="UTF-8"?>\n'
     xml_content += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
@@ -105,7 +236,7 @@ async def sitemap_xml(request: Request):
             xml_content += f"  <url>\n    <loc>{base_url}/{user['username']}</loc>\n    <changefreq>weekly</changefreq>\n    <priority>0.8</priority>\n  </url>\n"
             
     xml_content += "</urlset>"
-    return Response(content=xml_content, media_type="application/xml")
+    return xml_content
 
 @app.get("/api/qr/generate")
 async def generate_qr(url: str, color: str = "black", bg: str = "white"):
@@ -129,13 +260,41 @@ async def generate_qr(url: str, color: str = "black", bg: str = "white"):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def authorize_live_analytics(username: str, token: Optional[str]):
+    # Same rules as /pages/{username}/stats: the page's owner only
+    if not token:
+        return None
+    user = await get_current_user_optional(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    if not user:
+        return None
+    page = await db.pages.find_one({"username": username}, {"_id": 0, "id": 1, "user_id": 1})
+    if not page or page["user_id"] != user["id"]:
+        return None
+    return page["id"]
+
 @app.websocket("/ws/{username}")
 async def websocket_endpoint(websocket: WebSocket, username: str):
     await manager.connect(websocket, username)
     try:
         while True:
-            # Keep connection alive and wait for data (though we only send for now)
-            await websocket.receive_text()
+            # Plain keep-alives are ignored; JSON messages may (un)subscribe
+            # to live analytics of the page
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+            if not isinstance(message, dict):
+                continue
+            if message.get("type") == "subscribe_analytics":
+                page_id = await authorize_live_analytics(username, message.get("token"))
+                if page_id is None:
+                    await websocket.send_json({"type": "analytics_error", "detail": "Доступ запрещен"})
+                    continue
+                manager.subscribe_analytics(websocket, page_id)
+                await websocket.send_json({"type": "analytics_subscribed"})
+            elif message.get("type") == "unsubscribe_analytics":
+                manager.unsubscribe_analytics(websocket)
     except WebSocketDisconnect:
         manager.disconnect(websocket, username)
     except Exception as e:
@@ -155,6 +314,48 @@ async def startup_db_check():
         print(f"Verified admin role for {dev_email}")
     except Exception as e:
         print(f"Startup check failed (DB might be empty yet): {e}")
+
+    if analytics_columnar is not None:
+        # Loaded before the ingest queue starts, so no event lands twice
+        batch = []
+        for collection in await raw_event_collections(db):
+            async for event in collection.find({}, {"_id": 0, "page_id": 1, "event_type": 1, "target_id": 1, "timestamp": 1}):
+                batch.append(event)
+                if len(batch) >= 10000:
+                    analytics_columnar.extend(batch)
+                    batch = []
+        analytics_columnar.extend(batch)
+        print(f"Columnar analytics store loaded: {len(analytics_columnar)} events")
+
+    # Seeded before the ingest queue starts, like the columnar store
+    try:
+        await analytics_trending.warm(db)
+    except Exception as e:
+        logger.error(f"Failed to warm trending analytics: {e}")
+
+    analytics_ingest.start()
+    if not index_template.refresh():
+        logger.warning(f"SEO template (index.html) not found in {index_template.candidates}")
+    try:
+        await page_id_cache.reconcile()
+    except Exception as e:
+        logger.error(f"Failed to load page id cache: {e}")
+
+    # Rollup increments upsert by id; stats read a page's rollups by day
+    try:
+        await db.analytics_rollups.create_index([("id", 1)], unique=True)
+        await db.analytics_rollups.create_index([("page_id", 1), ("day", 1)])
+    except Exception as e:
+        logger.error(f"Failed to create analytics rollup indexes: {e}")
+    try:
+        await db.analytics_dimensions.create_index([("id", 1)], unique=True)
+        await db.analytics_dimensions.create_index([("page_id", 1), ("day", 1)])
+    except Exception as e:
+        logger.error(f"Failed to create analytics cube indexes: {e}")
+
+    global analytics_retention_task, analytics_live_task
+    analytics_retention_task = asyncio.create_task(analytics_retention_loop())
+    analytics_live_task = asyncio.create_task(analytics_live_loop())
     
     # Start Telegram Bot polling in background
     if bot and dp:
@@ -313,6 +514,9 @@ class ConnectionManager:
     def __init__(self):
         # active_connections: Dict[username, List[WebSocket]]
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Live analytics: page_id -> subscribed sockets, and the reverse
+        self.analytics_subscribers: Dict[str, List[WebSocket]] = {}
+        self.analytics_pages: Dict[WebSocket, str] = {}
 
     async def connect(self, websocket: WebSocket, username: str):
         await websocket.accept()
@@ -322,6 +526,7 @@ class ConnectionManager:
         logger.info(f"WebSocket connected for username: {username}")
 
     def disconnect(self, websocket: WebSocket, username: str):
+        self.unsubscribe_analytics(websocket)
         if username in self.active_connections:
             if websocket in self.active_connections[username]:
                 self.active_connections[username].remove(websocket)
@@ -340,20 +545,67 @@ class ConnectionManager:
                 except Exception as e:
                     logger.error(f"Error sending WebSocket message to {username}: {e}")
 
+    def subscribe_analytics(self, websocket: WebSocket, page_id: str):
+        if self.analytics_pages.get(websocket) == page_id:
+            return
+        self.unsubscribe_analytics(websocket)
+        self.analytics_pages[websocket] = page_id
+        self.analytics_subscribers.setdefault(page_id, []).append(websocket)
+        analytics_live.watch(page_id)
+
+    def unsubscribe_analytics(self, websocket: WebSocket):
+        page_id = self.analytics_pages.pop(websocket, None)
+        if page_id is None:
+            return
+        subscribers = self.analytics_subscribers.get(page_id, [])
+        if websocket in subscribers:
+            subscribers.remove(websocket)
+        if not subscribers:
+            self.analytics_subscribers.pop(page_id, None)
+        analytics_live.unwatch(page_id)
+
+    async def push_analytics(self, deltas: Dict[str, Dict[str, Any]]):
+        for page_id, delta in deltas.items():
+            for connection in list(self.analytics_subscribers.get(page_id, [])):
+                try:
+                    await connection.send_json({"type": "analytics_delta", "data": delta})
+                except Exception as e:
+                    logger.error(f"Error sending analytics delta for page {page_id}: {e}")
+
 manager = ConnectionManager()
 
-# Helper to fetch full data (internal)
+# Helper to fetch full data (internal); served from page_cache when fresh
 async def get_full_page_data_internal(username: str):
+    data = page_cache.get(username)
+    if data is not None:
+        return data
+    # A burst of misses for one page runs a single set of queries
+    # (a load that started before an invalidation is not joined)
+    key = ("page", username, page_cache.generation(username))
+    return await single_flight.do(key, lambda: load_and_cache_page_data(username))
+
+async def load_and_cache_page_data(username: str):
+    generation = page_cache.generation(username)
+    data = await load_full_page_data(username)
+    if data is not None:
+        page_cache.set(username, data, generation)
+    return data
+
+async def load_full_page_data(username: str):
     page = await db.pages.find_one({"username": username}, {"_id": 0})
     if not page:
         return None
     
-    blocks = await db.blocks.find({"page_id": page["id"]}, {"_id": 0}).sort("order", 1).to_list(100)
-    events = await db.events.find({"page_id": page["id"]}, {"_id": 0}).to_list(100)
-    showcases = await db.showcases.find({"page_id": page["id"]}, {"_id": 0}).to_list(100)
+    # Independent once the page id is known, so they run concurrently. The
+    # user lookup only needs the pixel ids, not the whole document (leads)
+    blocks, events, showcases, user = await asyncio.gather(
+        db.blocks.find({"page_id": page["id"]}, {"_id": 0}).sort("order", 1).to_list(100),
+        db.events.find({"page_id": page["id"]}, {"_id": 0}).to_list(100),
+        db.showcases.find({"page_id": page["id"]}, {"_id": 0}).to_list(100),
+        db.users.find_one({"id": page["user_id"]}, {"_id": 0, "ga_pixel_id": 1, "fb_pixel_id": 1}),
+    )
     
     # Inject user's global analytics IDs
-    user = await db.users.find_one({"id": page["user_id"]})
     analytics = {}
     if user:
         if user.get("ga_pixel_id"):
@@ -371,7 +623,9 @@ async def get_full_page_data_internal(username: str):
 
 # Helpers to broadcast fresh data to connected clients
 async def broadcast_page_update(username: str):
-    data = await get_full_page_data_internal(username)
+    # Every mutation ends up here: drop the cached payload, then reload it
+    page_cache.invalidate(username)
+    data = await load_and_cache_page_data(username)
     if data:
         await manager.notify_page_update(username, data)
 
@@ -900,6 +1154,7 @@ async def google_auth(data: GoogleAuthRequest):
             "is_main_page": True
         }
         await db.pages.insert_one(page)
+        page_id_cache.add(page["id"])
     else:
         # Existing user
         page = await db.pages.find_one({"user_id": user["id"]}, {"_id": 0})
@@ -983,6 +1238,7 @@ async def register(user_data: UserRegister):
             "is_main_page": True
         }
         await db.pages.insert_one(page)
+        page_id_cache.add(page["id"])
 
     
     token = create_access_token({"sub": user_id, "role": role})
@@ -997,6 +1253,8 @@ async def register(user_data: UserRegister):
 
 @api_router.post("/submissions", status_code=201)
 async def create_lead(lead_data: LeadCreate):
+    if not await page_id_cache.contains(lead_data.page_id):
+        raise HTTPException(status_code=404, detail="Страница не найдена")
     page = await db.pages.find_one({"id": lead_data.page_id})
     if not page:
         raise HTTPException(status_code=404, detail="Страница не найдена")
@@ -1122,7 +1380,7 @@ async def delete_my_account(current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
     
     # 1. Delete blocks from all user pages
-    user_pages = await db.pages.find({"user_id": user_id}, {"_id": 0, "id": 1}).to_list(100)
+    user_pages = await db.pages.find({"user_id": user_id}, {"_id": 0, "id": 1, "username": 1}).to_list(100)
     for page in user_pages:
         await db.blocks.delete_many({"page_id": page["id"]})
         await db.events.delete_many({"page_id": page["id"]})
@@ -1130,6 +1388,8 @@ async def delete_my_account(current_user: dict = Depends(get_current_user)):
     
     # 2. Delete all pages
     await db.pages.delete_many({"user_id": user_id})
+    page_id_cache.discard(*[page["id"] for page in user_pages])
+    page_cache.invalidate(*[page["username"] for page in user_pages])
     
     # 3. Delete user
     await db.users.delete_one({"id": user_id})
@@ -1330,6 +1590,9 @@ async def update_me(updates: UserUpdate, current_user: dict = Depends(get_curren
         {"id": current_user["id"]},
         {"$set": update_data}
     )
+    # Pixel ids are part of every page payload of the user
+    user_pages = await db.pages.find({"user_id": current_user["id"]}, {"_id": 0, "username": 1}).to_list(100)
+    page_cache.invalidate(*[page["username"] for page in user_pages])
     
     return {"message": "Данные обновлены", "updates": update_data}
     
@@ -1351,6 +1614,36 @@ async def get_admin_stats(current_admin = Depends(get_current_admin)):
         }
     }
 
+@api_router.get("/admin/analytics/ingest")
+async def get_analytics_ingest_stats(current_admin = Depends(get_current_admin)):
+    # Queue depth plus accepted/written/dropped/failed counters, and what
+    # the bot/duplicate filter kept out of the queue
+    return {**analytics_ingest.stats(), "filtered": analytics_filter.stats()}
+
+@api_router.get("/admin/analytics/trending")
+async def get_trending_analytics(
+    window: str = Query("24h", description="1h, 24h or 7d"),
+    limit: int = Query(10, ge=1, le=50),
+    current_admin = Depends(get_current_admin),
+):
+    if window not in TRENDING_WINDOWS:
+        raise HTTPException(status_code=400, detail="Неверное окно. Допустимо: 1h, 24h, 7d")
+    # Answered from the in-memory summaries, no analytics scan
+    top = analytics_trending.top(window, limit)
+
+    page_ids = {item["id"] for series in ("pages_by_views", "pages_by_clicks") for item in top[series]}
+    pages = await db.pages.find({"id": {"$in": list(page_ids)}}, {"_id": 0, "id": 1, "username": 1}).to_list(len(page_ids))
+    usernames = {p["id"]: p.get("username") for p in pages}
+    for series in ("pages_by_views", "pages_by_clicks"):
+        for item in top[series]:
+            item["username"] = usernames.get(item["id"])
+    block_ids = [item["id"] for item in top["blocks_by_clicks"]]
+    blocks = await db.blocks.find({"id": {"$in": block_ids}}, {"_id": 0, "id": 1, "content": 1}).to_list(len(block_ids))
+    titles = {b["id"]: (b.get("content") or {}).get("title") for b in blocks}
+    for item in top["blocks_by_clicks"]:
+        item["title"] = titles.get(item["id"])
+    return {"window": window, **top}
+
 @api_router.get("/admin/users")
 async def get_all_users(current_admin = Depends(get_current_admin)):
     users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
@@ -1376,7 +1669,10 @@ async def admin_delete_user(user_id: str, current_admin = Depends(get_current_ad
         
     # Cascade delete
     await db.users.delete_one({"id": user_id})
+    user_pages = await db.pages.find({"user_id": user_id}, {"_id": 0, "id": 1, "username": 1}).to_list(100)
     await db.pages.delete_many({"user_id": user_id})
+    page_id_cache.discard(*[page["id"] for page in user_pages])
+    page_cache.invalidate(*[page["username"] for page in user_pages])
     # Optional: delete blocks if page IDs are known, but pages usually enough if we reference by user_id
     # To be thorough:
     page = await db.pages.find_one({"user_id": user_id})
@@ -1414,6 +1710,7 @@ async def get_user_pages(current_user = Depends(get_current_user)):
             first_page = pages[0]
             first_page["is_main_page"] = True
             await db.pages.update_one({"id": first_page["id"]}, {"$set": {"is_main_page": True}})
+            page_cache.invalidate(first_page["username"])
             # Set for others strictly to False if missing (optional but cleaner)
             for p in pages[1:]:
                  if "is_main_page" not in p:
@@ -1436,27 +1733,104 @@ class AnalyticsEvent(BaseModel):
     target_id: Optional[str] = None # e.g. track_id or block_id for clicks
     metadata: Optional[Dict[str, Any]] = None
 
-@api_router.post("/analytics/track")
-async def track_event(event: AnalyticsEvent):
-    # Public endpoint, no auth required to record views/clicks
-    # But we check if page exists to avoid spam
-    page = await db.pages.find_one({"id": event.page_id})
-    if not page:
-        raise HTTPException(status_code=404, detail="Page not found")
-        
+ANALYTICS_BATCH_MAX_EVENTS = int(os.getenv('ANALYTICS_BATCH_MAX_EVENTS', '100'))
+
+VISITOR_SALT_SECRET = os.getenv('VISITOR_SALT_SECRET', SECRET_KEY)
+
+def get_client_ip(request: Request):
+    # Behind the reverse proxy the peer address is the proxy itself
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+def build_analytics_doc(event: AnalyticsEvent, request: Request):
+    now = datetime.now(timezone.utc)
+    ip = get_client_ip(request)
+    user_agent = request.headers.get("user-agent")
     doc = {
         "id": str(uuid.uuid4()),
         "page_id": event.page_id,
         "event_type": event.event_type,
         "target_id": event.target_id,
         "metadata": event.metadata,
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "timestamp": now.isoformat(),
+        # Consumed by the ingest queue for unique-visitor sketches, never stored
+        "visitor": visitor_key(VISITOR_SALT_SECRET, ip, user_agent, now.strftime("%Y-%m-%d")),
     }
-    await db.analytics_v2.insert_one(doc)
+    if event.event_type == "view":
+        # Traffic source, device and country, counted into the daily cubes
+        doc["dims"] = event_dimensions(event.metadata, user_agent, geoip_country.country(ip))
+    return doc
+
+@api_router.post("/analytics/track")
+async def track_event(event: AnalyticsEvent, request: Request):
+    # Public endpoint, no auth required to record views/clicks
+    # But we check if page exists to avoid spam (answered from memory)
+    if not await page_id_cache.contains(event.page_id):
+        raise HTTPException(status_code=404, detail="Page not found")
+        
+    docs = analytics_filter.filter([build_analytics_doc(event, request)], request.headers.get("user-agent"))
+    if not docs:
+        # Bots and repeated views are acknowledged but not stored
+        return {"status": "ok"}
+    # Queued for the next batch write; refuse instead of buffering without bound
+    analytics_ingest.start()
+    if not analytics_ingest.submit(docs):
+        raise HTTPException(status_code=429, detail="Слишком много событий, попробуйте позже")
     return {"status": "ok"}
 
+@api_router.post("/analytics/batch")
+async def track_events_batch(request: Request):
+    # Several events per request. navigator.sendBeacon posts text/plain
+    # (anything else would need a CORS preflight), so the raw body is parsed
+    # here instead of declaring a JSON body parameter.
+    try:
+        payload = json.loads(await request.body() or b"null")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат данных")
+    if isinstance(payload, dict):
+        payload = payload.get("events")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="Ожидается массив событий")
+    if len(payload) > ANALYTICS_BATCH_MAX_EVENTS:
+        raise HTTPException(status_code=413, detail=f"Не более {ANALYTICS_BATCH_MAX_EVENTS} событий за запрос")
+
+    events = []
+    rejected = 0
+    for item in payload:
+        try:
+            events.append(AnalyticsEvent(**item))
+        except (TypeError, ValidationError):
+            rejected += 1
+
+    # Every page referenced by the batch is validated against the id cache
+    known = await page_id_cache.filter_known({e.page_id for e in events})
+
+    docs = [build_analytics_doc(e, request) for e in events if e.page_id in known]
+    rejected += len(events) - len(docs)
+    accepted = len(docs)
+    # Filtered events still count as accepted, like in track_event
+    docs = analytics_filter.filter(docs, request.headers.get("user-agent"))
+    if docs:
+        analytics_ingest.start()
+        if not analytics_ingest.submit(docs):
+            raise HTTPException(status_code=429, detail="Слишком много событий, попробуйте позже")
+    return {"status": "ok", "accepted": accepted, "rejected": rejected}
+
 @api_router.get("/pages/{username}/stats")
-async def get_page_stats(username: str, current_user = Depends(get_current_user)):
+async def get_page_stats(
+    username: str,
+    period: str = Query("7d", alias="range", description="24h, 7d, 30d or 90d"),
+    tz: str = Query("UTC", description="IANA timezone for chart buckets"),
+    current_user = Depends(get_current_user),
+):
+    if period not in STATS_RANGES:
+        raise HTTPException(status_code=400, detail="Неверный период. Допустимо: 24h, 7d, 30d, 90d")
+    zone = resolve_timezone(tz)
+    if zone is None:
+        raise HTTPException(status_code=400, detail="Неизвестный часовой пояс")
+
     page = await db.pages.find_one({"username": username})
     if not page:
         raise HTTPException(status_code=404, detail="Page not found")
@@ -1465,54 +1839,42 @@ async def get_page_stats(username: str, current_user = Depends(get_current_user)
     if page["user_id"] != current_user["id"]:
          raise HTTPException(status_code=403, detail="Доступ запрещен")
 
-    # Aggregate stats
-    # 1. Total Views
-    total_views = await db.analytics_v2.count_documents({"page_id": page["id"], "event_type": "view"})
-    # 2. Total Clicks
-    total_clicks = await db.analytics_v2.count_documents({"page_id": page["id"], "event_type": "click"})
-    
-    # 3. Chart Data (Last 7 days)
-    chart_data = []
-    now = datetime.now(timezone.utc)
-    for i in range(6, -1, -1):
-        day = (now - timedelta(days=i)).strftime("%Y-%m-%d")
-        # In a real Mongo we'd use aggregation. Here we do simple count for each day.
-        # This is fine for Mock DB and small scale.
-        # Format: timestamp starts with YYYY-MM-DD
-        day_views = 0
-        day_clicks = 0
-        
-        # We need a way to filter by day prefix in our mock matches or just get all and filter
-        # Since mock_db doesn't support $regex, we just fetch events related to this page
-        # Note: In production we'd use better indexing and aggregation.
-        all_day_events = await db.analytics_v2.find({"page_id": page["id"]}).to_list(10000)
-        for e in all_day_events:
-            if e["timestamp"].startswith(day):
-                if e["event_type"] == "view": day_views += 1
-                elif e["event_type"] == "click": day_clicks += 1
-        
-        chart_data.append({
-            "name": day,
-            "views": day_views,
-            "clicks": day_clicks
-        })
+    stats = PageStatsAccumulator(period, zone)
+    if analytics_columnar is not None:
+        # Days past the raw retention window only exist as daily rollups;
+        # everything newer is vectorized over the in-memory columns
+        cutoff = retention_cutoff(ANALYTICS_RAW_RETENTION_DAYS)
+        async for rollup in db.analytics_rollups.find({"page_id": page["id"], "day": {"$lt": cutoff}}, {"_id": 0}):
+            stats.add_rollup(rollup)
+        since = int(datetime.fromisoformat(cutoff).replace(tzinfo=timezone.utc).timestamp())
+        stats.add_columnar(analytics_columnar.page_stats(page["id"], stats.bucket_edges(), since=since))
+    else:
+        # Reads only the pre-aggregated rollups: O(days x targets), however
+        # many raw events the page has. Hourly and downsampled daily rollups
+        # merge the same way.
+        async for rollup in db.analytics_rollups.find({"page_id": page["id"]}, {"_id": 0}):
+            stats.add_rollup(rollup)
+
+    total_views = stats.total_views
+    total_clicks = stats.total_clicks
+    chart_data = stats.chart_data()
+    unique_visitors = await count_unique_visitors(db, page["id"], stats.first_utc_day())
+    # Per-day cubes, so the breakdowns follow UTC days of the range
+    breakdowns = await dimension_breakdowns(db, page["id"], stats.first_utc_day())
+
+    # Top Links
+    sorted_clicks = stats.top_targets(5)
+    blocks = await db.blocks.find(
+        {"id": {"$in": [tid for tid, _ in sorted_clicks]}}, {"_id": 0, "id": 1, "content": 1}
+    ).to_list(5)
+    blocks_by_id = {b["id"]: b for b in blocks}
 
-    # 4. Top Links
-    # Get all clicks for this page
-    all_clicks = [e for e in all_day_events if e["event_type"] == "click" and e["target_id"]]
-    click_counts = {}
-    for c in all_clicks:
-        tid = c["target_id"]
-        click_counts[tid] = click_counts.get(tid, 0) + 1
-        
     top_links = []
-    # Sort by count
-    sorted_clicks = sorted(click_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-    
     for tid, count in sorted_clicks:
-        block = await db.blocks.find_one({"id": tid})
+        block = blocks_by_id.get(tid)
         if block:
             top_links.append({
+                "id": tid,
                 "title": block["content"].get("title", "Unknown"),
                 "clicks": count
             })
@@ -1521,10 +1883,48 @@ async def get_page_stats(username: str, current_user = Depends(get_current_user)
         "total_views": total_views,
         "total_clicks": total_clicks,
         "ctr": round((total_clicks / total_views * 100), 1) if total_views > 0 else 0,
+        "unique_visitors": unique_visitors,
+        "breakdowns": breakdowns,
         "chart_data": chart_data,
-        "top_links": top_links
+        "top_links": top_links,
+        "range": period,
+        "tz": tz,
     }
 
+@api_router.get("/pages/{username}/analytics/export")
+async def export_page_analytics(
+    username: str,
+    fmt: str = Query("ndjson", alias="format", description="ndjson or csv"),
+    start: Optional[date] = Query(None, description="First UTC day, inclusive"),
+    end: Optional[date] = Query(None, description="Last UTC day, inclusive"),
+    compress: bool = Query(False, alias="gzip"),
+    current_user = Depends(get_current_user),
+):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Неверный формат. Допустимо: ndjson, csv")
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="Начальная дата позже конечной")
+
+    page = await db.pages.find_one({"username": username}, {"_id": 0, "id": 1, "user_id": 1})
+    if not page:
+        raise HTTPException(status_code=404, detail="Page not found")
+    if page["user_id"] != current_user["id"] and current_user.get("role") != "owner":
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+
+    # Events are streamed chunk by chunk straight from the cursor
+    chunks = export_events(
+        db, page["id"], fmt,
+        start=start.isoformat() if start else None,
+        end=(end + timedelta(days=1)).isoformat() if end else None,
+        compress=compress,
+    )
+    filename = f"{username}-analytics.{fmt}" + (".gz" if compress else "")
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if compress else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @api_router.post("/pages", response_model=PageResponse)
 async def create_page(page_data: PageCreate, current_user = Depends(get_current_user)):
     normalized_username = page_data.username.lower().strip()
@@ -1560,6 +1960,7 @@ async def create_page(page_data: PageCreate, current_user = Depends(get_current_
     }
     
     await db.pages.insert_one(page)
+    page_id_cache.add(page["id"])
     return PageResponse(**page)
 
 @api_router.get("/pages/{username}", response_model=Dict[str, Any])
@@ -1633,6 +2034,7 @@ async def update_page_username(page_id: str, data: UsernameUpdate, current_user
         {"$set": {"username": new_username}}
     )
     
+    page_cache.invalidate(old_username)
     await manager.notify_page_update(old_username) # Notify old subscribers (might show 404/redirect)
     await broadcast_page_update(new_username)
     
@@ -1653,10 +2055,12 @@ async def delete_page(page_id: str, current_user = Depends(get_current_user)):
          raise HTTPException(status_code=400, detail="Нельзя удалить основную страницу")
 
     await db.pages.delete_one({"id": page_id})
+    page_id_cache.discard(page_id)
     await db.blocks.delete_many({"page_id": page_id})
     await db.events.delete_many({"page_id": page_id})
     await db.showcases.delete_many({"page_id": page_id})
     
+    page_cache.invalidate(page["username"])
     await manager.notify_page_update(page["username"])
     
     return {"message": "Страница удалена"}
@@ -1719,6 +2123,7 @@ async def reorder_blocks(data: BlockReorder, current_user = Depends(get_current_
             {"$set": {"order": index}}
         )
     
+    page_cache.invalidate(page["username"])
     await manager.notify_page_update(page["username"])
     return {"message": "Порядок обновлён"}
 
@@ -2178,6 +2583,7 @@ async def create_verification_request(
 
         # Update page brand status
         await db.pages.update_one({"id": request.page_id}, {"$set": {"brand_status": "pending"}})
+        page_cache.invalidate(target_page["username"])
 
     new_request = request.dict()
     new_request["id"] = str(uuid.uuid4())
@@ -2264,6 +2670,7 @@ async def approve_verification_request(request_id: str, current_admin: dict = De
                 {"id": main_page["id"]},
                 {"$set": {"is_verified": True}}
             )
+            page_cache.invalidate(main_page["username"])
             # Update user status
             await db.users.update_one(
                 {"id": req["user_id"]},
@@ -2406,6 +2813,7 @@ async def cancel_verification_request(request_id: str, rejection: RejectionReque
     # Notify on ALL user pages (cascading revoke)
     user_pages = await db.pages.find({"user_id": req["user_id"]}, {"username": 1}).to_list(100)
     for p in user_pages:
+        page_cache.invalidate(p["username"])
         await manager.notify_page_update(p["username"])
         
     return {"status": "revoked"}
@@ -2497,6 +2905,7 @@ async def grant_direct_verification(user_id: str, current_admin: dict = Depends(
     
     # Notify on main page for direct verification
     if main_page:
+        page_cache.invalidate(main_page["username"])
         await manager.notify_page_update(main_page["username"])
         
     return {"status": "verified"}
@@ -2774,35 +3183,28 @@ async def serve_user_page(request: Request, username: str):
     # Skip if it's an API route or static file
     if username.startswith("api") or "." in username:
         return Response(status_code=404)
-        
-    page_data = await get_full_page_data_internal(username.lower())
-    
-    # Try to find index.html in likely locations
-    possible_index_paths = [
-        ROOT_DIR.parent / "frontend" / "build" / "index.html",     # Prod
-        ROOT_DIR.parent / "frontend" / "public" / "index.html",    # Dev
-        Path("/usr/share/nginx/html/index.html")                    # Inside Docker (if shared)
-    ]
-    
-    index_path = None
-    for p in possible_index_paths:
-        if p.exists():
-            index_path = p
-            break
+
+    # Concurrent requests for the same page share one render
+    username = username.lower()
+    base_url = str(request.base_url).rstrip("/")
+    status_code, html_content = await single_flight.do(
+        ("html", username, base_url), lambda: render_user_page(username, base_url)
+    )
+    if html_content is None:
+        return Response(status_code=status_code)
+    return Response(content=html_content, status_code=status_code, media_type="text/html")
+
+async def render_user_page(username: str, base_url: str):
+    """(status_code, html) of the SPA index with the page's SEO tags injected."""
+    page_data = await get_full_page_data_internal(username)
             
-    if not index_path:
+    if not index_template.available:
         # If no index.html template is found, we cannot inject SEO tags.
         # However, we shouldn't just 404 if it's the landing page.
-        logger.error(f"SEO Injection failed: index.html not found in {possible_index_paths}")
-        return Response(
-            content="<html><body><h1>System Error</h1><p>Frontend template (index.html) not found. Check Docker volumes.</p></body></html>",
-            status_code=500,
-            media_type="text/html"
-        )
+        logger.error(f"SEO Injection failed: index.html not found in {index_template.candidates}")
+        return 500, "<html><body><h1>System Error</h1><p>Frontend template (index.html) not found. Check Docker volumes.</p></body></html>"
 
     try:
-        html_content = index_path.read_text(encoding='utf-8')
-        
         # Default values
         title = "InBio.one"
         description = "1bio - Ссылка в био для любых целей"
@@ -2836,25 +3238,32 @@ async def serve_user_page(request: Request, username: str):
             if not path: return ""
             if path.startswith(("http://", "https://")): return path
             # Assume it's an upload path
-            base = str(request.base_url).rstrip("/")
             if not path.startswith("/"): path = "/" + path
-            return f"{base}{path}"
-
-        # Inject
-        html_content = html_content.replace("__SEO_TITLE__", title)
-        html_content = html_content.replace("__SEO_DESCRIPTION__", description)
-        html_content = html_content.replace("__SEO_FAVICON__", build_url(favicon))
-        html_content = html_content.replace("__SEO_OG_IMAGE__", build_url(og_image))
+            return f"{base_url}{path}"
+
+        # Inject: one join over the pre-split template
+        html_content = index_template.render({
+            "__SEO_TITLE__": title,
+            "__SEO_DESCRIPTION__": description,
+            "__SEO_FAVICON__": build_url(favicon),
+            "__SEO_OG_IMAGE__": build_url(og_image),
+        })
         
-        return Response(content=html_content, media_type="text/html")
+        return 200, html_content
         
     except Exception as e:
         logger.error(f"SEO Injection error: {e}")
-        return Response(status_code=500)
+        return 500, None
 
 # Mount static files
 app.mount("/api/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in (analytics_retention_task, analytics_live_task):
+        if task is not None:
+            task.cancel()
+    # Write out events still waiting in the ingest queue first
+    await analytics_ingest.stop()
+    geoip_country.close()
     client.close()
\ No newline at end of file
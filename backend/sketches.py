@@ -0,0 +1,146 @@
+import base64
+import hashlib
+import math
+import zlib
+
+def hash64(value):
+    """Stable 64-bit hash of a str/bytes value (same across processes)."""
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "big")
+
+class HyperLogLog:
+    """HyperLogLog cardinality sketch over 64-bit hashes.
+
+    2**precision one-byte registers; the standard error is about
+    1.04 / sqrt(2**precision), i.e. ~1.6% at the default precision of 12
+    (4 KiB). Sketches with the same precision merge by taking the
+    register-wise maximum, so daily sketches combine into any range.
+    """
+
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError("register count does not match precision")
+
+    def add_hash(self, h):
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1-bit in the remaining bits
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def to_string(self):
+        # Registers of small pages are mostly zero and compress to a few bytes
+        return base64.b64encode(zlib.compress(bytes(self.registers))).decode("ascii")
+
+    @classmethod
+    def from_string(cls, data, precision=12):
+        return cls(precision, zlib.decompress(base64.b64decode(data)))
+
+class SpaceSaving:
+    """Space-Saving top-k summary with at most `capacity` counters.
+
+    Every key whose true count exceeds total / capacity is guaranteed to be
+    tracked; a tracked count overestimates by at most its recorded error.
+    Summaries merge by adding counters and keeping the largest ones.
+    """
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, key, count=1):
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+            return
+        if len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+            return
+        # Replace the smallest counter; the newcomer inherits its count as error
+        victim = min(counts, key=counts.get)
+        floor = counts.pop(victim)
+        self.errors.pop(victim)
+        counts[key] = floor + count
+        self.errors[key] = floor
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+            self.errors[key] = self.errors.get(key, 0) + other.errors[key]
+        if len(self.counts) > self.capacity:
+            keep = sorted(self.counts, key=self.counts.get, reverse=True)[:self.capacity]
+            self.counts = {key: self.counts[key] for key in keep}
+            self.errors = {key: self.errors[key] for key in keep}
+        return self
+
+    def top(self, k=10):
+        """[(key, count, error)] for the k largest counters."""
+        keys = sorted(self.counts, key=self.counts.get, reverse=True)[:k]
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+    def __len__(self):
+        return len(self.counts)
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` keys at `error_rate`
+    false positives; keys are never reported missing once added."""
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit halves
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        array = self._array
+        return all(array[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        """Set the key's bits; True if they were all set already."""
+        array = self._array
+        seen = True
+        for p in self._positions(key):
+            mask = 1 << (p & 7)
+            if not array[p >> 3] & mask:
+                seen = False
+                array[p >> 3] |= mask
+        return seen
@@ -0,0 +1,483 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+try:
+    from .mock_db import (
+        DEFAULT_INDEXES,
+        AsyncMockAggregateCursor,
+        MockUpdateResult,
+        _is_operator_dict,
+        _regex_prefix,
+        apply_projection,
+        apply_update,
+        index_spec_for,
+        json_database_exists,
+        load_json_database,
+        matches_filter,
+        run_pipeline,
+        upsert_document,
+    )
+except ImportError:
+    from mock_db import (
+        DEFAULT_INDEXES,
+        AsyncMockAggregateCursor,
+        MockUpdateResult,
+        _is_operator_dict,
+        _regex_prefix,
+        apply_projection,
+        apply_update,
+        index_spec_for,
+        json_database_exists,
+        load_json_database,
+        matches_filter,
+        run_pipeline,
+        upsert_document,
+    )
+
+# SQLite-backed driver with the same surface as AsyncMockClient. Every
+# collection is a table holding one JSON document per row; the hot fields
+# from DEFAULT_INDEXES are exposed as generated columns with real indexes.
+# All SQLite calls run on one worker thread per client, and WAL mode plus
+# BEGIN IMMEDIATE writes make the file safe to share between processes
+# (e.g. several uvicorn workers).
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+_SAFE_FIELD = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$")
+_SQL_RANGE_OPS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+def _sql_scalar(value):
+    # Only plain scalars can be compared in SQL; everything else is left to
+    # the Python-side filter
+    return value is None or isinstance(value, (str, int, float, bool))
+
+class AsyncSQLiteCursor:
+    """Mirrors AsyncMockCursor: sort/skip/limit are pushed down into the SQL
+    query and to_list(n) pages through the results like Motor does.
+
+    Unsorted cursors resume after the last rowid they returned, so paging
+    through a whole collection stays linear; sorted ones page by OFFSET.
+    """
+
+    BATCH_SIZE = 100
+
+    def __init__(self, collection, filter_query, projection):
+        self._collection = collection
+        self._filter = filter_query
+        self._projection = projection
+        self._sort: List[tuple] = []
+        self._skip = 0
+        self._limit = None
+        self._emitted = 0
+        self._last_rowid = None
+        self._buffer: List[Dict[str, Any]] = []
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction == -1)]
+        else:
+            # list of tuples [('order', 1), ('created_at', -1)]
+            self._sort = [(key, d == -1) for key, d in key_or_list]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        # Motor treats 0 as "no limit"
+        self._limit = count or None
+        return self
+
+    async def to_list(self, length: Optional[int]):
+        remaining = None if self._limit is None else self._limit - self._emitted
+        if length is not None:
+            remaining = length if remaining is None else min(remaining, length)
+        if remaining is not None and remaining <= 0:
+            return []
+        if self._sort or self._last_rowid is None:
+            offset, after = self._skip + self._emitted, None
+        else:
+            offset, after = 0, self._last_rowid
+        docs, last_rowid = await self._collection._run(
+            self._collection._find_sync, self._filter, self._projection, self._sort,
+            offset, remaining, after,
+        )
+        self._emitted += len(docs)
+        if last_rowid is not None:
+            self._last_rowid = last_rowid
+        return docs
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._buffer:
+            self._buffer = await self.to_list(self.BATCH_SIZE)
+            if not self._buffer:
+                raise StopAsyncIteration
+        return self._buffer.pop(0)
+
+class AsyncSQLiteCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.table = _quote(f"{db.name}__{name}")
+        self._columns = set()
+        self._ready = False
+
+    def _run(self, fn, *args):
+        return self.db.client._run(fn, *args)
+
+    # ----- Schema -----
+
+    def _ensure_table(self, conn):
+        if self._ready:
+            return
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (rowid INTEGER PRIMARY KEY AUTOINCREMENT, doc TEXT NOT NULL)")
+        self._columns = {row[1] for row in conn.execute(f"PRAGMA table_xinfo({self.table})")}
+        spec = index_spec_for(self.db.client.indexes, self.name)
+        for field in spec.get("hash", []) + spec.get("sorted", []):
+            self._ensure_column(conn, field)
+        self._ready = True
+
+    def _ensure_column(self, conn, field):
+        column = f"f_{field}"
+        if column not in self._columns:
+            path = "$." + field
+            try:
+                conn.execute(
+                    f"ALTER TABLE {self.table} ADD COLUMN {_quote(column)} "
+                    f"GENERATED ALWAYS AS (json_extract(doc, '{path}')) VIRTUAL"
+                )
+            except sqlite3.OperationalError as e:
+                # Another process added it first
+                if "duplicate column" not in str(e):
+                    raise
+            self._columns.add(column)
+        index_name = _quote(f"ix_{self.db.name}__{self.name}__{field}")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {self.table} ({_quote(column)})")
+        return column
+
+    def _field_expr(self, field):
+        column = f"f_{field}"
+        if column in self._columns:
+            return _quote(column)
+        return f"json_extract(doc, '$.{field}')"
+
+    def _condition_sql(self, field, expr, condition):
+        """Translate one operator dict; returns (clauses, params, exact)."""
+        clauses, params, exact = [], [], True
+        for op, arg in condition.items():
+            if op == "$in" and all(_sql_scalar(x) for x in arg):
+                values = [x for x in arg if x is not None]
+                parts = []
+                if values:
+                    parts.append(f"{expr} IN ({', '.join('?' * len(values))})")
+                    params.extend(values)
+                if len(values) != len(arg):
+                    parts.append(f"{expr} IS NULL")
+                clauses.append("(" + " OR ".join(parts) + ")" if parts else "0")
+            elif op in _SQL_RANGE_OPS and isinstance(arg, (str, int, float)) and not isinstance(arg, bool):
+                # Keep to the bound's type bracket like matches_filter does
+                types = "('text')" if isinstance(arg, str) else "('integer', 'real')"
+                clauses.append(f"typeof({expr}) IN {types} AND {expr} {_SQL_RANGE_OPS[op]} ?")
+                params.append(arg)
+            elif op == "$regex":
+                options = condition.get("$options", "")
+                prefix = _regex_prefix(arg, options)
+                if prefix:
+                    # Anchored prefix becomes an index-friendly range scan
+                    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                    clauses.append(f"typeof({expr}) = 'text' AND {expr} >= ? AND {expr} < ?")
+                    params.extend([prefix, upper])
+                if prefix is None or arg != "^" + prefix:
+                    exact = False
+            elif op == "$exists":
+                clauses.append(f"json_type(doc, '$.{field}') IS {'NOT ' if arg else ''}NULL")
+            elif op == "$options":
+                continue
+            else:
+                exact = False
+        return clauses, params, exact
+
+    def _where(self, filter_query):
+        """Translate what SQLite can evaluate exactly into a WHERE clause.
+
+        Returns (sql, params, exact). Rows are always re-checked with
+        matches_filter, so untranslated conditions only cost extra rows;
+        exact=True means SQL alone already decides the match.
+        """
+        clauses, params, exact = [], [], True
+        for k, v in filter_query.items():
+            if k == "_id":
+                continue
+            if k.startswith("$") or not _SAFE_FIELD.match(k):
+                exact = False
+                continue
+            expr = self._field_expr(k)
+            if _is_operator_dict(v):
+                parts, values, condition_exact = self._condition_sql(k, expr, v)
+                clauses.extend(parts)
+                params.extend(values)
+                exact = exact and condition_exact
+            elif v is None:
+                clauses.append(f"{expr} IS NULL")
+            elif _sql_scalar(v):
+                clauses.append(f"{expr} = ?")
+                params.append(v)
+            else:
+                exact = False
+        sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return sql, params, exact
+
+    def _select(self, conn, filter_query, sort=None, limit=None, offset=0, after=None):
+        self._ensure_table(conn)
+        where, params, exact = self._where(filter_query)
+        if after is not None:
+            # Keyset continuation of a rowid-ordered scan
+            where += f"{' AND' if where else ' WHERE'} rowid > ?"
+            params = params + [after]
+        order = "rowid"
+        if sort:
+            keys = [f"{self._field_expr(key)} {'DESC' if reverse else 'ASC'}" for key, reverse in sort if "'" not in key]
+            order = ", ".join(keys + ["rowid"])
+        sql = f"SELECT rowid, doc FROM {self.table}{where} ORDER BY {order}"
+        if exact and (limit is not None or offset):
+            sql += f" LIMIT {-1 if limit is None else int(limit)}"
+            if offset:
+                sql += f" OFFSET {int(offset)}"
+            offset = 0
+        rows = conn.execute(sql, params)
+        matched = 0
+        for rowid, raw in rows:
+            doc = json.loads(raw)
+            if exact or matches_filter(doc, filter_query):
+                matched += 1
+                # Offsets that could not be pushed into SQL are applied here
+                if matched > offset:
+                    yield rowid, doc
+
+    # ----- Reads -----
+
+    def create_index(self, keys, **kwargs):
+        field = keys if isinstance(keys, str) else keys[0][0]
+
+        def create(conn):
+            self._ensure_table(conn)
+            self._ensure_column(conn, field)
+            return field
+        return self._run(create)
+
+    async def find_one(self, filter_query, projection=None):
+        def find_one(conn):
+            for _, doc in self._select(conn, filter_query, limit=1):
+                return apply_projection(doc, projection)
+            return None
+        return await self._run(find_one)
+
+    def find(self, filter_query=None, projection=None):
+        return AsyncSQLiteCursor(self, filter_query or {}, projection)
+
+    def _find_sync(self, conn, filter_query, projection, sort, offset, length, after=None):
+        results, last_rowid = [], None
+        for rowid, doc in self._select(conn, filter_query, sort, length, offset, after):
+            results.append(apply_projection(doc, projection))
+            last_rowid = rowid
+            if length is not None and len(results) >= length:
+                break
+        return results, last_rowid
+
+    def aggregate(self, pipeline):
+        pipeline = list(pipeline)
+
+        def aggregate(conn):
+            # The leading $match becomes the SQL prefilter; the remaining
+            # stages run on the worker thread next to the data
+            match = pipeline[0]["$match"] if pipeline and "$match" in pipeline[0] else {}
+            docs = (doc for _, doc in self._select(conn, match))
+            return run_pipeline(docs, pipeline[1:] if match else pipeline)
+
+        return AsyncMockAggregateCursor(lambda: self._run(aggregate))
+
+    async def count_documents(self, filter_query):
+        def count(conn):
+            self._ensure_table(conn)
+            where, params, exact = self._where(filter_query)
+            if exact:
+                return conn.execute(f"SELECT COUNT(*) FROM {self.table}{where}", params).fetchone()[0]
+            return sum(1 for _ in self._select(conn, filter_query))
+        return await self._run(count)
+
+    # ----- Writes -----
+
+    def _write(self, fn):
+        # BEGIN IMMEDIATE takes the write lock up front, so the read-modify-write
+        # cycles below cannot interleave with writers in other processes
+        def run(conn):
+            self._ensure_table(conn)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return self._run(run)
+
+    def _dumps(self, doc):
+        return json.dumps(doc, ensure_ascii=False)
+
+    async def insert_one(self, document):
+        payload = self._dumps(document)
+        await self._write(lambda conn: conn.execute(f"INSERT INTO {self.table} (doc) VALUES (?)", (payload,)))
+        return True
+
+    async def insert_many(self, documents):
+        payloads = [(self._dumps(doc),) for doc in documents]
+        await self._write(lambda conn: conn.executemany(f"INSERT INTO {self.table} (doc) VALUES (?)", payloads))
+        return True
+
+    def _update(self, conn, filter_query, update, multi, upsert=False):
+        matched = modified = 0
+        for rowid, doc in list(self._select(conn, filter_query, limit=None if multi else 1)):
+            matched += 1
+            if apply_update(doc, update) or multi:
+                conn.execute(f"UPDATE {self.table} SET doc = ? WHERE rowid = ?", (self._dumps(doc), rowid))
+                modified += 1
+            if not multi:
+                break
+        result = MockUpdateResult(matched, modified)
+        if upsert and not matched:
+            doc = upsert_document(filter_query, update)
+            conn.execute(f"INSERT INTO {self.table} (doc) VALUES (?)", (self._dumps(doc),))
+            result.upserted_id = doc.get("_id", doc.get("id"))
+        return result
+
+    async def update_one(self, filter_query, update, upsert=False):
+        return await self._write(lambda conn: self._update(conn, filter_query, update, False, upsert))
+
+    async def update_many(self, filter_query, update):
+        return await self._write(lambda conn: self._update(conn, filter_query, update, True))
+
+    def _delete(self, conn, filter_query, multi):
+        rowids = []
+        for rowid, _ in self._select(conn, filter_query, limit=None if multi else 1):
+            rowids.append((rowid,))
+            if not multi:
+                break
+        conn.executemany(f"DELETE FROM {self.table} WHERE rowid = ?", rowids)
+        return len(rowids)
+
+    async def delete_one(self, filter_query):
+        return await self._write(lambda conn: self._delete(conn, filter_query, False)) > 0
+
+    async def delete_many(self, filter_query):
+        return await self._write(lambda conn: self._delete(conn, filter_query, True))
+
+    async def drop(self):
+        def drop(conn):
+            # Dropping the table also drops its indexes; O(1) next to DELETE
+            conn.execute(f"DROP TABLE IF EXISTS {self.table}")
+            self._columns = set()
+            self._ready = False
+        await self._run(drop)
+
+class AsyncSQLiteDatabase:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, AsyncSQLiteCollection] = {}
+
+    def __getitem__(self, name):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = AsyncSQLiteCollection(self, name)
+        return collection
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self):
+        prefix = f"{self.name}__"
+
+        def names(conn):
+            rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            return sorted(row[0][len(prefix):] for row in rows if row[0].startswith(prefix))
+        return await self.client._run(names)
+
+    async def drop_collection(self, name):
+        await self[name].drop()
+
+class AsyncSQLiteClient:
+    """Drop-in replacement for AsyncMockClient backed by a SQLite file.
+
+    ``import_from`` names a JSON mock database that is copied in once when
+    the SQLite file has never been initialized.
+    """
+
+    def __init__(self, filepath="local_db.sqlite3", indexes=None, import_from=None, busy_timeout_ms=5000):
+        self.filepath = filepath
+        self.indexes = DEFAULT_INDEXES if indexes is None else indexes
+        self.busy_timeout_ms = busy_timeout_ms
+        self._databases: Dict[str, AsyncSQLiteDatabase] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-db")
+        self._conn = None
+        self._executor.submit(self._open, import_from).result()
+
+    def _open(self, import_from):
+        # isolation_level=None: transactions are managed explicitly in _write
+        self._conn = sqlite3.connect(self.filepath, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS _meta (key TEXT PRIMARY KEY, value TEXT)")
+        if import_from and json_database_exists(import_from):
+            self._import_json(import_from)
+
+    def _import_json(self, path):
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Checked under the write lock so concurrent workers import only once
+            if conn.execute("SELECT 1 FROM _meta WHERE key = 'imported_from'").fetchone():
+                conn.execute("COMMIT")
+                return
+            for db_name, collections in load_json_database(path).items():
+                for name, documents in collections.items():
+                    collection = self[db_name][name]
+                    collection._ensure_table(conn)
+                    conn.executemany(
+                        f"INSERT INTO {collection.table} (doc) VALUES (?)",
+                        [(json.dumps(doc, ensure_ascii=False),) for doc in documents],
+                    )
+            conn.execute("INSERT INTO _meta (key, value) VALUES ('imported_from', ?)", (os.path.abspath(path),))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, fn, self._conn, *args)
+
+    def __getitem__(self, name):
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = AsyncSQLiteDatabase(self, name)
+        return database
+
+    def close(self):
+        if self._conn is not None:
+            self._executor.submit(self._conn.close).result()
+            self._conn = None
+        self._executor.shutdown(wait=True)
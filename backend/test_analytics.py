@@ -0,0 +1,353 @@
+from datetime import datetime, timezone
+
+from analytics import PageStatsAccumulator, resolve_timezone
+
+
+def test_accumulator_buckets_in_local_time():
+    now = datetime(2026, 3, 10, 12, 30, tzinfo=timezone.utc)
+    stats = PageStatsAccumulator("7d", resolve_timezone("Asia/Almaty"), now=now)
+    stats.add("2026-03-09T20", "view", count=3)   # 01:00 on the 10th in Almaty
+    stats.add("2026-03-09T10", "click", "b1", 2)
+    stats.add("2026-01-01T00", "click", "b2")     # outside the chart, still in totals
+
+    chart = {row["name"]: row for row in stats.chart_data()}
+    assert list(chart)[-1] == "2026-03-10"
+    assert chart["2026-03-10"]["views"] == 3
+    assert chart["2026-03-09"]["clicks"] == 2
+    assert (stats.total_views, stats.total_clicks) == (3, 3)
+    assert stats.top_targets(1) == [("b1", 2)]
+
+
+def test_accumulator_hourly_range():
+    now = datetime(2026, 3, 10, 12, 30, tzinfo=timezone.utc)
+    stats = PageStatsAccumulator("24h", timezone.utc, now=now)
+    stats.add("2026-03-10T12", "view")
+    stats.add("2026-03-09T13", "view")
+    stats.add("2026-03-09T12", "view")            # 24 hours ago: just outside
+    chart = stats.chart_data()
+    assert len(chart) == 24
+    assert (chart[0]["name"], chart[0]["views"]) == ("2026-03-09 13:00", 1)
+    assert chart[-1]["views"] == 1
+    assert resolve_timezone("Not/AZone") is None
+
+
+def test_rollups_match_raw_events_after_backfill(tmp_path):
+    import asyncio
+
+    from analytics import backfill_rollups, rollup_update
+    from mock_db import AsyncMockClient
+
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+    events = [
+        {"page_id": "p1", "event_type": "view", "target_id": None, "timestamp": "2026-03-01T10:05:00+00:00"},
+        {"page_id": "p1", "event_type": "view", "target_id": None, "timestamp": "2026-03-01T10:55:00+00:00"},
+        {"page_id": "p1", "event_type": "click", "target_id": "b1", "timestamp": "2026-03-02T08:00:00+00:00"},
+        {"page_id": "p2", "event_type": "view", "target_id": None, "timestamp": "2026-03-01T12:00:00+00:00"},
+    ]
+
+    async def scenario():
+        # Live increments, as done by track_event
+        for event in events:
+            await db.analytics_v2.insert_one(event)
+            await db.analytics_rollups.update_one(*rollup_update(event), upsert=True)
+        live = await db.analytics_rollups.find({}, {"_id": 0}).sort("id", 1).to_list(None)
+        assert len(live) == 3
+        assert live[0]["count"] == 2 and live[0]["hours"] == {"10": 2}
+
+        # A backfill from the raw events rebuilds exactly the same rollups
+        assert await backfill_rollups(db) == 3
+        rebuilt = await db.analytics_rollups.find({}, {"_id": 0}).sort("id", 1).to_list(None)
+        assert rebuilt == live
+
+    asyncio.run(scenario())
+
+
+def test_ingest_queue_batches_drops_and_drains(tmp_path):
+    import asyncio
+
+    from analytics import AnalyticsIngestQueue
+    from mock_db import AsyncMockClient
+
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    def event(i):
+        return {"id": f"e{i}", "page_id": "p1", "event_type": "view", "target_id": None,
+                "timestamp": "2026-03-01T10:00:00+00:00"}
+
+    async def scenario():
+        queue = AnalyticsIngestQueue(db, max_batch=10, flush_interval=60, max_pending=25)
+        queue.start()
+        assert all(queue.submit(event(i)) for i in range(25))
+        # Full: refused and counted instead of growing the buffer
+        assert queue.submit(event(99)) is False
+        await asyncio.sleep(0.01)
+        # The size trigger flushed without waiting for the interval
+        assert await db.analytics_v2_2026_03.count_documents({}) >= 10
+
+        await queue.stop()
+        assert await db.analytics_v2_2026_03.count_documents({}) == 25
+        rollup = await db.analytics_rollups.find_one({"page_id": "p1"})
+        assert rollup["count"] == 25
+        assert queue.stats()["dropped"] == 1 and queue.stats()["pending"] == 0
+        assert queue.counters["written"] == 25 and queue.counters["batches"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_ingest_queue_counts_unique_visitors(tmp_path):
+    import asyncio
+
+    from analytics import AnalyticsIngestQueue, count_unique_visitors, visitor_key
+    from mock_db import AsyncMockClient
+
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def scenario():
+        queue = AnalyticsIngestQueue(db, max_batch=100)
+        for i in range(300):
+            ip = f"10.0.0.{i % 120}"  # 120 distinct visitors
+            queue.submit({"id": f"e{i}", "page_id": "p1", "event_type": "view", "target_id": None,
+                          "timestamp": "2026-03-01T10:00:00+00:00",
+                          "visitor": visitor_key("secret", ip, "UA", "2026-03-01")})
+        await queue.flush()
+        assert abs(await count_unique_visitors(db, "p1", "2026-03-01") - 120) <= 3
+        assert await count_unique_visitors(db, "p1", "2026-03-02") == 0
+        # Visitor keys are not persisted with the events
+        assert "visitor" not in await db.analytics_v2_2026_03.find_one({})
+
+    asyncio.run(scenario())
+
+
+
+def test_concurrent_visitor_sketch_merges_keep_every_update(tmp_path):
+    import asyncio
+
+    from analytics import AnalyticsIngestQueue, count_unique_visitors, merge_visitor_sketch
+    from sketches import HyperLogLog
+    from sqlite_db import AsyncSQLiteClient
+
+    # SQLite calls run on a worker thread, so the merges really interleave
+    client = AsyncSQLiteClient(str(tmp_path / "db.sqlite3"))
+    db = client["test_db"]
+
+    def sketch_of(worker):
+        sketch = HyperLogLog()
+        for i in range(50):
+            sketch.add_hash(hash(("visitor", worker, i)) & (2 ** 64 - 1))
+        return sketch
+
+    async def scenario():
+        results = await asyncio.gather(*(merge_visitor_sketch(db, "p1", "2026-03-01", sketch_of(w)) for w in range(8)))
+        assert all(results)
+        assert abs(await count_unique_visitors(db, "p1", "2026-03-01") - 400) <= 20
+        assert await db.analytics_visitors.count_documents({}) == 1
+
+        # Visitors of a batch that failed to store are not counted
+        failing = db["analytics_v2_2026_04"]
+
+        async def fail(docs):
+            raise RuntimeError("disk full")
+        failing.insert_many = fail
+        queue = AnalyticsIngestQueue(db)
+        queue.submit({"id": "e1", "page_id": "p1", "event_type": "view", "target_id": None,
+                      "timestamp": "2026-04-01T10:00:00+00:00", "visitor": "ab" * 8})
+        await queue.flush()
+        assert queue.counters["failed"] == 1
+        assert await count_unique_visitors(db, "p1", "2026-04-01") == 0
+
+    asyncio.run(scenario())
+    client.close()
+
+
+def test_retention_downsamples_and_drops_partitions(tmp_path):
+    import asyncio
+
+    from analytics import AnalyticsIngestQueue, apply_retention, raw_event_collections
+    from columnar import ColumnarEventStore
+    from mock_db import AsyncMockClient
+
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+    columnar = ColumnarEventStore()
+    now = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+    days = ["2026-01-20", "2026-02-25", "2026-03-01", "2026-03-09"]
+
+    def totals(rollups):
+        stats = PageStatsAccumulator("90d", timezone.utc, now=now)
+        for rollup in rollups:
+            stats.add_rollup(rollup)
+        return stats.total_views, stats.total_clicks, [row["views"] for row in stats.chart_data()]
+
+    async def scenario():
+        queue = AnalyticsIngestQueue(db, columnar=columnar)
+        for day in days:
+            queue.submit([{"page_id": "p1", "event_type": "view", "target_id": None, "timestamp": f"{day}T{h:02d}:00:00+00:00"}
+                          for h in (3, 15)])
+            queue.submit({"page_id": "p1", "event_type": "click", "target_id": "b1", "timestamp": f"{day}T09:00:00+00:00"})
+        await queue.flush()
+        assert [c.name for c in await raw_event_collections(db)] == [
+            "analytics_v2_2026_01", "analytics_v2_2026_02", "analytics_v2_2026_03"]
+        before = totals(await db.analytics_rollups.find({}).to_list(None))
+
+        # Keep 5 days of raw events: cutoff 2026-03-05
+        result = await apply_retention(db, 5, now=now, columnar=columnar)
+        assert result["cutoff"] == "2026-03-05"
+        assert result["dropped_partitions"] == ["analytics_v2_2026_01", "analytics_v2_2026_02"]
+        assert result["deleted_events"] == 3
+        assert [c.name for c in await raw_event_collections(db)] == ["analytics_v2_2026_03"]
+        assert await db.analytics_v2_2026_03.count_documents({}) == 3
+        assert len(columnar) == 3
+
+        rollups = await db.analytics_rollups.find({}).to_list(None)
+        old = [r for r in rollups if r["day"] < "2026-03-05"]
+        assert old and all("hours" not in r for r in old)
+        assert all("hours" in r for r in rollups if r["day"] >= "2026-03-05")
+        # Daily totals survive downsampling
+        assert totals(rollups) == before
+        # Running it again changes nothing
+        result = await apply_retention(db, 5, now=now, columnar=columnar)
+        assert result["dropped_partitions"] == [] and result["deleted_events"] == 0
+        assert totals(await db.analytics_rollups.find({}).to_list(None)) == before
+
+    asyncio.run(scenario())
+
+
+def test_export_streams_ndjson_csv_and_gzip(tmp_path):
+    import asyncio
+    import csv
+    import gzip
+    import json
+
+    from analytics import export_events
+    from mock_db import AsyncMockClient
+
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def collect(**kwargs):
+        return b"".join([chunk async for chunk in export_events(db, "p1", chunk_size=2, **kwargs)])
+
+    async def scenario():
+        await db.analytics_v2.insert_one({"id": "old", "page_id": "p1", "event_type": "view", "timestamp": "2026-01-05T10:00:00+00:00"})
+        await db.analytics_v2_2026_02.insert_many([
+            {"id": f"e{i}", "page_id": "p1", "event_type": "click", "target_id": "b1",
+             "metadata": {"ref": "x"}, "timestamp": f"2026-02-{i + 1:02d}T10:00:00+00:00"}
+            for i in range(5)
+        ])
+        await db.analytics_v2_2026_02.insert_one({"id": "other", "page_id": "p2", "event_type": "view", "timestamp": "2026-02-01T00:00:00+00:00"})
+
+        rows = [json.loads(line) for line in (await collect()).decode().splitlines()]
+        assert [r["id"] for r in rows] == ["old", "e0", "e1", "e2", "e3", "e4"]
+        assert "page_id" not in rows[0] and rows[1]["metadata"] == {"ref": "x"}
+
+        ranged = await collect(fmt="csv", start="2026-02-02", end="2026-02-04")
+        table = list(csv.reader(ranged.decode().splitlines()))
+        assert table[0] == ["id", "timestamp", "event_type", "target_id", "metadata"]
+        assert [row[0] for row in table[1:]] == ["e1", "e2"]
+        assert json.loads(table[1][4]) == {"ref": "x"}
+
+        packed = await collect(compress=True)
+        assert gzip.decompress(packed) == await collect()
+
+    asyncio.run(scenario())
+
+
+def test_trending_windows_slide(tmp_path):
+    import asyncio
+
+    from analytics import TrendingTracker, rollup_update
+    from mock_db import AsyncMockClient
+
+    now = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+    tracker = TrendingTracker(capacity=20)
+    for minutes_ago, page_id, count in [(10, "fresh", 5), (3 * 60, "today", 8), (3 * 24 * 60, "week", 20)]:
+        epoch = now.timestamp() - minutes_ago * 60
+        for _ in range(count):
+            tracker.add(page_id, "view", None, epoch)
+    tracker.add_events([{"page_id": "fresh", "event_type": "click", "target_id": "b1",
+                         "timestamp": "2026-03-10T11:59:00+00:00"}])
+
+    assert [i["id"] for i in tracker.top("1h", now=now)["pages_by_views"]] == ["fresh"]
+    assert [i["id"] for i in tracker.top("24h", now=now)["pages_by_views"]] == ["today", "fresh"]
+    assert [i["id"] for i in tracker.top("7d", now=now)["pages_by_views"]] == ["week", "today", "fresh"]
+    assert tracker.top("1h", now=now)["blocks_by_clicks"] == [{"id": "b1", "count": 1, "error": 0}]
+    # Eight days later everything has slid out
+    later = datetime(2026, 3, 18, 13, 0, tzinfo=timezone.utc)
+    assert tracker.top("7d", now=later)["pages_by_views"] == []
+
+    # Warm-up from rollups restores the same picture after a restart
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def scenario():
+        event = {"page_id": "today", "event_type": "view", "target_id": None, "timestamp": "2026-03-10T09:30:00+00:00"}
+        await db.analytics_rollups.update_one(*rollup_update(event), upsert=True)
+        warmed = TrendingTracker()
+        await warmed.warm(db, now=now)
+        assert warmed.top("24h", now=now)["pages_by_views"][0]["id"] == "today"
+
+    asyncio.run(scenario())
+
+
+
+def test_sliding_top_k_stays_bounded_without_queries():
+    from analytics import SlidingTopK
+
+    window = SlidingTopK(3600, 12, capacity=5)
+    # Two days of traffic, never read back through top()
+    for minute in range(48 * 60):
+        window.add(f"page-{minute % 7}", 1, minute * 60)
+        assert len(window._summaries) <= 12
+    # Late events older than the window are not resurrected
+    window.add("late", 1, 0)
+    assert len(window._summaries) <= 12
+    assert "late" not in [key for key, _, _ in window.top(10, 48 * 3600)]
+
+
+def test_ingest_filter_drops_bots_and_repeated_views():
+    from analytics import IngestFilter, is_bot_user_agent
+
+    browser = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148 Instagram 300.0"
+    assert not is_bot_user_agent(browser)
+    for agent in ("Googlebot/2.1", "TelegramBot (like TwitterBot)", "curl/8.4.0", "python-requests/2.31", "", None):
+        assert is_bot_user_agent(agent)
+
+    def view(visitor, page_id="p1", event_type="view"):
+        return {"page_id": page_id, "event_type": event_type, "visitor": visitor}
+
+    ingest_filter = IngestFilter(dedup_window=1800, capacity=1000)
+    assert ingest_filter.filter([view("v1")], "Googlebot/2.1", now=0) == []
+    assert len(ingest_filter.filter([view("v1"), view("v2")], browser, now=0)) == 2
+    # Reload within the window: dropped; clicks and other pages still count
+    assert ingest_filter.filter([view("v1")], browser, now=600) == []
+    assert len(ingest_filter.filter([view("v1", event_type="click"), view("v1", "p2")], browser, now=600)) == 2
+    assert ingest_filter.filter([view("v1")], browser, now=1799) == []
+    # Once the window has passed the visitor counts again
+    assert len(ingest_filter.filter([view("v1")], browser, now=1800 * 2 + 1)) == 1
+    assert ingest_filter.stats() == {"passed": 5, "bots": 1, "duplicates": 2}
+
+
+def test_live_counters_only_track_watched_pages():
+    from analytics import LiveCounters
+
+    live = LiveCounters()
+    click = {"page_id": "p1", "event_type": "click", "target_id": "b1"}
+    live.add_events([click])
+    assert live.drain() == {}
+
+    live.watch("p1")
+    live.watch("p1")
+    live.add_events([click, click, {"page_id": "p1", "event_type": "view"}, {"page_id": "p2", "event_type": "view"}])
+    assert live.drain() == {"p1": {"views": 1, "clicks": 2, "targets": {"b1": 2}}}
+    # Drained deltas are not sent twice
+    assert live.drain() == {}
+
+    live.unwatch("p1")
+    live.add_events([click])
+    assert live.drain() == {"p1": {"views": 0, "clicks": 1, "targets": {"b1": 1}}}
+    live.unwatch("p1")
+    live.add_events([click])
+    assert live.drain() == {}
@@ -0,0 +1,44 @@
+def stored_clicks(server, client, page_id):
+    client.portal.call(server.analytics_ingest.flush)
+
+    async def count():
+        total = 0
+        for collection in await server.raw_event_collections(server.db):
+            total += await collection.count_documents({"page_id": page_id, "event_type": "click"})
+        return total
+
+    return client.portal.call(count)
+
+
+def test_batch_counts_accepted_and_rejected_events(server, client, make_owner, browser):
+    page_id = make_owner()["page"]["id"]
+    events = [
+        {"page_id": page_id, "event_type": "click", "target_id": "b1"},
+        {"page_id": page_id, "event_type": "click", "target_id": "b2"},
+        {"page_id": "no-such-page", "event_type": "click"},  # Unknown to page_id_cache
+        {"page_id": page_id},                                # Missing event_type
+        "not an event",
+    ]
+    response = client.post("/api/analytics/batch", json=events, headers=browser)
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok", "accepted": 2, "rejected": 3}
+    assert stored_clicks(server, client, page_id) == 2
+    assert stored_clicks(server, client, "no-such-page") == 0
+
+    # sendBeacon form: {"events": [...]} posted as text/plain
+    response = client.post("/api/analytics/batch", content='{"events": [{"page_id": "%s", "event_type": "click"}]}' % page_id,
+                           headers={**browser, "Content-Type": "text/plain"})
+    assert response.json()["accepted"] == 1
+
+
+def test_batch_rejects_malformed_and_oversized_bodies(server, client, make_owner):
+    page_id = make_owner()["page"]["id"]
+
+    assert client.post("/api/analytics/batch", json=[]).json() == {"status": "ok", "accepted": 0, "rejected": 0}
+    for body in ("not json", '"events"', '{"page_id": "x"}', "42", ""):
+        assert client.post("/api/analytics/batch", content=body).status_code == 400
+
+    limit = server.ANALYTICS_BATCH_MAX_EVENTS
+    events = [{"page_id": page_id, "event_type": "click"}] * (limit + 1)
+    assert client.post("/api/analytics/batch", json=events).status_code == 413
+    assert client.post("/api/analytics/batch", json=events[:limit]).json()["accepted"] == limit
@@ -0,0 +1,148 @@
+import asyncio
+
+from caches import PageIdCache, PagePayloadCache, SingleFlight
+from mock_db import AsyncMockClient
+
+
+class CountingPages:
+    """Wraps a collection to count how often the cache hits the database."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.finds = 0
+
+    def find(self, *args, **kwargs):
+        self.finds += 1
+        return self.collection.find(*args, **kwargs)
+
+
+def test_page_id_cache_answers_from_memory_and_reconciles(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    class Db:
+        pages = CountingPages(db.pages)
+
+    async def scenario():
+        await db.pages.insert_many([{"id": "p1"}, {"id": "p2"}])
+        cache = PageIdCache(Db, reconcile_interval=3600)
+        assert await cache.contains("p1")
+        # Spam ids are rejected without another query
+        for i in range(100):
+            assert not await cache.contains(f"spam-{i}")
+        assert Db.pages.finds == 1
+
+        cache.add("p3")
+        cache.discard("p1")
+        assert await cache.filter_known({"p1", "p2", "p3"}) == {"p2", "p3"}
+
+        # Once stale, the set is rebuilt from the database
+        cache.reconcile_interval = 0
+        assert await cache.contains("p1")
+        assert not await cache.contains("p3")
+        assert Db.pages.finds == 3
+
+    asyncio.run(scenario())
+
+
+
+def test_page_id_cache_keeps_changes_made_during_reconcile(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.pages.insert_many([{"id": "p1"}, {"id": "p2"}])
+        cache = PageIdCache(db, reconcile_interval=3600)
+        await cache.reconcile()
+
+        class SlowPages:
+            # Pages are created and deleted while the scan is running
+            def find(self, *args, **kwargs):
+                async def scan():
+                    async for page in db.pages.find(*args, **kwargs):
+                        cache.add("p3")
+                        cache.discard("p2")
+                        yield page
+                return scan()
+
+        cache.db = type("Db", (), {"pages": SlowPages()})
+        await cache.reconcile()
+        assert await cache.filter_known({"p1", "p2", "p3"}) == {"p1", "p3"}
+        assert cache._scans == []
+
+    asyncio.run(scenario())
+
+
+def test_page_payload_cache_ttl_lru_and_invalidation(monkeypatch):
+    import caches
+
+    clock = [100.0]
+    monkeypatch.setattr(caches.time, "monotonic", lambda: clock[0])
+    cache = PagePayloadCache(ttl=30, max_entries=2)
+
+    cache.set("alice", {"page": "a"})
+    cache.set("bob", {"page": "b"})
+    assert cache.get("alice") == {"page": "a"}
+    # bob is now the least recently used entry
+    cache.set("carol", {"page": "c"})
+    assert cache.get("bob") is None and len(cache) == 2
+
+    clock[0] += 31
+    assert cache.get("alice") is None
+
+    # A load that raced with an invalidation is not stored
+    generation = cache.generation("alice")
+    cache.invalidate("alice")
+    cache.set("alice", {"page": "stale"}, generation)
+    assert cache.get("alice") is None
+    cache.set("alice", {"page": "fresh"}, cache.generation("alice"))
+    assert cache.get("alice") == {"page": "fresh"}
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_page_payload_cache_forgets_generations_with_their_entries():
+    cache = PagePayloadCache(max_entries=2)
+    in_flight = cache.generation("user-0")
+    for i in range(100):
+        cache.invalidate(f"user-{i}")
+        cache.set(f"user-{i}", {"page": i}, cache.generation(f"user-{i}"))
+    assert len(cache._generations) <= 2 and len(cache) == 2
+
+    # A load that started before user-0 was invalidated is still rejected
+    # after its generation was forgotten
+    cache.set("user-0", {"page": "stale"}, in_flight)
+    assert cache.get("user-0") is None
+    cache.set("user-0", {"page": "fresh"}, cache.generation("user-0"))
+    assert cache.get("user-0") == {"page": "fresh"}
+
+
+def test_single_flight_shares_one_computation():
+    flight = SingleFlight()
+    calls = []
+
+    async def load(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if value == "boom":
+            raise ValueError(value)
+        return {"page": value}
+
+    async def scenario():
+        results = await asyncio.gather(*[flight.do("alice", lambda: load("alice")) for _ in range(50)])
+        assert calls == ["alice"] and all(r is results[0] for r in results)
+        assert len(flight) == 0
+
+        # Errors reach every waiter; the next call runs again
+        errors = await asyncio.gather(*[flight.do("x", lambda: load("boom")) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errors) and calls.count("boom") == 1
+        assert await flight.do("alice", lambda: load("alice")) == {"page": "alice"}
+        assert calls.count("alice") == 2
+
+        # A cancelled waiter leaves the shared computation running
+        first = asyncio.ensure_future(flight.do("bob", lambda: load("bob")))
+        second = asyncio.ensure_future(flight.do("bob", lambda: load("bob")))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == {"page": "bob"}
+
+    asyncio.run(scenario())
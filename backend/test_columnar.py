@@ -0,0 +1,74 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from analytics import PageStatsAccumulator
+from columnar import ColumnarEventStore
+
+
+def make_events(n, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    events = []
+    for i in range(n):
+        clicked = rng.random() < 0.3
+        events.append({
+            "id": f"e{i}",
+            "page_id": rng.choice(["p1", "p2", "p3"]),
+            "event_type": "click" if clicked else "view",
+            "target_id": rng.choice(["b1", "b2", "b3"]) if clicked else None,
+            "metadata": None,
+            "timestamp": (start + timedelta(seconds=rng.randrange(10 * 86400))).isoformat(),
+        })
+    return events
+
+
+def test_columnar_stats_match_row_by_row_counts():
+    events = make_events(5000)
+    store = ColumnarEventStore.from_documents(events)
+    now = datetime(2026, 3, 10, 12, tzinfo=timezone.utc)
+
+    columnar = PageStatsAccumulator("7d", timezone.utc, now=now)
+    columnar.add_columnar(store.page_stats("p1", columnar.bucket_edges()))
+
+    rows = PageStatsAccumulator("7d", timezone.utc, now=now)
+    for e in events:
+        if e["page_id"] == "p1":
+            rows.add(e["timestamp"][:13], e["event_type"], e["target_id"])
+
+    assert columnar.chart_data() == rows.chart_data()
+    assert (columnar.total_views, columnar.total_clicks) == (rows.total_views, rows.total_clicks)
+    assert columnar.click_counts == rows.click_counts
+    assert store.count(page_id="missing") == 0
+
+
+def test_page_index_follows_appends_and_retention():
+    events = make_events(3000)
+    store = ColumnarEventStore(capacity=16)
+    for event in events[:1000]:
+        store.append(event)
+    store.extend(events[1000:2000])
+    cutoff = int(datetime(2026, 3, 5, tzinfo=timezone.utc).timestamp())
+    store.drop_before(cutoff)
+    store.extend(events[2000:])
+
+    edges = [cutoff, cutoff + 10 * 86400]
+    for page_id in ("p1", "p2", "p3", "missing"):
+        stats = store.page_stats(page_id, edges, since=cutoff + 86400)
+        since = store.mask(page_id=page_id, start=cutoff + 86400)
+        assert stats["total_views"] + stats["total_clicks"] == int(since.sum())
+        assert list(store.page_rows(page_id)) == list(store.mask(page_id=page_id).nonzero()[0])
+
+
+def test_columnar_store_is_at_least_5x_smaller_than_json():
+    events = make_events(20000)
+    store = ColumnarEventStore()
+    for chunk in range(0, len(events), 1000):
+        store.extend(events[chunk:chunk + 1000])
+    assert len(store) == len(events)
+    # nbytes covers every allocated buffer, growth slack and page index included
+    allocated = sum(v.nbytes for v in vars(store).values() if hasattr(v, "nbytes"))
+    allocated += sum(buffer.nbytes for buffer, _ in store._page_rows.values())
+    assert store.nbytes == allocated
+    json_bytes = len(json.dumps(events))
+    assert json_bytes / store.nbytes >= 5
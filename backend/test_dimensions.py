@@ -0,0 +1,82 @@
+import asyncio
+
+from analytics import AnalyticsIngestQueue
+from dimensions import (
+    GeoIPCountry, device_class, dimension_breakdowns, event_dimensions, increment_cubes, referrer_source,
+)
+from mock_db import AsyncMockClient
+
+IPHONE = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148"
+ANDROID_TABLET = "Mozilla/5.0 (Linux; Android 13; SM-X200) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"
+DESKTOP = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"
+
+
+def test_event_dimensions_parse_referrer_utm_and_device():
+    assert referrer_source("https://www.Google.com/search?q=x") == "google.com"
+    assert referrer_source("") == "direct" and referrer_source(None) == "direct"
+    assert [device_class(ua) for ua in (IPHONE, ANDROID_TABLET, DESKTOP, None)] == ["mobile", "tablet", "desktop", "unknown"]
+
+    dims = event_dimensions(
+        {"referrer": "https://t.co/abc", "query": "?utm_source=twitter&utm_campaign=launch&x=1"}, IPHONE, "KZ"
+    )
+    assert dims == {"referrer": "t.co", "device": "mobile", "country": "KZ",
+                    "utm_source": "twitter", "utm_campaign": "launch"}
+    assert event_dimensions(None, DESKTOP)["country"] == "unknown"
+    # Client-supplied values are normalised before they become cube keys
+    assert referrer_source("https://<script>/") == "other"
+    assert event_dimensions({"utm_source": "  Twitter\n"}, DESKTOP, "not-a-code") == {
+        "referrer": "direct", "device": "desktop", "country": "unknown", "utm_source": "twitter"}
+    # Without the maxminddb package or a database file lookups are disabled
+    assert GeoIPCountry(None).country("8.8.8.8") is None
+
+
+def test_cubes_are_counted_at_ingest_and_summed_per_range(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    def view(day, referrer, ua):
+        return {"page_id": "p1", "event_type": "view", "target_id": None, "timestamp": f"{day}T10:00:00+00:00",
+                "dims": event_dimensions({"referrer": referrer}, ua)}
+
+    async def scenario():
+        queue = AnalyticsIngestQueue(db)
+        queue.submit([
+            view("2026-03-01", "https://google.com/", DESKTOP),
+            view("2026-03-02", "https://google.com/", IPHONE),
+            view("2026-03-02", "https://google.com/", IPHONE),
+            view("2026-03-02", None, IPHONE),
+        ])
+        await queue.flush()
+        # One small document per page, day and dimension
+        assert await db.analytics_dimensions.count_documents({}) == 2 * 3
+        # Dimension values only live in the cubes, not in the raw events
+        assert await db.analytics_v2_2026_03.count_documents({}) == 4
+        assert await db.analytics_v2_2026_03.count_documents({"dims": {"$exists": True}}) == 0
+
+        week = await dimension_breakdowns(db, "p1", "2026-03-01")
+        assert week["referrer"] == [{"value": "google.com", "count": 3}, {"value": "direct", "count": 1}]
+        assert week["device"][0] == {"value": "mobile", "count": 3}
+        assert week["utm_source"] == []
+        day = await dimension_breakdowns(db, "p1", "2026-03-02")
+        assert day["referrer"][0] == {"value": "google.com", "count": 2}
+
+    asyncio.run(scenario())
+
+
+def test_cube_documents_cap_distinct_values(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    def view(referrer):
+        return {"page_id": "p1", "timestamp": "2026-03-01T10:00:00+00:00", "dims": {"referrer": referrer}}
+
+    async def scenario():
+        await increment_cubes(db, [view(f"site{i}.com") for i in range(5)], max_values=3)
+        await increment_cubes(db, [view("site0.com"), view("new.com")], max_values=3)
+        cube = await db.analytics_dimensions.find_one({"id": "p1:2026-03-01:referrer"})
+        assert len(cube["counts"]) == 4
+        breakdown = (await dimension_breakdowns(db, "p1", "2026-03-01"))["referrer"]
+        assert breakdown[0] == {"value": "other", "count": 3}
+        assert {"value": "site0.com", "count": 2} in breakdown
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import os
+
+from html_template import SeoTemplate
+
+
+def test_seo_template_renders_with_one_join_and_reloads_on_mtime(tmp_path, monkeypatch):
+    import html_template
+
+    index = tmp_path / "index.html"
+    index.write_text("<title>__SEO_TITLE__</title><meta content=\"__SEO_TITLE__\">__SEO_OTHER__", encoding="utf-8")
+    clock = [100.0]
+    monkeypatch.setattr(html_template.time, "monotonic", lambda: clock[0])
+    template = SeoTemplate([tmp_path / "missing.html", index], check_interval=5)
+
+    assert template.available and template.path == index
+    # Every occurrence is filled; unknown placeholders stay as they were
+    assert template.render({"__SEO_TITLE__": "Hi"}) == '<title>Hi</title><meta content="Hi">__SEO_OTHER__'
+
+    index.write_text("<b>__SEO_TITLE__</b>", encoding="utf-8")
+    os.utime(index, ns=(1, 10**18))
+    stats = []
+    real_stat = html_template.os.stat
+    monkeypatch.setattr(html_template.os, "stat", lambda path: stats.append(path) or real_stat(path))
+    # Within the check interval the hot path never touches the disk
+    assert template.available and template.render({"__SEO_TITLE__": "Hi"}).startswith("<title>")
+    assert stats == []
+
+    clock[0] += 5
+    assert template.available and template.render({"__SEO_TITLE__": "Hi"}) == "<b>Hi</b>"
+
+    index.unlink()
+    clock[0] += 5
+    assert not template.available
@@ -0,0 +1,32 @@
+def test_only_the_owner_can_subscribe_to_live_analytics(server, client, make_owner):
+    owner, stranger = make_owner(), make_owner()
+    username = owner["page"]["username"]
+
+    with client.websocket_connect(f"/ws/{username}") as websocket:
+        websocket.send_json({"type": "subscribe_analytics", "token": stranger["token"]})
+        assert websocket.receive_json()["type"] == "analytics_error"
+        websocket.send_json({"type": "subscribe_analytics"})
+        assert websocket.receive_json()["type"] == "analytics_error"
+        assert owner["page"]["id"] not in server.manager.analytics_subscribers
+
+
+def test_owner_receives_deltas_until_disconnect(server, client, make_owner, browser):
+    owner = make_owner()
+    page_id = owner["page"]["id"]
+
+    with client.websocket_connect(f"/ws/{owner['page']['username']}") as websocket:
+        websocket.send_json({"type": "subscribe_analytics", "token": owner["token"]})
+        assert websocket.receive_json() == {"type": "analytics_subscribed"}
+
+        response = client.post("/api/analytics/track", json={"page_id": page_id, "event_type": "click", "target_id": "b1"},
+                               headers=browser)
+        assert response.status_code == 200
+        # Pushed by the live loop once the ingest queue has written the event
+        message = websocket.receive_json()
+        assert message["type"] == "analytics_delta"
+        assert message["data"]["clicks"] == 1 and message["data"]["targets"] == {"b1": 1}
+
+    # Closing the socket unsubscribes it and stops counting for the page
+    assert page_id not in server.manager.analytics_subscribers
+    assert not any(p == page_id for p in server.manager.analytics_pages.values())
+    assert page_id not in server.analytics_live._watchers
@@ -0,0 +1,327 @@
+import asyncio
+import json
+
+import pytest
+
+from mock_db import AsyncMockClient
+
+
+def test_journal_replays_mutations_after_crash(tmp_path):
+    path = str(tmp_path / "db.json")
+
+    async def scenario():
+        client = AsyncMockClient(path, storage="journal", compact_every=100, durability="fsync")
+        db = client["test_db"]
+        await db.pages.insert_one({"id": "p1", "tags": []})
+        await db.pages.insert_many([{"id": "p2"}, {"id": "p3"}])
+        await db.pages.update_one({"id": "p1"}, {"$push": {"tags": "a"}})
+        await db.pages.delete_one({"id": "p2"})
+        # No close(): the journal is the only record of these writes
+        client.flush()
+        return client.data
+
+    data = asyncio.run(scenario())
+    reopened = AsyncMockClient(path, storage="journal")
+    assert reopened.data == data
+    assert reopened.data["test_db"]["pages"] == [{"id": "p1", "tags": ["a"]}, {"id": "p3"}]
+
+
+@pytest.mark.parametrize("storage", ["journal", "sharded"])
+def test_failed_journal_append_is_rewritten_not_lost(tmp_path, storage):
+    path = str(tmp_path / "db.json")
+    # Long group window: flushes happen only when the test asks for them
+    client = AsyncMockClient(path, storage=storage, group_commit_ms=60000)
+    append = client._append_journal
+    calls = []
+
+    def flaky_append(key, lines):
+        calls.append(key)
+        if len(calls) == 1:
+            raise OSError(28, "No space left on device")
+        append(key, lines)
+
+    client._append_journal = flaky_append
+    users = client["test_db"].users
+
+    asyncio.run(users.insert_one({"id": "a"}))
+    with pytest.raises(OSError):
+        client.flush()
+    asyncio.run(users.insert_one({"id": "b"}))
+    asyncio.run(users.update_one({"id": "a"}, {"$set": {"v": 2}}))
+    client.flush()
+    client._writer.stop()
+
+    # Crash here: no close(), whatever is on disk must be complete
+    reopened = AsyncMockClient(path, storage=storage, durability="shutdown")
+    docs = asyncio.run(reopened["test_db"].users.find({}, {"_id": 0}).to_list(None))
+    assert docs == [{"id": "a", "v": 2}, {"id": "b"}]
+
+
+def test_journal_replay_stops_at_a_sequence_gap(tmp_path):
+    path = tmp_path / "db.json"
+    entries = [
+        {"seq": 1, "db": "test_db", "c": "users", "op": "insert", "args": [{"id": "a"}]},
+        {"seq": 3, "db": "test_db", "c": "users", "op": "insert", "args": [{"id": "c"}]},
+    ]
+    (tmp_path / "db.json.journal").write_text("".join(json.dumps(e) + "\n" for e in entries))
+    client = AsyncMockClient(str(path), storage="journal", durability="shutdown")
+    assert asyncio.run(client["test_db"].users.find({}, {"_id": 0}).to_list(None)) == [{"id": "a"}]
+
+
+def test_journal_compaction_is_not_replayed_twice(tmp_path):
+    path = str(tmp_path / "db.json")
+
+    async def scenario():
+        client = AsyncMockClient(path, storage="journal", compact_every=2)
+        db = client["test_db"]
+        await db.events.insert_one({"id": 1})
+        await db.events.insert_one({"id": 2})
+        client.flush()  # compaction threshold reached
+        await db.events.insert_one({"id": 3})
+        client.flush()
+
+    asyncio.run(scenario())
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)["test_db"]["events"]) == 2
+
+    # Simulate a crash between writing the snapshot and truncating the journal
+    with open(f"{path}.journal", "w", encoding="utf-8") as f:
+        for seq, doc_id in [(1, 1), (2, 2), (3, 3)]:
+            f.write(json.dumps({"seq": seq, "db": "test_db", "c": "events", "op": "insert", "args": [{"id": doc_id}]}) + "\n")
+
+    reopened = AsyncMockClient(path, storage="journal")
+    assert [e["id"] for e in reopened.data["test_db"]["events"]] == [1, 2, 3]
+
+
+def test_indexes_follow_updates_and_deletes(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.pages.insert_many([
+            {"id": "p1", "username": "alpha", "user_id": "u1"},
+            {"id": "p2", "username": "beta", "user_id": "u1"},
+            {"id": "p3", "username": "gamma", "user_id": "u2"},
+        ])
+        await db.pages.update_one({"id": "p1"}, {"$set": {"username": "delta"}})
+        assert await db.pages.find_one({"username": "alpha"}) is None
+        assert (await db.pages.find_one({"username": "delta"}))["id"] == "p1"
+
+        await db.pages.delete_many({"user_id": "u2"})
+        assert await db.pages.find_one({"id": "p3"}) is None
+
+        # Index hits come back in insertion order, like a full scan would
+        hits = await db.pages.find({"id": {"$in": ["p2", "p1"]}}).to_list(None)
+        assert [p["id"] for p in hits] == ["p1", "p2"]
+        assert await db.pages.count_documents({"user_id": "u1"}) == 2
+
+        # delete_one finds the document's slot through its insertion seq
+        await db.blocks.insert_many([{"id": f"b{i}", "page_id": "p1"} for i in range(50)])
+        for i in (0, 49, 25, 26, 10):
+            assert await db.blocks.delete_one({"id": f"b{i}"})
+        await db.blocks.insert_one({"id": "b50", "page_id": "p1"})
+        assert await db.blocks.delete_one({"id": "b24"})
+        remaining = [b["id"] for b in await db.blocks.find({}).to_list(None)]
+        assert remaining == [f"b{i}" for i in range(51) if i not in (0, 10, 24, 25, 26, 49)]
+
+    asyncio.run(scenario())
+
+
+def test_returned_documents_do_not_alias_storage(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.users.insert_one({"id": "u1", "email": "a@example.com"})
+        user = await db.users.find_one({"id": "u1"})
+        user["email"] = "changed@example.com"
+        assert await db.users.find_one({"email": "a@example.com"}) is not None
+
+    asyncio.run(scenario())
+
+
+def test_group_commit_coalesces_writes_off_the_caller(tmp_path):
+    path = str(tmp_path / "db.json")
+    client = AsyncMockClient(path, storage="journal", durability="group", group_commit_ms=1000)
+    db = client["test_db"]
+
+    async def scenario():
+        for i in range(50):
+            await db.analytics_v2.insert_one({"id": i, "page_id": "p1"})
+        # The handler already sees its writes; nothing has reached disk yet
+        assert await db.analytics_v2.count_documents({"page_id": "p1"}) == 50
+
+    asyncio.run(scenario())
+    journal = tmp_path / "db.json.journal"
+    assert not journal.exists() or journal.read_text() == ""
+
+    client.flush()
+    assert len(journal.read_text().splitlines()) == 50
+    client.close()
+
+
+def test_shutdown_durability_writes_only_on_close(tmp_path):
+    path = tmp_path / "db.json"
+    client = AsyncMockClient(str(path), storage="journal", durability="shutdown")
+    asyncio.run(client["test_db"].users.insert_one({"id": "u1"}))
+    assert not path.exists()
+
+    client.close()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["test_db"]["users"] == [{"id": "u1"}]
+
+
+def test_sharded_storage_writes_only_dirty_collections(tmp_path):
+    path = str(tmp_path / "db.json")
+    client = AsyncMockClient(path, storage="sharded", durability="fsync")
+    db = client["test_db"]
+
+    async def scenario():
+        await db.analytics_v2.insert_many([{"id": i, "page_id": "p1"} for i in range(100)])
+        await db.support_qa.insert_one({"id": "q1", "category": "blocks"})
+
+    asyncio.run(scenario())
+    client.close()
+    shard_dir = tmp_path / "db.json.d" / "test_db"
+    analytics_mtime = (shard_dir / "analytics_v2.json").stat().st_mtime_ns
+
+    reopened = AsyncMockClient(path, storage="sharded", durability="fsync")
+    # Nothing is read until a collection is touched
+    assert reopened.data == {}
+    asyncio.run(reopened["test_db"].support_qa.update_one({"id": "q1"}, {"$set": {"category": "faq"}}))
+    reopened.flush()
+    assert "analytics_v2" not in reopened["test_db"].data
+    assert (shard_dir / "analytics_v2.json").stat().st_mtime_ns == analytics_mtime
+    assert "faq" in (shard_dir / "support_qa.journal").read_text()
+    assert asyncio.run(reopened["test_db"].analytics_v2.count_documents({"page_id": "p1"})) == 100
+    reopened.close()
+
+
+def test_drop_collection_removes_shard_and_journal(tmp_path):
+    path = str(tmp_path / "db.json")
+
+    async def scenario(storage):
+        client = AsyncMockClient(path + storage, storage=storage, durability="fsync")
+        db = client["test_db"]
+        await db.analytics_v2_2026_01.insert_many([{"id": i, "page_id": "p1"} for i in range(10)])
+        await db.analytics_v2_2026_02.insert_one({"id": "x", "page_id": "p1"})
+        client.flush()
+        assert "analytics_v2_2026_01" in await db.list_collection_names()
+        await db.drop_collection("analytics_v2_2026_01")
+        assert "analytics_v2_2026_01" not in await db.list_collection_names()
+        client.close()
+
+        reopened = AsyncMockClient(path + storage, storage=storage, durability="fsync")
+        names = await reopened["test_db"].list_collection_names()
+        assert "analytics_v2_2026_01" not in names and "analytics_v2_2026_02" in names
+        assert await reopened["test_db"].analytics_v2_2026_01.count_documents({}) == 0
+        reopened.close()
+
+    asyncio.run(scenario("sharded"))
+    asyncio.run(scenario("journal"))
+    assert not (tmp_path / "db.jsonsharded.d" / "test_db" / "analytics_v2_2026_01.json").exists()
+
+
+def test_sharded_storage_migrates_legacy_file(tmp_path):
+    from mock_db import load_json_database
+    from sqlite_db import AsyncSQLiteClient
+
+    path = tmp_path / "db.json"
+    path.write_text(json.dumps({"test_db": {"users": [{"id": "u1"}], "pages": [{"id": "p1"}]}}))
+
+    client = AsyncMockClient(str(path), storage="sharded", durability="fsync")
+    assert asyncio.run(client["test_db"].users.find_one({"id": "u1"})) == {"id": "u1"}
+    assert (tmp_path / "db.json.d" / "test_db" / "pages.json").exists()
+    asyncio.run(client["test_db"].users.insert_one({"id": "u2"}))
+    client.close()
+
+    # The stale single file is gone, so nothing can read or import it by mistake
+    assert not path.exists() and (tmp_path / "db.json.migrated").exists()
+    assert [u["id"] for u in load_json_database(str(path))["test_db"]["users"]] == ["u1", "u2"]
+    sqlite = AsyncSQLiteClient(str(tmp_path / "db.sqlite3"), import_from=str(path))
+    assert asyncio.run(sqlite["test_db"].users.count_documents({})) == 2
+    sqlite.close()
+
+
+def test_cursor_pages_through_sorted_results(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.notifications.insert_many(
+            [{"id": f"n{i}", "user_id": "u1", "created_at": f"2026-01-{i + 1:02d}"} for i in range(20)]
+        )
+        cursor = db.notifications.find({"user_id": "u1"}, {"_id": 0, "id": 1}).sort("created_at", -1)
+        first = await cursor.to_list(5)
+        second = await cursor.to_list(5)
+        assert [n["id"] for n in first] == ["n19", "n18", "n17", "n16", "n15"]
+        assert [n["id"] for n in second] == ["n14", "n13", "n12", "n11", "n10"]
+
+        page = await db.notifications.find({}).sort("created_at", 1).skip(3).limit(2).to_list(None)
+        assert [n["id"] for n in page] == ["n3", "n4"]
+        assert [n["id"] async for n in db.notifications.find({"id": {"$in": ["n1", "n2"]}})] == ["n1", "n2"]
+
+    asyncio.run(scenario())
+
+
+def test_aggregate_groups_by_truncated_day(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.analytics_v2.insert_many([
+            {"page_id": "p1", "event_type": "view", "timestamp": "2026-03-01T10:00:00+00:00"},
+            {"page_id": "p1", "event_type": "view", "timestamp": "2026-03-01T23:30:00+00:00"},
+            {"page_id": "p1", "event_type": "click", "timestamp": "2026-03-02T08:00:00+00:00"},
+            {"page_id": "p2", "event_type": "view", "timestamp": "2026-03-01T12:00:00+00:00"},
+        ])
+        rows = await db.analytics_v2.aggregate([
+            {"$match": {"page_id": "p1"}},
+            {"$group": {
+                "_id": {"day": {"$dateTrunc": {"date": {"$toDate": "$timestamp"}, "unit": "day"}}, "type": "$event_type"},
+                "count": {"$sum": 1},
+            }},
+            {"$project": {"_id": 0, "day": {"$dateToString": {"date": "$_id.day", "format": "%Y-%m-%d"}}, "count": 1}},
+            {"$sort": {"day": 1}},
+            {"$limit": 5},
+        ]).to_list(None)
+        assert rows == [{"count": 2, "day": "2026-03-01"}, {"count": 1, "day": "2026-03-02"}]
+
+        # Timezone-aware truncation moves the late view into the next local day
+        rows = await db.analytics_v2.aggregate([
+            {"$match": {"page_id": "p1", "event_type": "view"}},
+            {"$group": {"_id": {"$dateToString": {"date": "$timestamp", "format": "%Y-%m-%d", "timezone": "Asia/Almaty"}},
+                        "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ]).to_list(None)
+        assert [(r["_id"], r["count"]) for r in rows] == [("2026-03-01", 1), ("2026-03-02", 1)]
+
+    asyncio.run(scenario())
+
+
+def test_query_operators_and_range_index_use(tmp_path):
+    client = AsyncMockClient(str(tmp_path / "db.json"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.analytics_v2.insert_many(
+            [{"id": f"e{i}", "page_id": "p1", "event_type": "view" if i % 2 else "click",
+              "timestamp": f"2026-03-{i + 1:02d}T12:00:00+00:00", "metadata": {"ref": "google" if i < 3 else None}}
+             for i in range(10)]
+        )
+        window = {"timestamp": {"$gte": "2026-03-03", "$lt": "2026-03-06"}}
+        assert [e["id"] for e in await db.analytics_v2.find(window).to_list(None)] == ["e2", "e3", "e4"]
+        # Only the rows inside the range are visited
+        assert len(db.analytics_v2._candidates(window)) == 3
+        assert len(db.analytics_v2._candidates({"timestamp": {"$regex": "^2026-03-1"}})) == 1
+        assert len(db.analytics_v2._candidates({"timestamp": {"$gt": 5}})) == 0
+
+        assert await db.analytics_v2.count_documents({"timestamp": {"$regex": "^2026-03-0[1-3]"}}) == 3
+        assert await db.analytics_v2.count_documents({"metadata.ref": "google"}) == 3
+        assert await db.analytics_v2.count_documents({"metadata.ref": {"$ne": "google"}}) == 7
+        assert await db.analytics_v2.count_documents({"metadata.missing": {"$exists": False}}) == 10
+        assert await db.analytics_v2.count_documents({"event_type": {"$nin": ["click"]}}) == 5
+        assert await db.analytics_v2.count_documents(
+            {"$or": [{"id": "e0"}, {"id": "e9"}], "$and": [{"event_type": "view"}]}) == 1
+
+    asyncio.run(scenario())
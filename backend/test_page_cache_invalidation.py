@@ -0,0 +1,17 @@
+def test_block_and_page_edits_invalidate_cached_public_payload(server, client, make_owner):
+    owner = make_owner()
+    username = owner["page"]["username"]
+
+    assert client.get(f"/api/pages/{username}").json()["blocks"][0]["content"] == {"text": "before"}
+    hits = server.page_cache.hits
+    assert client.get(f"/api/pages/{username}").status_code == 200
+    assert server.page_cache.hits == hits + 1
+
+    response = client.patch(f"/api/blocks/{owner['block']['id']}", json={"content": {"text": "after"}},
+                            headers=owner["headers"])
+    assert response.status_code == 200
+    assert client.get(f"/api/pages/{username}").json()["blocks"][0]["content"] == {"text": "after"}
+
+    response = client.patch(f"/api/pages/{owner['page']['id']}", json={"bio": "new bio"}, headers=owner["headers"])
+    assert response.status_code == 200
+    assert client.get(f"/api/pages/{username}").json()["page"]["bio"] == "new bio"
@@ -0,0 +1,60 @@
+import random
+
+from sketches import BloomFilter, HyperLogLog, SpaceSaving
+
+
+def test_hyperloglog_accuracy_against_exact_counts():
+    rng = random.Random(42)
+    for exact in (50, 1000, 20000, 200000):
+        sketch = HyperLogLog()
+        visitors = [f"visitor-{rng.getrandbits(64)}" for _ in range(exact)]
+        # Repeat visits must not be counted again
+        for visitor in visitors + visitors[: exact // 2]:
+            sketch.add(visitor)
+        assert abs(sketch.count() - exact) / exact < 0.05, (exact, sketch.count())
+
+
+def test_hyperloglog_daily_sketches_merge_into_ranges():
+    days = [HyperLogLog() for _ in range(7)]
+    union = HyperLogLog()
+    seen = set()
+    for day, sketch in enumerate(days):
+        # Overlapping visitor sets across days
+        for i in range(day * 500, day * 500 + 2000):
+            sketch.add(f"v{i}")
+            union.add(f"v{i}")
+            seen.add(i)
+
+    week = HyperLogLog()
+    for sketch in days:
+        week.merge(HyperLogLog.from_string(sketch.to_string()))
+    assert week.registers == union.registers
+    assert abs(week.count() - len(seen)) / len(seen) < 0.05
+    # Memory stays fixed however many visitors were added
+    assert len(week.registers) == 4096
+
+
+def test_space_saving_keeps_heavy_hitters():
+    summary = SpaceSaving(capacity=10)
+    for i in range(2000):
+        summary.add("hot" if i % 4 == 0 else f"cold{i}")
+    summary.add("warm", 300)
+    top = summary.top(2)
+    assert [key for key, _, _ in top] == ["hot", "warm"]
+    # Overestimates are bounded by the recorded error
+    key, count, error = top[0]
+    assert count - error <= 500 <= count
+
+    other = SpaceSaving(capacity=10)
+    other.add("warm", 400)
+    merged = summary.merge(other)
+    assert merged.top(1)[0][0] == "warm" and len(merged) <= 10
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    # add() reports earlier keys; new ones only through false positives
+    assert sum(bloom.add(f"k{i}") for i in range(5000)) < 50
+    assert all(f"k{i}" in bloom for i in range(5000))
+    false_positives = sum(f"other{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
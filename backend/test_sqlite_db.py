@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+from sqlite_db import AsyncSQLiteClient
+
+
+def test_sqlite_driver_matches_mock_surface(tmp_path):
+    client = AsyncSQLiteClient(str(tmp_path / "db.sqlite3"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.blocks.insert_many([
+            {"id": "b1", "page_id": "p1", "order": 2, "content": {"title": "Second"}},
+            {"id": "b2", "page_id": "p1", "order": 1, "content": {"title": "First"}},
+            {"id": "b3", "page_id": "p2", "order": 0, "content": {}},
+        ])
+        blocks = await db.blocks.find({"page_id": "p1"}, {"_id": 0}).sort("order", 1).to_list(100)
+        assert [b["id"] for b in blocks] == ["b2", "b1"]
+        assert await db.blocks.count_documents({"id": {"$in": ["b1", "b3", "missing"]}}) == 2
+
+        await db.users.insert_one({"id": "u1", "leads": []})
+        result = await db.users.update_one({"id": "u1"}, {"$push": {"leads": {"id": "l1", "status": "new"}}})
+        assert result.modified_count == 1
+        await db.users.update_one({"id": "u1"}, {"$pull": {"leads": {"id": "l1"}}})
+        assert (await db.users.find_one({"id": "u1"}, {"_id": 0, "leads": 1})) == {"leads": []}
+
+        assert await db.blocks.delete_one({"id": "b3"}) is True
+        assert await db.blocks.delete_many({"page_id": "p1"}) == 2
+        assert await db.blocks.find_one({}) is None
+
+    asyncio.run(scenario())
+    client.close()
+
+
+def test_sqlite_driver_is_shared_between_clients(tmp_path):
+    path = str(tmp_path / "db.sqlite3")
+    legacy = tmp_path / "local_db.json"
+    legacy.write_text(json.dumps({"test_db": {"pages": [{"id": "p1", "username": "alpha"}]}}))
+
+    first = AsyncSQLiteClient(path, import_from=str(legacy))
+    second = AsyncSQLiteClient(path, import_from=str(legacy))
+
+    async def scenario():
+        # Imported exactly once even though both clients were pointed at it
+        assert await second["test_db"].pages.count_documents({}) == 1
+        await first["test_db"].pages.update_one({"id": "p1"}, {"$set": {"username": "beta"}})
+        page = await second["test_db"].pages.find_one({"username": "beta"})
+        assert page["id"] == "p1"
+
+    asyncio.run(scenario())
+    first.close()
+    second.close()
+
+
+def test_sqlite_cursor_pages_through_sorted_results(tmp_path):
+    client = AsyncSQLiteClient(str(tmp_path / "db.sqlite3"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.notifications.insert_many(
+            [{"id": f"n{i}", "user_id": "u1", "created_at": f"2026-01-{i + 1:02d}"} for i in range(20)]
+        )
+        cursor = db.notifications.find({"user_id": "u1"}, {"_id": 0, "id": 1}).sort("created_at", -1)
+        assert [n["id"] for n in await cursor.to_list(2)] == ["n19", "n18"]
+        assert [n["id"] for n in await cursor.to_list(2)] == ["n17", "n16"]
+
+        page = await db.notifications.find({}).sort("created_at", 1).skip(3).limit(2).to_list(None)
+        assert [n["id"] for n in page] == ["n3", "n4"]
+        assert len([n async for n in db.notifications.find({})]) == 20
+
+    asyncio.run(scenario())
+    client.close()
+
+
+
+def test_sqlite_cursor_resumes_unsorted_scans_by_rowid(tmp_path):
+    client = AsyncSQLiteClient(str(tmp_path / "db.sqlite3"))
+    db = client["test_db"]
+    statements = []
+    client._conn.set_trace_callback(statements.append)
+
+    async def scenario():
+        await db.analytics_v2.insert_many([{"id": f"e{i}", "page_id": "p1" if i % 2 else "p2"} for i in range(50)])
+        cursor = db.analytics_v2.find({"page_id": "p1", "id": {"$regex": "^e"}}, {"_id": 0, "id": 1}).skip(1)
+        chunks = []
+        while True:
+            chunk = await cursor.to_list(10)
+            if not chunk:
+                break
+            chunks.append([e["id"] for e in chunk])
+        assert [len(c) for c in chunks] == [10, 10, 4]
+        assert chunks[0][:2] == ["e3", "e5"] and chunks[-1][-1] == "e49"
+
+    asyncio.run(scenario())
+    # Only the first page may use OFFSET; later ones seek past the last rowid
+    selects = [sql for sql in statements if sql.startswith("SELECT rowid, doc")]
+    assert len(selects) == 4 and not any("OFFSET" in sql for sql in selects[1:])
+    assert all("rowid >" in sql for sql in selects[1:])
+    client.close()
+
+
+def test_sqlite_query_operators(tmp_path):
+    client = AsyncSQLiteClient(str(tmp_path / "db.sqlite3"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.analytics_v2.insert_many(
+            [{"id": f"e{i}", "page_id": "p1", "timestamp": f"2026-03-{i + 1:02d}T12:00:00+00:00",
+              "metadata": {"ref": "google" if i < 3 else None}} for i in range(10)]
+        )
+        window = {"page_id": "p1", "timestamp": {"$gte": "2026-03-03", "$lt": "2026-03-06"}}
+        assert [e["id"] for e in await db.analytics_v2.find(window).to_list(None)] == ["e2", "e3", "e4"]
+        assert await db.analytics_v2.count_documents({"timestamp": {"$regex": "^2026-03-1"}}) == 1
+        assert await db.analytics_v2.count_documents({"timestamp": {"$regex": "^2026-03-0[1-3]"}}) == 3
+        assert await db.analytics_v2.count_documents({"timestamp": {"$gt": 5}}) == 0
+        assert await db.analytics_v2.count_documents({"metadata.ref": "google"}) == 3
+        assert await db.analytics_v2.count_documents({"metadata.missing": {"$exists": False}}) == 10
+        assert await db.analytics_v2.count_documents({"$or": [{"id": "e0"}, {"id": "e9"}]}) == 2
+
+    asyncio.run(scenario())
+    client.close()
+
+
+def test_sqlite_upsert_and_inc(tmp_path):
+    client = AsyncSQLiteClient(str(tmp_path / "db.sqlite3"))
+    db = client["test_db"]
+
+    async def scenario():
+        update = {"$setOnInsert": {"page_id": "p1"}, "$inc": {"count": 1, "hours.10": 1}}
+        first = await db.analytics_rollups.update_one({"id": "r1"}, update, upsert=True)
+        assert first.upserted_id == "r1"
+        second = await db.analytics_rollups.update_one({"id": "r1"}, update, upsert=True)
+        assert (second.matched_count, second.upserted_id) == (1, None)
+        assert await db.analytics_rollups.find_one({"id": "r1"}, {"_id": 0}) == {
+            "id": "r1", "page_id": "p1", "count": 2, "hours": {"10": 2}}
+
+    asyncio.run(scenario())
+    client.close()
+
+
+def test_sqlite_drop_collection(tmp_path):
+    client = AsyncSQLiteClient(str(tmp_path / "db.sqlite3"))
+    db = client["test_db"]
+
+    async def scenario():
+        await db.analytics_v2_2026_01.insert_one({"id": "e1", "timestamp": "2026-01-01T00:00:00+00:00"})
+        await db.pages.insert_one({"id": "p1"})
+        assert sorted(await db.list_collection_names()) == ["analytics_v2_2026_01", "pages"]
+        await db.drop_collection("analytics_v2_2026_01")
+        assert await db.list_collection_names() == ["pages"]
+        assert await db.analytics_v2_2026_01.count_documents({}) == 0
+
+    asyncio.run(scenario())
+    client.close()
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { api, isAuthenticated } from '../utils/api';
+import { api, isAuthenticated, getAuthToken } from '../utils/api';
 import { toast } from 'sonner';
 import {
     BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, AreaChart, Area
@@ -21,6 +21,67 @@ const Analytics = () => {
         loadStats();
     }, [username]);
 
+    // Live counters: the server pushes coalesced deltas at most once a second
+    useEffect(() => {
+        if (!isAuthenticated()) return;
+        let ws = null;
+        let reconnectTimeout = null;
+        let closed = false;
+
+        const applyDelta = (delta) => {
+            setStats((prev) => {
+                if (!prev) return prev;
+                const totalViews = prev.total_views + delta.views;
+                const totalClicks = prev.total_clicks + delta.clicks;
+                const chartData = prev.chart_data.map((row, index) => (
+                    index === prev.chart_data.length - 1
+                        ? { ...row, views: row.views + delta.views, clicks: row.clicks + delta.clicks }
+                        : row
+                ));
+                const topLinks = prev.top_links.map((link) => (
+                    delta.targets[link.id] ? { ...link, clicks: link.clicks + delta.targets[link.id] } : link
+                ));
+                return {
+                    ...prev,
+                    total_views: totalViews,
+                    total_clicks: totalClicks,
+                    ctr: totalViews > 0 ? Math.round((totalClicks / totalViews) * 1000) / 10 : 0,
+                    chart_data: chartData,
+                    top_links: topLinks,
+                };
+            });
+        };
+
+        const connectWS = () => {
+            const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000';
+            const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+            ws = new WebSocket(`${wsProtocol}//${backendUrl.replace(/^https?:\/\//, '')}/ws/${username}`);
+
+            ws.onopen = () => {
+                ws.send(JSON.stringify({ type: 'subscribe_analytics', token: getAuthToken() }));
+            };
+            ws.onmessage = (event) => {
+                try {
+                    const msg = JSON.parse(event.data);
+                    if (msg.type === 'analytics_delta') applyDelta(msg.data);
+                } catch (e) {
+                    console.error('WS parsing error:', e);
+                }
+            };
+            ws.onclose = () => {
+                if (!closed) reconnectTimeout = setTimeout(connectWS, 3000);
+            };
+            ws.onerror = () => ws.close();
+        };
+
+        connectWS();
+        return () => {
+            closed = true;
+            clearTimeout(reconnectTimeout);
+            if (ws) ws.close();
+        };
+    }, [username]);
+
     const loadStats = async () => {
         try {
             const response = await api.getPageAnalytics(username);
@@ -143,6 +204,15 @@ const Analytics = () => {
                     </div>
                 </div>
 
+                {/* Traffic Sources */}
+                {stats.breakdowns && (
+                    <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+                        {BREAKDOWNS.map(({ key, title }) => (
+                            <BreakdownCard key={key} title={title} items={stats.breakdowns[key] || []} />
+                        ))}
+                    </div>
+                )}
+
                 {/* Top Links */}
                 <div className="card bg-card border border-border p-6 rounded-[24px]">
                     <h2 className="text-lg font-bold mb-6">Популярные ссылки</h2>
@@ -179,6 +249,41 @@ const Analytics = () => {
     );
 };
 
+const BREAKDOWNS = [
+    { key: 'referrer', title: 'Источники' },
+    { key: 'utm_source', title: 'UTM-метки' },
+    { key: 'device', title: 'Устройства' },
+    { key: 'country', title: 'Страны' },
+];
+
+const DEVICE_LABELS = { mobile: 'Телефон', tablet: 'Планшет', desktop: 'Компьютер', unknown: 'Неизвестно' };
+
+const BreakdownCard = ({ title, items }) => {
+    const total = items.reduce((sum, item) => sum + item.count, 0);
+    const label = (value) => DEVICE_LABELS[value] || (value === 'direct' ? 'Прямые заходы' : value === 'unknown' ? 'Неизвестно' : value);
+    return (
+        <div className="card bg-card border border-border p-6 rounded-[24px]">
+            <h2 className="text-lg font-bold mb-4">{title}</h2>
+            <div className="space-y-3">
+                {items.map((item) => (
+                    <div key={item.value} className="flex items-center justify-between gap-4">
+                        <span className="text-sm font-medium truncate">{label(item.value)}</span>
+                        <div className="flex items-center gap-3 shrink-0">
+                            <span className="text-sm font-bold">{item.count}</span>
+                            <div className="w-12 h-1 bg-foreground/10 rounded-full overflow-hidden">
+                                <div className="h-full bg-blue-500" style={{ width: `${(item.count / total) * 100}%` }} />
+                            </div>
+                        </div>
+                    </div>
+                ))}
+                {items.length === 0 && (
+                    <p className="text-center py-4 text-muted-foreground text-sm">Пока нет данных</p>
+                )}
+            </div>
+        </div>
+    );
+};
+
 const StatCard = ({ title, value, icon, description }) => (
     <div className="card bg-card border border-border p-6 rounded-[24px] group hover:border-border transition-all">
         <div className="flex items-center justify-between mb-4">
@@ -216,7 +216,9 @@ const PublicPage = () => {
         // Track View
         api.trackEvent({
           page_id: result.page.id,
-          event_type: 'view'
+          event_type: 'view',
+          // Traffic source: referring site and UTM tags of the landing URL
+          metadata: { referrer: document.referrer || null, query: window.location.search || null }
         }).catch(err => console.error('Tracking error:', err));
 
       } else {
@@ -63,6 +63,51 @@ const fetchWithRetry = async (url, options = {}, retries = 3) => {
   }
 };
 
+// Analytics events are buffered and posted to /analytics/batch: after a short
+// delay, once enough are pending, or via sendBeacon when the page is hidden.
+const ANALYTICS_FLUSH_DELAY = 2000;
+const ANALYTICS_MAX_BATCH = 20;
+let pendingAnalytics = [];
+let analyticsTimer = null;
+
+const flushAnalytics = (useBeacon = false) => {
+  if (analyticsTimer) {
+    clearTimeout(analyticsTimer);
+    analyticsTimer = null;
+  }
+  if (pendingAnalytics.length === 0) return;
+  const events = pendingAnalytics;
+  pendingAnalytics = [];
+  // text/plain keeps the beacon a "simple" CORS request
+  const body = JSON.stringify(events);
+  if (useBeacon && navigator.sendBeacon &&
+      navigator.sendBeacon(`${API_URL}/analytics/batch`, new Blob([body], { type: 'text/plain' }))) {
+    return;
+  }
+  fetchWithRetry(`${API_URL}/analytics/batch`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'text/plain' },
+    body,
+    keepalive: true,
+  }).catch(err => console.error('Tracking error:', err));
+};
+
+const queueAnalyticsEvent = (event) => {
+  pendingAnalytics.push(event);
+  if (pendingAnalytics.length >= ANALYTICS_MAX_BATCH) {
+    flushAnalytics();
+  } else if (!analyticsTimer) {
+    analyticsTimer = setTimeout(() => flushAnalytics(), ANALYTICS_FLUSH_DELAY);
+  }
+};
+
+if (typeof window !== 'undefined') {
+  window.addEventListener('pagehide', () => flushAnalytics(true));
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') flushAnalytics(true);
+  });
+}
+
 const fetchWithAuth = async (url, options = {}) => {
   const token = getAuthToken();
   const headers = {
@@ -141,16 +186,17 @@ export const api = {
     method: 'DELETE',
   }),
 
-  // Analytics
+  // Analytics: events are batched and sent together (see queueAnalyticsEvent)
   trackEvent: (data) => {
-    if (!data.username) return Promise.resolve({ ok: true }); // Prevent 422
-    return fetchWithRetry(`${API_URL}/analytics/track`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(data),
-    });
+    if (!data.page_id) return Promise.resolve({ ok: true }); // Prevent 422
+    queueAnalyticsEvent(data);
+    return Promise.resolve({ ok: true });
+  },
+  getPageAnalytics: (username, range = '7d') => {
+    const tz = Intl.DateTimeFormat().resolvedOptions().timeZone || 'UTC';
+    const params = new URLSearchParams({ range, tz });
+    return fetchWithAuth(`${API_URL}/pages/${username}/stats?${params}`);
   },
-  getPageAnalytics: (username) => fetchWithAuth(`${API_URL}/pages/${username}/stats`),
 
   // Pages
   getPages: () => fetchWithAuth(`${API_URL}/pages`),